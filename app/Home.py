@@ -1,9 +1,10 @@
-from dotenv import load_dotenv
 import streamlit as st
 
-load_dotenv()
+from warmup import show_warehouse_state
 
 st.set_page_config(page_title="Databricks Streamlit App", layout="wide")
+# Boot-time warm-up: the warehouse starts while the user reads the home page
+show_warehouse_state()
 
 "# Welcome to Databricks + Streamlit App!"
 
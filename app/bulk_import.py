@@ -0,0 +1,522 @@
+"""
+Bulk import for Edit Data: upload -> validate -> stage -> load.
+
+A CSV or Parquet file is read in Arrow batches of BULK_CHUNK_ROWS rows. Each
+batch is validated against the table's columns with vectorized casts and
+appended to a Parquet part file; a part is uploaded to the stage as soon as it
+holds BULK_PART_ROWS rows and then deleted locally, so memory holds one batch
+and local disk one part whatever the file size. The staged directory is then
+loaded with a single statement run as a save job (see save_jobs):
+
+- COPY INTO appends; files already loaded are skipped, so a retry is safe
+- MERGE on the primary key upserts: existing keys are updated, others inserted
+
+The stage is a directory in a Unity Catalog volume (BULK_STAGE_PATH=/Volumes/
+<catalog>/<schema>/<volume>/<dir>), or any local directory as a stand-in for
+local runs against bench/fake_warehouse.py. Staged files are removed once the
+load succeeds and kept for a resume when it fails.
+"""
+
+import csv
+import os
+import re
+import shutil
+import tempfile
+import uuid
+from typing import Any, BinaryIO, Callable, Dict, Iterator, List, Optional, Tuple
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from common import get_config
+from editing import _key_match, _sql_fqn, _sql_ident
+from save_jobs import SaveJob, get_save_jobs
+
+BULK_STAGE_PATH = os.getenv("BULK_STAGE_PATH")
+BULK_CHUNK_ROWS = int(os.getenv("BULK_CHUNK_ROWS", "100000"))
+BULK_PART_ROWS = int(os.getenv("BULK_PART_ROWS", "1000000"))
+# Validation stops collecting (and the import is refused) after this many errors
+BULK_MAX_ERRORS = int(os.getenv("BULK_MAX_ERRORS", "100"))
+
+FORMATS = ("csv", "parquet")
+
+_SIMPLE_TYPES = {
+    "tinyint": pa.int8(),
+    "byte": pa.int8(),
+    "smallint": pa.int16(),
+    "short": pa.int16(),
+    "int": pa.int32(),
+    "integer": pa.int32(),
+    "bigint": pa.int64(),
+    "long": pa.int64(),
+    "float": pa.float32(),
+    "real": pa.float32(),
+    "double": pa.float64(),
+    "boolean": pa.bool_(),
+    "string": pa.string(),
+    "date": pa.date32(),
+    "timestamp": pa.timestamp("us", tz="UTC"),
+    "timestamp_ntz": pa.timestamp("us"),
+    "binary": pa.binary(),
+}
+_DECIMAL = re.compile(r"^decimal\s*(?:\(\s*(\d+)\s*,\s*(\d+)\s*\))?$")
+_SIZED_STRING = re.compile(r"^(?:var)?char\s*\(\s*\d+\s*\)$")
+
+# What a string must look like to cast to each kind of type (RE2 syntax); used
+# to point at the offending rows once a cast has failed
+_PATTERNS = {
+    "int": r"^[+-]?\d+$",
+    "float": r"^[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?$|^(?i:nan|[+-]?inf(inity)?)$",
+    "decimal": r"^[+-]?(\d+\.?\d*|\.\d+)$",
+    "bool": r"^(?i:true|false|1|0)$",
+    "date": r"^\d{4}-\d{2}-\d{2}$",
+    "timestamp": r"^\d{4}-\d{2}-\d{2}([ T]\d{2}:\d{2}(:\d{2}(\.\d{1,9})?)?)?"
+    r"(Z|[+-]\d{2}(:?\d{2})?)?$",
+}
+
+
+class BulkImportError(ValueError):
+    pass
+
+
+def arrow_type(data_type: str) -> Optional[pa.DataType]:
+    """Arrow type for an information_schema data_type; None if not importable."""
+    name = data_type.strip().lower()
+    if name in _SIMPLE_TYPES:
+        return _SIMPLE_TYPES[name]
+    m = _DECIMAL.match(name)
+    if m:
+        precision, scale = (int(m.group(1)), int(m.group(2))) if m.group(1) else (10, 0)
+        return pa.decimal128(precision, scale)
+    if _SIZED_STRING.match(name):
+        return pa.string()
+    # ARRAY, MAP, STRUCT, VARIANT, INTERVAL, ...
+    return None
+
+
+def _kind(target: pa.DataType) -> Optional[str]:
+    if pa.types.is_integer(target):
+        return "int"
+    if pa.types.is_floating(target):
+        return "float"
+    if pa.types.is_decimal(target):
+        return "decimal"
+    if pa.types.is_boolean(target):
+        return "bool"
+    if pa.types.is_date(target):
+        return "date"
+    if pa.types.is_timestamp(target):
+        return "timestamp"
+    return None
+
+
+# ---------- Stage ----------
+class LocalStage:
+    """Local directory standing in for a volume (local runs, fake warehouse)."""
+
+    def __init__(self, root: str) -> None:
+        self.root = root
+
+    def new_dir(self) -> str:
+        path = os.path.join(self.root, uuid.uuid4().hex)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def put(self, local_path: str, directory: str, name: str) -> None:
+        shutil.move(local_path, os.path.join(directory, name))
+
+    def remove(self, directory: str) -> None:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+class VolumeStage:
+    """Directory in a Unity Catalog volume, written through the Files API."""
+
+    def __init__(self, root: str) -> None:
+        self.root = root.rstrip("/")
+
+    def _client(self) -> Any:
+        from databricks.sdk import WorkspaceClient
+
+        return WorkspaceClient(config=get_config())
+
+    def new_dir(self) -> str:
+        path = f"{self.root}/{uuid.uuid4().hex}"
+        self._client().files.create_directory(path)
+        return path
+
+    def put(self, local_path: str, directory: str, name: str) -> None:
+        # The SDK streams the file object; it is never read into memory whole
+        with open(local_path, "rb") as f:
+            self._client().files.upload(f"{directory}/{name}", f, overwrite=True)
+        os.remove(local_path)
+
+    def remove(self, directory: str) -> None:
+        client = self._client()
+        for entry in client.files.list_directory_contents(directory):
+            client.files.delete(entry.path)
+        client.files.delete_directory(directory)
+
+
+def get_stage() -> Optional[Any]:
+    """Stage configured by BULK_STAGE_PATH, or None when bulk import is off."""
+    if not BULK_STAGE_PATH:
+        return None
+    if BULK_STAGE_PATH.startswith("/Volumes/"):
+        return VolumeStage(BULK_STAGE_PATH)
+    return LocalStage(BULK_STAGE_PATH)
+
+
+# ---------- Reading ----------
+def _csv_batches(source: BinaryIO, chunk_rows: int) -> Iterator[pa.Table]:
+    import pyarrow.csv as pcsv
+
+    # Every column is read as text and cast during validation, so a value that
+    # does not fit is reported with its row instead of failing the reader
+    header = next(csv.reader([source.readline().decode("utf-8-sig")]), [])
+    source.seek(0)
+    reader = pcsv.open_csv(
+        source,
+        read_options=pcsv.ReadOptions(block_size=1 << 23),
+        convert_options=pcsv.ConvertOptions(
+            column_types={name: pa.string() for name in header},
+            strings_can_be_null=True,
+            quoted_strings_can_be_null=False,
+        ),
+    )
+    pending: List[pa.RecordBatch] = []
+    rows = 0
+    for batch in reader:
+        # Blocks are sized in bytes; re-cut them into chunk_rows tables
+        while batch.num_rows:
+            take = min(batch.num_rows, chunk_rows - rows)
+            pending.append(batch.slice(0, take))
+            rows += take
+            batch = batch.slice(take)
+            if rows >= chunk_rows:
+                yield pa.Table.from_batches(pending)
+                pending, rows = [], 0
+    if pending:
+        yield pa.Table.from_batches(pending)
+
+
+def _parquet_batches(source: BinaryIO, chunk_rows: int) -> Iterator[pa.Table]:
+    import pyarrow.parquet as pq
+
+    for batch in pq.ParquetFile(source).iter_batches(batch_size=chunk_rows):
+        yield pa.Table.from_batches([batch])
+
+
+def read_batches(
+    source: BinaryIO, fmt: str, chunk_rows: int = BULK_CHUNK_ROWS
+) -> Iterator[pa.Table]:
+    if fmt == "csv":
+        return _csv_batches(source, chunk_rows)
+    if fmt == "parquet":
+        return _parquet_batches(source, chunk_rows)
+    raise BulkImportError(f"Unsupported format: {fmt}")
+
+
+# ---------- Validation ----------
+class TableSchema:
+    """Target columns of a table, as Arrow types, from metadata columns()."""
+
+    def __init__(self, columns: pd.DataFrame) -> None:
+        self.names: List[str] = columns["column_name"].tolist()
+        self.types: Dict[str, Optional[pa.DataType]] = {
+            n: arrow_type(t) for n, t in zip(self.names, columns["data_type"])
+        }
+        nullable = columns.get("is_nullable", pd.Series(["YES"] * len(columns)))
+        self.nullable: Dict[str, bool] = {
+            n: str(v).upper() != "NO" for n, v in zip(self.names, nullable)
+        }
+        # Columns a staged file has: unsupported ones are left to their default
+        self.schema = pa.schema(
+            [(n, t) for n, t in self.types.items() if t is not None]
+        )
+
+    def match_columns(
+        self, source_names: List[str]
+    ) -> Tuple[Dict[str, str], List[str]]:
+        """(source name -> column name, errors) matching names case-insensitively."""
+        by_lower = {n.lower(): n for n in self.names}
+        mapping: Dict[str, str] = {}
+        errors = []
+        for name in source_names:
+            target = by_lower.get(name.strip().lower())
+            if target is None:
+                errors.append(f"Column '{name}' is not in the table")
+            else:
+                mapping[name] = target
+        present = set(mapping.values())
+        for name in self.names:
+            if name in present:
+                if self.types[name] is None:
+                    errors.append(f"Column '{name}' has a type bulk import can't load")
+            elif not self.nullable[name]:
+                errors.append(f"Column '{name}' is NOT NULL but missing from the file")
+        return mapping, errors
+
+
+def _cast(values: pa.Array, target: pa.DataType) -> pa.Array:
+    if pa.types.is_string(values.type) and _kind(target) is not None:
+        values = pc.utf8_trim_whitespace(values)
+        if pa.types.is_timestamp(target) and target.tz:
+            try:
+                return pc.cast(values, target)
+            except pa.ArrowInvalid:
+                # No offset in the text: read it as UTC
+                naive = pc.cast(values, pa.timestamp(target.unit))
+                return pc.assume_timezone(naive, target.tz)
+    return pc.cast(values, target)
+
+
+def _bad_rows(values: pa.Array, target: pa.DataType) -> Optional[pa.Array]:
+    """Boolean mask of values that can't become `target`, when it can be computed."""
+    kind = _kind(target)
+    if pa.types.is_string(values.type) and kind is not None:
+        trimmed = pc.utf8_trim_whitespace(values)
+        ok = pc.match_substring_regex(trimmed, _PATTERNS[kind])
+        return pc.fill_null(pc.invert(ok), False)
+    try:
+        # Lossy casts (overflow, truncation) do not survive a round trip
+        unsafe = pc.cast(values, target, safe=False)
+        back = pc.cast(unsafe, values.type, safe=False)
+        return pc.fill_null(pc.not_equal(back, values), False)
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+        return None
+
+
+def _error(
+    reason: str,
+    row: Optional[int] = None,
+    column: Optional[str] = None,
+    value: Any = None,
+) -> Dict[str, Any]:
+    return {"row": row, "column": column, "value": value, "reason": reason}
+
+
+def _row_errors(
+    column: str, values: pa.Array, mask: pa.Array, offset: int, reason: str, limit: int
+) -> List[Dict[str, Any]]:
+    rows = pc.indices_nonzero(mask).to_pylist()[:limit]
+    return [_error(reason, offset + i + 1, column, values[i].as_py()) for i in rows]
+
+
+def validate_batch(
+    batch: pa.Table,
+    target: TableSchema,
+    mapping: Dict[str, str],
+    offset: int = 0,
+    max_errors: int = BULK_MAX_ERRORS,
+) -> Tuple[Optional[pa.Table], List[Dict[str, Any]]]:
+    """
+    Conform one batch to the table: rename, cast and order columns and add the
+    missing (nullable) ones as nulls. Returns (table, []) or (None, errors);
+    `row` in errors is 1-based within the file.
+    """
+    errors: List[Dict[str, Any]] = []
+    arrays: Dict[str, pa.Array] = {}
+    for source_name, name in mapping.items():
+        values = batch.column(source_name).combine_chunks()
+        dtype = target.types[name]
+        if dtype is None:
+            continue
+        if not target.nullable[name] and values.null_count:
+            errors += _row_errors(
+                name,
+                values,
+                pc.is_null(values),
+                offset,
+                "NULL in a NOT NULL column",
+                max_errors - len(errors),
+            )
+            continue
+        try:
+            arrays[name] = values if values.type == dtype else _cast(values, dtype)
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError) as e:
+            mask = _bad_rows(values, dtype)
+            found = []
+            if mask is not None and pc.any(mask).as_py():
+                found = _row_errors(
+                    name,
+                    values,
+                    mask,
+                    offset,
+                    f"not a valid {dtype}",
+                    max_errors - len(errors),
+                )
+            # Otherwise point at the column with Arrow's message
+            errors += found or [_error(str(e), column=name)]
+        if len(errors) >= max_errors:
+            break
+    if errors:
+        return None, errors
+    columns = [
+        arrays.get(f.name, pa.nulls(batch.num_rows, f.type)) for f in target.schema
+    ]
+    return pa.Table.from_arrays(columns, schema=target.schema), []
+
+
+# ---------- Staging ----------
+class StagedImport:
+    """Outcome of validating and staging one file."""
+
+    def __init__(self, directory: Optional[str]) -> None:
+        self.directory = directory
+        self.columns: List[str] = []
+        self.files: List[str] = []
+        self.rows = 0
+        self.errors: List[Dict[str, Any]] = []
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors and self.directory is not None
+
+
+def stage_file(
+    source: BinaryIO,
+    fmt: str,
+    columns: pd.DataFrame,
+    stage: Any,
+    chunk_rows: int = BULK_CHUNK_ROWS,
+    part_rows: int = BULK_PART_ROWS,
+    on_progress: Optional[Callable[[int, int], Any]] = None,
+) -> StagedImport:
+    """
+    Validate `source` batch by batch and stage it as Parquet parts. The whole
+    file is validated (up to BULK_MAX_ERRORS errors) before anything is loaded;
+    on errors the staged parts are removed and StagedImport.errors is set.
+    on_progress(rows, bytes_read) is called after every batch.
+    """
+    import pyarrow.parquet as pq
+
+    target = TableSchema(columns)
+    staged = StagedImport(None)
+    staged.columns = target.schema.names
+    batches = read_batches(source, fmt, chunk_rows)
+    first = next(batches, None)
+    if first is None:
+        staged.errors.append(_error("The file is empty"))
+        return staged
+    mapping, column_errors = target.match_columns(first.column_names)
+    if column_errors:
+        staged.errors = [_error(e) for e in column_errors]
+        return staged
+
+    staged.directory = stage.new_dir()
+    local_dir = tempfile.mkdtemp(prefix="bulk-import-")
+    writer = None
+    part_path = ""
+    part_rows_written = 0
+
+    def flush() -> None:
+        nonlocal writer, part_rows_written
+        if writer is None:
+            return
+        writer.close()
+        writer = None
+        name = f"part-{len(staged.files):05d}.parquet"
+        stage.put(part_path, staged.directory, name)
+        staged.files.append(name)
+        part_rows_written = 0
+
+    try:
+        for batch in _chain(first, batches):
+            table, errors = validate_batch(
+                batch,
+                target,
+                mapping,
+                staged.rows,
+                BULK_MAX_ERRORS - len(staged.errors),
+            )
+            staged.errors += errors
+            if not staged.errors:
+                if writer is None:
+                    part_path = os.path.join(local_dir, f"{len(staged.files)}.parquet")
+                    writer = pq.ParquetWriter(part_path, target.schema)
+                writer.write_table(table)
+                part_rows_written += table.num_rows
+                if part_rows_written >= part_rows:
+                    flush()
+            staged.rows += batch.num_rows
+            if on_progress is not None:
+                on_progress(staged.rows, source.tell())
+            if len(staged.errors) >= BULK_MAX_ERRORS:
+                break
+        if not staged.rows:
+            staged.errors.append(_error("The file has no rows"))
+        if not staged.errors:
+            flush()
+    finally:
+        if writer is not None:
+            writer.close()
+        shutil.rmtree(local_dir, ignore_errors=True)
+        if staged.errors and staged.directory is not None:
+            stage.remove(staged.directory)
+            staged.directory = None
+    return staged
+
+
+def _chain(first: pa.Table, rest: Iterator[pa.Table]) -> Iterator[pa.Table]:
+    yield first
+    yield from rest
+
+
+# ---------- Loading ----------
+def load_statement(
+    fqn: str, columns: List[str], directory: str, key_cols: Optional[List[str]] = None
+) -> Tuple[str, str]:
+    """(kind, statement) loading a staged directory: COPY INTO, or MERGE on key_cols."""
+    if "'" in directory or "\\" in directory:
+        raise BulkImportError(f"Unsupported characters in stage path: {directory}")
+    if not key_cols:
+        return (
+            "copy",
+            f"COPY INTO {fqn} FROM '{directory}' FILEFORMAT = PARQUET "
+            "COPY_OPTIONS ('mergeSchema' = 'false')",
+        )
+    cols_sql = ", ".join(_sql_ident(c) for c in columns)
+    values_sql = ", ".join(f"s.{_sql_ident(c)}" for c in columns)
+    set_sql = ", ".join(
+        f"t.{_sql_ident(c)} = s.{_sql_ident(c)}" for c in columns if c not in key_cols
+    )
+    # Columns are listed: read_files adds a _rescued_data column to the source
+    statement = (
+        f"MERGE INTO {fqn} t USING (SELECT {cols_sql} FROM read_files('{directory}', "
+        f"format => 'parquet')) s ON {_key_match(key_cols)} "
+    )
+    if set_sql:
+        statement += f"WHEN MATCHED THEN UPDATE SET {set_sql} "
+    statement += f"WHEN NOT MATCHED THEN INSERT ({cols_sql}) VALUES ({values_sql})"
+    return "merge", statement
+
+
+def submit_import(
+    staged: StagedImport,
+    catalog: str,
+    schema: str,
+    table: str,
+    key_cols: Optional[List[str]] = None,
+) -> SaveJob:
+    """Queue the load of a staged import; the job removes the stage when done."""
+    if not staged.ok:
+        raise BulkImportError("Nothing staged to load")
+    fqn = _sql_fqn(catalog, schema, table)
+    kind, statement = load_statement(fqn, staged.columns, staged.directory, key_cols)
+    job = SaveJob.from_statements(
+        catalog,
+        schema,
+        table,
+        [(kind, statement, {}, staged.rows)],
+        retry_safe=True,
+        staged_dir=staged.directory,
+    )
+    return get_save_jobs().submit(job)
+
+
+def remove_staged(directory: str) -> None:
+    stage = get_stage()
+    if stage is not None:
+        stage.remove(directory)
@@ -1,13 +1,106 @@
+import hashlib
+import importlib
+import json
 import os
-from databricks import sql
-from databricks.sdk.core import Config
+import re
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor
+from concurrent.futures import wait as wait_futures
+from concurrent.futures import TimeoutError as FutureTimeout
+from contextlib import contextmanager
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Deque,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
 from dotenv import load_dotenv
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from result_cache import (
+    DiskResultCache,
+    ResultCache,
+    cache_key,
+    is_read_query,
+    normalize_sql,
+    referenced_tables,
+)
 
+if TYPE_CHECKING:
+    from databricks.sdk.core import Config
+
+# Imported once per process; pages re-run on every interaction but this module does not
 load_dotenv()
 
+# Copy-on-write lets derived frames (set_index, column selections, the editor's
+# original snapshot) share buffers until written to. It is the only mode from
+# pandas 3; on pandas 2 (the locked version) it is switched on here for the
+# whole process, deliberately: pandas options are process-global, so wrapping
+# the conversion and editing paths in pd.option_context would flip the mode
+# under every other session's script thread while one runs. The app does not
+# rely on chained assignment, the one behavior copy-on-write changes.
+# PANDAS_COPY_ON_WRITE=0 keeps pandas 2's default.
+if int(pd.__version__.split(".")[0]) < 3 and os.getenv("PANDAS_COPY_ON_WRITE") != "0":
+    pd.set_option("mode.copy_on_write", True)
+
 REQUIRED_ENV = ["DATABRICKS_WAREHOUSE_ID"]
 
+# Pool tuning; override through the environment to size the pool per deployment.
+POOL_MAX_SIZE = int(os.getenv("SQL_POOL_MAX_SIZE", "8"))
+POOL_ACQUIRE_TIMEOUT = float(os.getenv("SQL_POOL_ACQUIRE_TIMEOUT", "30"))
+POOL_IDLE_TIMEOUT = float(os.getenv("SQL_POOL_IDLE_TIMEOUT", "300"))
+POOL_MAX_LIFETIME = float(os.getenv("SQL_POOL_MAX_LIFETIME", "3600"))
+POOL_PING_AFTER = float(os.getenv("SQL_POOL_PING_AFTER", "60"))
+CREDENTIALS_TTL = float(os.getenv("DATABRICKS_CREDENTIALS_TTL", "1800"))
+
+# Defaults for streamed results (SQL Query page)
+STREAM_BATCH_ROWS = int(os.getenv("SQL_STREAM_BATCH_ROWS", "10000"))
+STREAM_MAX_ROWS = int(os.getenv("SQL_STREAM_MAX_ROWS", "200000"))
+STREAM_MAX_BYTES = int(os.getenv("SQL_STREAM_MAX_BYTES", str(256 * 1024 * 1024)))
+
+# String columns with at most this share of distinct values become categoricals
+# when run_sql(..., categorize=True)
+CATEGORY_MAX_RATIO = float(os.getenv("SQL_CATEGORY_MAX_RATIO", "0.5"))
+
+# Query instrumentation: ring buffer size and optional JSONL file every event is appended to
+QUERY_LOG_SIZE = int(os.getenv("SQL_QUERY_LOG_SIZE", "5000"))
+QUERY_LOG_PATH = os.getenv("SQL_QUERY_LOG_PATH")
+
+# Worker threads for concurrently submitted queries (submit / QueryGroup)
+EXECUTOR_WORKERS = int(os.getenv("SQL_EXECUTOR_WORKERS", str(POOL_MAX_SIZE)))
+
+# Scheduler: statements running at once on the warehouse, in total and per user;
+# how long one may wait for a slot; how long a disconnected session keeps its
+# queued and running statements before they are cancelled
+SQL_MAX_CONCURRENT = int(os.getenv("SQL_MAX_CONCURRENT", str(POOL_MAX_SIZE)))
+SQL_MAX_PER_USER = int(os.getenv("SQL_MAX_PER_USER", "4"))
+SQL_QUEUE_TIMEOUT = float(os.getenv("SQL_QUEUE_TIMEOUT", "300"))
+SQL_SESSION_GRACE = float(os.getenv("SQL_SESSION_GRACE", "10"))
+# Queue classes, served in this order
+PRIORITIES = ("interactive", "default", "adhoc", "background")
+
+# "disk" keeps results passed to run_sql(..., ttl=...) in a local Arrow cache; "off" disables it
+RESULT_CACHE = os.getenv("SQL_RESULT_CACHE", "disk")
+
+# Module providing the databricks.sql connect() API. Benchmarks point this at
+# bench/fake_warehouse.py to run the app against a local stand-in.
+SQL_CONNECTOR = os.getenv("SQL_CONNECTOR", "databricks.sql")
+
+# Named query parameters (`:name` markers -> value)
+Params = Optional[Dict[str, Any]]
+
 
 def _assert_env() -> None:
     for v in REQUIRED_ENV:
@@ -15,14 +108,1306 @@ def _assert_env() -> None:
             raise RuntimeError(f"{v} must be set")
 
 
-def run_sql(query: str) -> pd.DataFrame:
+# ---------- Credentials ----------
+# The SDK and the SQL connector are imported on first use: together they account
+# for most of this module's import time, and pages that never reach the warehouse
+# (or only hit the result cache) do not need them.
+_config_lock = threading.Lock()
+_config: Optional["Config"] = None
+_config_created_at = 0.0
+
+
+def get_config(force_refresh: bool = False) -> "Config":
+    """Return a process-wide SDK Config, rebuilt once it is older than CREDENTIALS_TTL."""
+    global _config, _config_created_at
+    with _config_lock:
+        expired = time.monotonic() - _config_created_at > CREDENTIALS_TTL
+        if _config is None or expired or force_refresh:
+            from databricks.sdk.core import Config
+
+            _config = Config()
+            _config_created_at = time.monotonic()
+        return _config
+
+
+def _credentials_provider():
+    # The connector calls the returned header factory on every request. It
+    # resolves the current Config each time, so pooled connections pick up both
+    # the SDK's token refreshes and a Config rebuilt after CREDENTIALS_TTL.
+    return lambda: get_config().authenticate()
+
+
+def _connect() -> Any:
+    if SQL_CONNECTOR != "databricks.sql":
+        return importlib.import_module(SQL_CONNECTOR).connect()
+    from databricks import sql
+
     _assert_env()
-    cfg = Config()
-    with sql.connect(
+    cfg = get_config()
+    return sql.connect(
         server_hostname=cfg.host,
         http_path=f"/sql/1.0/warehouses/{os.getenv('DATABRICKS_WAREHOUSE_ID')}",
-        credentials_provider=lambda: cfg.authenticate,
-    ) as connection:
-        with connection.cursor() as cursor:
-            cursor.execute(query)
-            return cursor.fetchall_arrow().to_pandas()
+        credentials_provider=_credentials_provider,
+    )
+
+
+# ---------- Connection pool ----------
+class PoolTimeout(RuntimeError):
+    pass
+
+
+# DB-API classes for a broken session or transport (RequestError and the
+# connector's other network errors derive from OperationalError). Matched by
+# name so the connector does not have to be imported to classify an error.
+_CONNECTION_ERRORS = {"OperationalError", "InterfaceError"}
+
+
+def is_connection_error(error: BaseException) -> bool:
+    """
+    True if error means the connection itself is unusable. Statement errors
+    (ServerOperationError, other DatabaseErrors), cancellations and Streamlit's
+    rerun/stop leave it open, so it is worth keeping.
+    """
+    if isinstance(error, ConnectionError):
+        return True
+    return any(cls.__name__ in _CONNECTION_ERRORS for cls in type(error).__mro__)
+
+
+class ConnectionPool:
+    """
+    Bounded, thread-safe pool of warehouse connections.
+
+    Streamlit runs every session's script in its own thread, so a connection is
+    handed to exactly one caller at a time and returned when the caller is done.
+    Connections that failed at the connection level while checked out (see
+    is_connection_error) are discarded instead of reused; SQL errors and
+    cancellations leave the connection usable and return it to the pool.
+    """
+
+    def __init__(
+        self,
+        connect: Callable[[], Any],
+        max_size: int = POOL_MAX_SIZE,
+        acquire_timeout: float = POOL_ACQUIRE_TIMEOUT,
+        idle_timeout: float = POOL_IDLE_TIMEOUT,
+        max_lifetime: float = POOL_MAX_LIFETIME,
+        ping_after: float = POOL_PING_AFTER,
+    ) -> None:
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1")
+        self._connect = connect
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout
+        self.idle_timeout = idle_timeout
+        self.max_lifetime = max_lifetime
+        self.ping_after = ping_after
+        self._cond = threading.Condition()
+        # (connection, created_at, last_used_at); most recently used on the right
+        self._idle: Deque[Tuple[Any, float, float]] = deque()
+        self._created: Dict[int, float] = {}
+        self._in_use = 0
+        self._stats = {
+            "opened": 0,
+            "closed": 0,
+            "acquired": 0,
+            "reused": 0,
+            "waits": 0,
+            "timeouts": 0,
+            "evicted_idle": 0,
+            "evicted_lifetime": 0,
+            "failed_health_checks": 0,
+            "discarded_on_error": 0,
+        }
+
+    # -- internals --
+    def _size(self) -> int:
+        return len(self._idle) + self._in_use
+
+    def _close(self, conn: Any) -> None:
+        self._created.pop(id(conn), None)
+        self._stats["closed"] += 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _evict_expired(self, now: float) -> None:
+        keep: Deque[Tuple[Any, float, float]] = deque()
+        for conn, created_at, last_used in self._idle:
+            if now - created_at > self.max_lifetime:
+                self._stats["evicted_lifetime"] += 1
+                self._close(conn)
+            elif now - last_used > self.idle_timeout:
+                self._stats["evicted_idle"] += 1
+                self._close(conn)
+            else:
+                keep.append((conn, created_at, last_used))
+        self._idle = keep
+
+    def _healthy(self, conn: Any, last_used: float, now: float) -> bool:
+        if not getattr(conn, "open", True):
+            return False
+        if now - last_used < self.ping_after:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("select 1")
+                cursor.fetchall()
+            return True
+        except Exception:
+            return False
+
+    def _take_idle(self) -> Optional[Any]:
+        # Called with the lock held; health checks run outside of it.
+        while self._idle:
+            conn, created_at, last_used = self._idle.pop()
+            self._in_use += 1
+            self._cond.release()
+            try:
+                ok = self._healthy(conn, last_used, time.monotonic())
+            finally:
+                self._cond.acquire()
+            if ok:
+                self._stats["reused"] += 1
+                return conn
+            self._in_use -= 1
+            self._stats["failed_health_checks"] += 1
+            self._close(conn)
+        return None
+
+    # -- public API --
+    def acquire(self) -> Any:
+        deadline = time.monotonic() + self.acquire_timeout
+        with self._cond:
+            while True:
+                self._evict_expired(time.monotonic())
+                conn = self._take_idle()
+                if conn is not None:
+                    self._stats["acquired"] += 1
+                    return conn
+                if self._size() < self.max_size:
+                    self._in_use += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats["timeouts"] += 1
+                    raise PoolTimeout(
+                        f"No warehouse connection available within {self.acquire_timeout:.0f}s "
+                        f"(pool size {self.max_size})"
+                    )
+                self._stats["waits"] += 1
+                self._cond.wait(remaining)
+        try:
+            conn = self._connect()
+        except Exception:
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._created[id(conn)] = time.monotonic()
+            self._stats["opened"] += 1
+            self._stats["acquired"] += 1
+        return conn
+
+    def release(self, conn: Any, discard: bool = False) -> None:
+        with self._cond:
+            self._in_use -= 1
+            created_at = self._created.get(id(conn), time.monotonic())
+            now = time.monotonic()
+            if discard or now - created_at > self.max_lifetime:
+                if discard:
+                    self._stats["discarded_on_error"] += 1
+                self._close(conn)
+            else:
+                self._idle.append((conn, created_at, now))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self) -> Iterator[Any]:
+        conn = self.acquire()
+        try:
+            yield conn
+        except BaseException as e:
+            self.release(conn, discard=is_connection_error(e))
+            raise
+        else:
+            self.release(conn)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "max_size": self.max_size,
+                "size": self._size(),
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                **self._stats,
+            }
+
+    def close(self) -> None:
+        with self._cond:
+            while self._idle:
+                conn, _, _ = self._idle.popleft()
+                self._close(conn)
+
+
+_pool_lock = threading.Lock()
+_pool: Optional[ConnectionPool] = None
+
+
+def get_pool() -> ConnectionPool:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool(_connect)
+        return _pool
+
+
+def pool_stats() -> Dict[str, Any]:
+    return get_pool().stats()
+
+
+# ---------- Instrumentation ----------
+_tls = threading.local()
+_events_lock = threading.Lock()
+_events: Deque[Dict[str, Any]] = deque(maxlen=QUERY_LOG_SIZE)
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?(?:[eE][+-]?\d+)?\b")
+_LITERAL_LISTS = re.compile(r"\?(?:\s*,\s*\?)+")
+_VALUES_ROWS = re.compile(r"\(\?\)(?:\s*,\s*\(\?\))+")
+
+
+def sql_fingerprint(query: str) -> Tuple[str, str]:
+    """Return (id, text) for a query with literals replaced, so runs group together."""
+    text = _LITERALS.sub("?", normalize_sql(query))
+    text = _VALUES_ROWS.sub("(?)", _LITERAL_LISTS.sub("?", text))
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:12], text
+
+
+def _streamlit_session() -> Tuple[Optional[str], Optional[str]]:
+    """(session id, user) of the Streamlit script running on this thread, if any."""
+    if "streamlit" not in sys.modules:
+        return None, None
+    try:
+        import streamlit as st
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+        ctx = get_script_run_ctx(suppress_warning=True)
+        if ctx is None:
+            return None, None
+        # Databricks Apps forward the signed-in user; otherwise each session
+        # counts as its own user
+        headers = st.context.headers
+        user = headers.get("X-Forwarded-Email") or headers.get("X-Forwarded-User")
+        return ctx.session_id, user or ctx.session_id
+    except Exception:
+        return None, None
+
+
+def set_page(name: str, priority: str = "default") -> None:
+    """
+    Tag queries issued from the current script thread with a page name, the
+    Streamlit session and user, and the queue class they wait in (PRIORITIES).
+    """
+    if priority not in PRIORITIES:
+        raise ValueError(f"Unknown priority: {priority}")
+    _tls.page = name
+    _tls.priority = priority
+    _tls.session, _tls.user = _streamlit_session()
+
+
+def current_page() -> Optional[str]:
+    return getattr(_tls, "page", None)
+
+
+@contextmanager
+def query_priority(priority: str) -> Iterator[None]:
+    """Queue statements run inside the block in another class (see PRIORITIES)."""
+    if priority not in PRIORITIES:
+        raise ValueError(f"Unknown priority: {priority}")
+    previous = getattr(_tls, "priority", None)
+    _tls.priority = priority
+    try:
+        yield
+    finally:
+        _tls.priority = previous
+
+
+QueueListener = Callable[[Optional[Dict[str, Any]]], None]
+
+
+def set_queue_listener(listener: Optional[QueueListener]) -> None:
+    """
+    Called on this thread with the session's queue status (see
+    QueryScheduler.session_status) while its statements wait for a slot, and
+    with None once they are admitted. Pages use it to show the queue position.
+    """
+    _tls.queue_listener = listener
+
+
+def _record(event: Dict[str, Any]) -> None:
+    with _events_lock:
+        _events.append(event)
+        if QUERY_LOG_PATH:
+            try:
+                with open(QUERY_LOG_PATH, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(event, default=str) + "\n")
+            except OSError:
+                pass
+
+
+def query_events() -> List[Dict[str, Any]]:
+    with _events_lock:
+        return list(_events)
+
+
+def clear_query_events() -> None:
+    with _events_lock:
+        _events.clear()
+
+
+def export_query_events(path: str) -> int:
+    events = query_events()
+    with open(path, "w", encoding="utf-8") as f:
+        for event in events:
+            f.write(json.dumps(event, default=str) + "\n")
+    return len(events)
+
+
+@contextmanager
+def _instrumented(query: str, kind: str = "run_sql") -> Iterator[Dict[str, Any]]:
+    """Collect one structured event for a query; callers fill phases/rows/bytes."""
+    fingerprint, text = sql_fingerprint(query)
+    event: Dict[str, Any] = {
+        "ts": time.time(),
+        "kind": kind,
+        "fingerprint": fingerprint,
+        "sql": text[:500],
+        "page": current_page(),
+        "phases": {},
+        "rows": None,
+        "bytes": None,
+        "cache": None,
+        "shared": False,
+        "error": None,
+    }
+    started = time.perf_counter()
+    try:
+        yield event
+    except BaseException as e:
+        event["error"] = f"{type(e).__name__}: {e}"[:500]
+        raise
+    finally:
+        event["total_ms"] = (time.perf_counter() - started) * 1000
+        _record(event)
+
+
+@contextmanager
+def _phase(event: Optional[Dict[str, Any]], name: str) -> Iterator[None]:
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if event is not None:
+            ms = (time.perf_counter() - started) * 1000
+            event["phases"][name] = event["phases"].get(name, 0.0) + ms
+
+
+# ---------- Result cache ----------
+_result_cache_lock = threading.Lock()
+_result_cache: Optional[ResultCache] = None
+
+
+def get_result_cache() -> ResultCache:
+    global _result_cache
+    with _result_cache_lock:
+        if _result_cache is None:
+            _result_cache = (
+                DiskResultCache() if RESULT_CACHE == "disk" else ResultCache()
+            )
+        return _result_cache
+
+
+def set_result_cache(cache: ResultCache) -> None:
+    global _result_cache
+    with _result_cache_lock:
+        _result_cache = cache
+
+
+def result_cache_stats() -> Dict[str, Any]:
+    return get_result_cache().stats()
+
+
+def invalidate_table(catalog: str, schema: str, table: str) -> int:
+    """Drop cached results of every query that references the given table."""
+    return get_result_cache().invalidate_table(f"{catalog}.{schema}.{table}")
+
+
+@contextmanager
+def _connection(event: Optional[Dict[str, Any]] = None) -> Iterator[Any]:
+    """
+    Scheduler slot and pooled connection, with the waits for them recorded as
+    the 'queue' and 'connect' phases.
+    """
+    scheduler = get_scheduler()
+    with _phase(event, "queue"):
+        ticket = scheduler.acquire(
+            getattr(_tls, "user", None) or "(app)",
+            getattr(_tls, "session", None),
+            getattr(_tls, "priority", None) or "default",
+            getattr(_tls, "queue_listener", None),
+        )
+    previous = getattr(_tls, "ticket", None)
+    _tls.ticket = ticket
+    pool = get_pool()
+    try:
+        with _phase(event, "connect"):
+            connection = pool.acquire()
+        try:
+            yield connection
+        except BaseException as e:
+            pool.release(connection, discard=is_connection_error(e))
+            raise
+        else:
+            pool.release(connection)
+    finally:
+        _tls.ticket = previous
+        scheduler.release(ticket)
+
+
+def _execute(cursor: Any, query: str, parameters: Params = None) -> None:
+    # Named parameters (:name markers) are bound by the warehouse, not formatted in
+    if parameters:
+        cursor.execute(query, parameters=parameters)
+    else:
+        cursor.execute(query)
+
+
+def _fetch_arrow(
+    query: str, event: Optional[Dict[str, Any]] = None, parameters: Params = None
+) -> pa.Table:
+    with _connection(event) as connection:
+        with connection.cursor() as cursor, _tracked(cursor):
+            with _phase(event, "execute"):
+                _execute(cursor, query, parameters)
+            with _phase(event, "fetch"):
+                return cursor.fetchall_arrow()
+
+
+# ---------- Single flight ----------
+class _Flight:
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.followers = 0
+
+
+_flights_lock = threading.Lock()
+_flights: Dict[str, _Flight] = {}
+_flight_stats = {"leaders": 0, "followers": 0}
+
+
+def _single_flight(key: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+    """
+    Run fn once per key at a time; concurrent callers with the same key wait for
+    the leader and get its result (or its exception). Returns (result, shared).
+
+    A leader that was cancelled (its session went away, or its handle was
+    cancelled) fails only its own caller: waiting followers start over, and
+    one of them runs fn as the next leader.
+    """
+    while True:
+        with _flights_lock:
+            flight = _flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = _flights[key] = _Flight()
+                _flight_stats["leaders"] += 1
+            else:
+                flight.followers += 1
+                _flight_stats["followers"] += 1
+        if leader:
+            break
+        flight.done.wait()
+        if isinstance(flight.error, QueryCancelled):
+            continue
+        if flight.error is not None:
+            raise flight.error
+        return flight.result, True
+    try:
+        result = fn()
+    except BaseException as e:
+        flight.error = e
+        with _flights_lock:
+            _flights.pop(key, None)
+        flight.done.set()
+        raise
+    # Followers join under the lock while the key is present, so once it is
+    # gone `followers` is final; reading it earlier could miss a late joiner
+    # that then holds the table the leader converts with self_destruct
+    with _flights_lock:
+        _flights.pop(key, None)
+        shared = flight.followers > 0
+    flight.result = result
+    flight.done.set()
+    return result, shared
+
+
+def single_flight_stats() -> Dict[str, Any]:
+    with _flights_lock:
+        return {"in_flight": len(_flights), **_flight_stats}
+
+
+def _fetch_and_store(
+    query: str,
+    key: str,
+    ttl: Optional[float],
+    event: Optional[Dict[str, Any]],
+    parameters: Params = None,
+) -> pa.Table:
+    table = _fetch_arrow(query, event, parameters)
+    if ttl:
+        with _phase(event, "cache"):
+            get_result_cache().put(key, table, ttl, referenced_tables(query))
+    return table
+
+
+def _revalidate(query: str, key: str, ttl: float, parameters: Params = None) -> None:
+    """Refresh a stale cache entry in the background, once per key."""
+    with _flights_lock:
+        if key in _flights:
+            return
+
+    def _refresh() -> None:
+        with (
+            _instrumented(query, kind="revalidate") as event,
+            query_priority("background"),
+        ):
+            table, _ = _single_flight(
+                key, lambda: _fetch_and_store(query, key, ttl, event, parameters)
+            )
+            event["rows"] = table.num_rows
+            event["bytes"] = table.nbytes
+
+    get_executor().submit(_refresh)
+
+
+def _run_arrow(
+    query: str,
+    ttl: Optional[float],
+    event: Dict[str, Any],
+    stale_ttl: Optional[float] = None,
+    parameters: Params = None,
+) -> Tuple[pa.Table, bool]:
+    """Return (table, shared); shared tables may be handed to other callers too."""
+    if not is_read_query(query):
+        table = _fetch_arrow(query, event, parameters)
+        shared = False
+    else:
+        warehouse_id = os.getenv("DATABRICKS_WAREHOUSE_ID", "")
+        key = cache_key(query, warehouse_id, parameters)
+        table = None
+        if ttl:
+            with _phase(event, "cache"):
+                table, stale = get_result_cache().lookup(key, stale_ttl or 0.0)
+            if table is not None:
+                event["cache"] = "stale" if stale else "hit"
+                if stale:
+                    _revalidate(query, key, ttl, parameters)
+            else:
+                event["cache"] = "miss"
+        if table is not None:
+            shared = False
+        else:
+            with _phase(event, "single_flight"):
+                table, shared = _single_flight(
+                    key, lambda: _fetch_and_store(query, key, ttl, event, parameters)
+                )
+            event["shared"] = shared
+    event["rows"] = table.num_rows
+    event["bytes"] = table.nbytes
+    return table, shared
+
+
+def run_sql_arrow(
+    query: str,
+    ttl: Optional[float] = None,
+    stale_ttl: Optional[float] = None,
+    parameters: Params = None,
+) -> pa.Table:
+    """
+    Like run_sql, but return the Arrow table without converting it. The table may
+    be shared with concurrent callers, so convert it with self_destruct=False.
+    """
+    with _instrumented(query) as event:
+        return _run_arrow(query, ttl, event, stale_ttl, parameters)[0]
+
+
+def arrow_to_pandas(
+    table: pa.Table,
+    arrow_dtypes: bool = False,
+    categorize: bool = False,
+    self_destruct: bool = True,
+) -> pd.DataFrame:
+    """
+    Convert with as few copies as possible.
+
+    With self_destruct, Arrow buffers are released column by column while
+    converting, so the table must not be used afterwards; pass False for tables
+    other callers still hold (single-flight results). arrow_dtypes keeps
+    columns Arrow-backed (pd.ArrowDtype) instead of NumPy/object; categorize
+    dictionary-encodes low-cardinality string columns first.
+    """
+    if categorize and table.num_rows:
+        max_distinct = CATEGORY_MAX_RATIO * table.num_rows
+        for i, field in enumerate(table.schema):
+            if not (
+                pa.types.is_string(field.type) or pa.types.is_large_string(field.type)
+            ):
+                continue
+            column = table.column(i)
+            if pc.count_distinct(column).as_py() <= max_distinct:
+                table = table.set_column(i, field.name, pc.dictionary_encode(column))
+    return table.to_pandas(
+        types_mapper=pd.ArrowDtype if arrow_dtypes else None,
+        self_destruct=self_destruct,
+        split_blocks=True,
+    )
+
+
+def run_sql(
+    query: str,
+    ttl: Optional[float] = None,
+    arrow_dtypes: bool = False,
+    categorize: bool = False,
+    stale_ttl: Optional[float] = None,
+    parameters: Params = None,
+) -> pd.DataFrame:
+    """
+    Run a query and return the result as a DataFrame.
+
+    parameters binds named markers in the query (`where id = :id`), so the
+    statement text stays fixed across values and nothing is quoted in Python.
+
+    Concurrent identical read queries share one execution (single flight).
+    With a ttl (seconds), read-only results are served from and stored in the
+    shared result cache, keyed by normalized SQL text, parameters and warehouse
+    id; with a
+    stale_ttl, results up to that many seconds past expiry are returned at once
+    while a background refresh runs. See arrow_to_pandas for arrow_dtypes and
+    categorize. Every call is recorded as a query event (see query_events).
+    """
+    with _instrumented(query) as event:
+        table, shared = _run_arrow(query, ttl, event, stale_ttl, parameters)
+        with _phase(event, "to_pandas"):
+            return arrow_to_pandas(table, arrow_dtypes, categorize, not shared)
+
+
+def run_sql_many(query: str, seq_of_parameters: Sequence[Dict[str, Any]]) -> None:
+    """
+    Run one statement template once per parameter set on a single connection
+    and cursor (DB-API executemany). Prefer one multi-row statement for large
+    writes; the connector still sends one request per parameter set.
+    """
+    with _instrumented(query, kind="executemany") as event:
+        with _connection(event) as connection:
+            with connection.cursor() as cursor, _tracked(cursor):
+                with _phase(event, "execute"):
+                    cursor.executemany(query, list(seq_of_parameters))
+        event["rows"] = len(seq_of_parameters)
+
+
+class ArrowStream:
+    """
+    Iterate over a query result as Arrow tables fetched with fetchmany_arrow.
+
+    Fetching stops as soon as max_rows or max_bytes is reached; the last batch is
+    sliced to fit, `truncated` is set and the cursor is closed so the warehouse
+    stops producing rows. The connection is held only while iterating.
+    """
+
+    def __init__(
+        self,
+        query: str,
+        max_rows: int = STREAM_MAX_ROWS,
+        max_bytes: int = STREAM_MAX_BYTES,
+        batch_rows: int = STREAM_BATCH_ROWS,
+    ) -> None:
+        self.query = query
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.batch_rows = batch_rows
+        self.rows = 0
+        self.bytes = 0
+        self.truncated = False
+        self.schema: Optional[pa.Schema] = None
+
+    def _fit(self, table: pa.Table) -> pa.Table:
+        rows_left = self.max_rows - self.rows
+        bytes_left = self.max_bytes - self.bytes
+        if table.num_rows > rows_left:
+            table = table.slice(0, rows_left)
+            self.truncated = True
+        if table.num_rows and table.nbytes > bytes_left:
+            per_row = table.nbytes / table.num_rows
+            table = table.slice(0, max(0, int(bytes_left // per_row)))
+            self.truncated = True
+        return table
+
+    def __iter__(self) -> Iterator[pa.Table]:
+        with _instrumented(self.query, kind="stream") as event:
+            try:
+                yield from self._batches(event)
+            finally:
+                event["rows"] = self.rows
+                event["bytes"] = self.bytes
+                event["truncated"] = self.truncated
+
+    def _batches(self, event: Dict[str, Any]) -> Iterator[pa.Table]:
+        with _connection(event) as connection:
+            with connection.cursor() as cursor, _tracked(cursor):
+                with _phase(event, "execute"):
+                    cursor.execute(self.query)
+                while True:
+                    with _phase(event, "fetch"):
+                        table = cursor.fetchmany_arrow(self.batch_rows)
+                    if self.schema is None:
+                        self.schema = table.schema
+                    if table.num_rows == 0:
+                        return
+                    table = self._fit(table)
+                    if table.num_rows:
+                        self.rows += table.num_rows
+                        self.bytes += table.nbytes
+                        yield table
+                    if self.truncated:
+                        return
+
+
+def run_sql_stream(
+    query: str,
+    max_rows: int = STREAM_MAX_ROWS,
+    max_bytes: int = STREAM_MAX_BYTES,
+    batch_rows: int = STREAM_BATCH_ROWS,
+) -> ArrowStream:
+    return ArrowStream(query, max_rows, max_bytes, batch_rows)
+
+
+# ---------- Concurrent execution ----------
+class QueryCancelled(RuntimeError):
+    pass
+
+
+class QueryTimeout(TimeoutError):
+    pass
+
+
+@contextmanager
+def _tracked(cursor: Any) -> Iterator[None]:
+    """
+    Expose the running cursor to the QueryHandle (if any) and the scheduler
+    ticket, so either can cancel it.
+    """
+    handle: Optional["QueryHandle"] = getattr(_tls, "handle", None)
+    ticket: Optional["_Ticket"] = getattr(_tls, "ticket", None)
+    if ticket is not None:
+        get_scheduler()._attach(ticket, cursor)
+    try:
+        if handle is None:
+            yield
+            return
+        handle._attach(cursor)
+        try:
+            yield
+        finally:
+            handle._detach(cursor)
+    except QueryCancelled:
+        raise
+    except Exception as e:
+        # A cancelled cursor fails with whatever error the connector raises;
+        # report it as a cancellation (single-flight followers retry those)
+        if (handle is not None and handle.cancelled) or (
+            ticket is not None and ticket.cancelled
+        ):
+            raise QueryCancelled("Statement cancelled") from e
+        raise
+    finally:
+        if ticket is not None:
+            get_scheduler()._detach(ticket, cursor)
+
+
+class QueryHandle:
+    """A submitted unit of work; statements it runs through run_sql can be cancelled."""
+
+    def __init__(self, label: str, timeout: Optional[float] = None) -> None:
+        self.label = label
+        self.deadline = time.monotonic() + timeout if timeout else None
+        self.future: "Future[Any]" = Future()
+        self._lock = threading.Lock()
+        self._cursors: List[Any] = []
+        self.cancelled = False
+
+    def _attach(self, cursor: Any) -> None:
+        with self._lock:
+            if self.cancelled:
+                raise QueryCancelled(f"{self.label} was cancelled")
+            self._cursors.append(cursor)
+
+    def _detach(self, cursor: Any) -> None:
+        with self._lock:
+            if cursor in self._cursors:
+                self._cursors.remove(cursor)
+
+    def cancel(self) -> None:
+        with self._lock:
+            self.cancelled = True
+            cursors = list(self._cursors)
+        if self.future.cancel():
+            return
+        for cursor in cursors:
+            try:
+                cursor.cancel()
+            except Exception:
+                pass
+
+    def done(self) -> bool:
+        return self.future.done()
+
+    def exception(self) -> Optional[BaseException]:
+        return self.future.exception() if self.future.done() else None
+
+    def result(self, timeout: Optional[float] = None) -> Any:
+        if self.deadline is not None:
+            remaining = max(0.0, self.deadline - time.monotonic())
+            timeout = remaining if timeout is None else min(timeout, remaining)
+        try:
+            return self.future.result(timeout)
+        except FutureTimeout:
+            if self.deadline is not None and time.monotonic() >= self.deadline:
+                self.cancel()
+                raise QueryTimeout(f"{self.label} timed out") from None
+            raise
+
+
+_executor_lock = threading.Lock()
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=EXECUTOR_WORKERS, thread_name_prefix="sql"
+            )
+        return _executor
+
+
+def submit(
+    fn: Callable[..., Any],
+    *args: Any,
+    timeout: Optional[float] = None,
+    label: Optional[str] = None,
+    **kwargs: Any,
+) -> QueryHandle:
+    """
+    Run fn(*args, **kwargs) on the shared query executor.
+
+    fn is typically run_sql or a page helper built on it; statements it executes
+    are registered with the returned handle so cancel() stops them on the warehouse.
+    """
+    handle = QueryHandle(label or getattr(fn, "__name__", "query"), timeout)
+    page = current_page()
+    # The worker queues the statements for the submitting session and user
+    origin = {k: getattr(_tls, k, None) for k in ("session", "user", "priority")}
+
+    def _run() -> None:
+        if not handle.future.set_running_or_notify_cancel():
+            return
+        _tls.handle = handle
+        _tls.page = page
+        _tls.__dict__.update(origin)
+        try:
+            if handle.cancelled:
+                raise QueryCancelled(f"{handle.label} was cancelled")
+            handle.future.set_result(fn(*args, **kwargs))
+        except BaseException as e:
+            handle.future.set_exception(e)
+        finally:
+            _tls.handle = None
+            _tls.page = None
+            for k in origin:
+                setattr(_tls, k, None)
+
+    get_executor().submit(_run)
+    return handle
+
+
+def submit_sql(
+    query: str, ttl: Optional[float] = None, timeout: Optional[float] = None
+) -> QueryHandle:
+    return submit(run_sql, query, ttl=ttl, timeout=timeout, label="run_sql")
+
+
+class QueryGroup:
+    """
+    Submit several independent queries and wait for them together.
+
+    Leaving the block (normally or through an exception such as Streamlit's
+    rerun/stop when the user navigates away) cancels whatever is still queued
+    or running on the warehouse.
+    """
+
+    def __init__(self, timeout: Optional[float] = None, poll: float = 0.1) -> None:
+        self.timeout = timeout
+        self.poll = poll
+        self.handles: List[QueryHandle] = []
+
+    def submit(
+        self,
+        fn: Callable[..., Any],
+        *args: Any,
+        timeout: Optional[float] = None,
+        **kwargs: Any,
+    ) -> QueryHandle:
+        handle = submit(fn, *args, timeout=timeout or self.timeout, **kwargs)
+        self.handles.append(handle)
+        return handle
+
+    def wait(self, heartbeat: Optional[Callable[[], None]] = None) -> List[Any]:
+        """
+        Block until every handle finishes and return their results in order.
+        The first failure (or timeout) is raised. heartbeat is called between
+        polls; on a Streamlit page, touching an element there lets a pending
+        rerun interrupt the wait.
+        """
+        pending = list(self.handles)
+        while pending:
+            wait_futures(
+                [h.future for h in pending],
+                timeout=self.poll,
+                return_when=FIRST_COMPLETED,
+            )
+            for handle in list(pending):
+                if handle.done():
+                    pending.remove(handle)
+                    handle.result()
+                elif (
+                    handle.deadline is not None and time.monotonic() >= handle.deadline
+                ):
+                    handle.result(timeout=0)  # cancels and raises QueryTimeout
+            if pending:
+                _notify_queue_listener()
+            if pending and heartbeat is not None:
+                heartbeat()
+        return [h.result() for h in self.handles]
+
+    def cancel(self) -> None:
+        for handle in self.handles:
+            if not handle.done():
+                handle.cancel()
+
+    def __enter__(self) -> "QueryGroup":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.cancel()
+
+
+# ---------- Scheduler ----------
+class QueueTimeout(QueryTimeout):
+    pass
+
+
+class _Ticket:
+    """One statement waiting for, or holding, a scheduler slot."""
+
+    def __init__(
+        self, user: str, session: Optional[str], priority: str, seq: int
+    ) -> None:
+        self.user = user
+        self.session = session
+        self.priority = priority
+        self.rank = PRIORITIES.index(priority)
+        self.seq = seq
+        self.enqueued_at = time.monotonic()
+        self.cursors: List[Any] = []
+        self.cancelled = False
+
+
+class QueryScheduler:
+    """
+    Admission control in front of the connection pool.
+
+    At most max_concurrent statements run on the warehouse at once, and at most
+    max_per_user for any one user, so a burst of sessions or a few heavy ad-hoc
+    queries cannot take every warehouse slot. Waiting statements are served by
+    priority class (PRIORITIES), then round-robin across users (the user served
+    least so far goes next), then in arrival order.
+
+    Statements of a Streamlit session that has been disconnected for
+    session_grace seconds are cancelled, queued or running.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = SQL_MAX_CONCURRENT,
+        max_per_user: int = SQL_MAX_PER_USER,
+        queue_timeout: float = SQL_QUEUE_TIMEOUT,
+        session_grace: float = SQL_SESSION_GRACE,
+        poll: float = 0.5,
+    ) -> None:
+        if max_concurrent < 1 or max_per_user < 1:
+            raise ValueError("limits must be at least 1")
+        self.max_concurrent = max_concurrent
+        self.max_per_user = max_per_user
+        self.queue_timeout = queue_timeout
+        self.session_grace = session_grace
+        self.poll = poll
+        self._cond = threading.Condition()
+        self._waiting: List[_Ticket] = []
+        self._running: List[_Ticket] = []
+        self._running_by_user: Dict[str, int] = {}
+        # Statements admitted per user; the fair-share clock
+        self._served: Dict[str, int] = {}
+        self._clock = 0
+        self._seq = 0
+        self._reaper: Optional[threading.Thread] = None
+        self._stats = {
+            "admitted": 0,
+            "queued": 0,
+            "wait_ms": 0.0,
+            "timeouts": 0,
+            "cancelled": 0,
+            "cancelled_running": 0,
+        }
+
+    # -- internals (lock held) --
+    def _order(self, ticket: _Ticket) -> Tuple[int, int, int]:
+        return (ticket.rank, self._served.get(ticket.user, 0), ticket.seq)
+
+    def _next(self) -> Optional[_Ticket]:
+        eligible = [
+            t
+            for t in self._waiting
+            if self._running_by_user.get(t.user, 0) < self.max_per_user
+        ]
+        return min(eligible, key=self._order, default=None)
+
+    def _admit(self, ticket: _Ticket) -> None:
+        self._waiting.remove(ticket)
+        self._running.append(ticket)
+        user = ticket.user
+        self._running_by_user[user] = self._running_by_user.get(user, 0) + 1
+        self._clock = max(self._clock, self._served.get(user, 0))
+        self._served[user] = self._served.get(user, 0) + 1
+        self._stats["admitted"] += 1
+        self._stats["wait_ms"] += (time.monotonic() - ticket.enqueued_at) * 1000
+
+    def _is_active(self, user: str) -> bool:
+        return user in self._running_by_user or any(
+            t.user == user for t in self._waiting
+        )
+
+    # -- public API --
+    def acquire(
+        self,
+        user: str,
+        session: Optional[str] = None,
+        priority: str = "default",
+        listener: Optional[QueueListener] = None,
+    ) -> _Ticket:
+        """
+        Wait for a slot and return the ticket to release() once done. Raises
+        QueueTimeout after queue_timeout seconds and QueryCancelled when the
+        ticket is cancelled while waiting.
+        """
+        with self._cond:
+            self._seq += 1
+            ticket = _Ticket(user, session, priority, self._seq)
+            if not self._is_active(user):
+                # Returning users start level with the others instead of with
+                # credit for the time they were away
+                self._served[user] = max(self._served.get(user, 0), self._clock)
+            self._waiting.append(ticket)
+            if session is not None:
+                self._start_reaper()
+        deadline = ticket.enqueued_at + self.queue_timeout
+        queued = False
+        try:
+            while True:
+                with self._cond:
+                    if ticket.cancelled:
+                        raise QueryCancelled("Statement cancelled while queued")
+                    free = len(self._running) < self.max_concurrent
+                    if free and self._next() is ticket:
+                        self._admit(ticket)
+                        return ticket
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats["timeouts"] += 1
+                        raise QueueTimeout(
+                            f"No warehouse slot within {self.queue_timeout:g}s "
+                            f"({len(self._running)} running, "
+                            f"{len(self._waiting)} queued)"
+                        )
+                    if not queued:
+                        queued = True
+                        self._stats["queued"] += 1
+                    self._cond.wait(min(self.poll, remaining))
+                if listener is not None and session is not None:
+                    # Outside the lock: a page may rerun from inside the listener
+                    listener(self.session_status(session))
+        except BaseException as e:
+            with self._cond:
+                if ticket in self._waiting:
+                    self._waiting.remove(ticket)
+                if isinstance(e, QueryCancelled):
+                    self._stats["cancelled"] += 1
+                self._cond.notify_all()
+            raise
+        finally:
+            if queued and listener is not None:
+                listener(None)
+
+    def release(self, ticket: _Ticket) -> None:
+        with self._cond:
+            if ticket in self._running:
+                self._running.remove(ticket)
+                left = self._running_by_user[ticket.user] - 1
+                if left:
+                    self._running_by_user[ticket.user] = left
+                else:
+                    del self._running_by_user[ticket.user]
+            self._cond.notify_all()
+
+    def _attach(self, ticket: _Ticket, cursor: Any) -> None:
+        with self._cond:
+            if ticket.cancelled:
+                raise QueryCancelled("Statement cancelled")
+            ticket.cursors.append(cursor)
+
+    def _detach(self, ticket: _Ticket, cursor: Any) -> None:
+        with self._cond:
+            if cursor in ticket.cursors:
+                ticket.cursors.remove(cursor)
+
+    def cancel_session(self, session: str) -> int:
+        """Cancel every queued and running statement of a session; returns the count."""
+        with self._cond:
+            tickets = [
+                t
+                for t in self._waiting + self._running
+                if t.session == session and not t.cancelled
+            ]
+            cursors = []
+            for ticket in tickets:
+                ticket.cancelled = True
+                if ticket in self._running:
+                    self._stats["cancelled_running"] += 1
+                    cursors += ticket.cursors
+            self._cond.notify_all()
+        for cursor in cursors:
+            try:
+                cursor.cancel()
+            except Exception:
+                pass
+        return len(tickets)
+
+    def session_status(self, session: str) -> Optional[Dict[str, Any]]:
+        """Queue position of a session's first waiting statement; None if none waits."""
+        with self._cond:
+            mine = [t for t in self._waiting if t.session == session]
+            if not mine:
+                return None
+            first = min(mine, key=self._order)
+            ahead = sum(1 for t in self._waiting if self._order(t) < self._order(first))
+            user_running = self._running_by_user.get(first.user, 0)
+            return {
+                "waiting": len(mine),
+                "position": ahead + 1,
+                "queued": len(self._waiting),
+                "running": len(self._running),
+                "user_running": user_running,
+                "user_limited": user_running >= self.max_per_user,
+                "max_per_user": self.max_per_user,
+                "seconds": time.monotonic() - first.enqueued_at,
+            }
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            by_priority = {p: 0 for p in PRIORITIES}
+            for ticket in self._waiting:
+                by_priority[ticket.priority] += 1
+            return {
+                "max_concurrent": self.max_concurrent,
+                "max_per_user": self.max_per_user,
+                "running": len(self._running),
+                "queued_now": len(self._waiting),
+                "queued_by_priority": by_priority,
+                "users": len(self._running_by_user),
+                **self._stats,
+            }
+
+    # -- disconnected sessions --
+    def _start_reaper(self) -> None:
+        # Called with the lock held
+        if self._reaper is None:
+            self._reaper = threading.Thread(
+                target=self._reap, name="sql-scheduler-reaper", daemon=True
+            )
+            self._reaper.start()
+
+    def _reap(self) -> None:
+        gone_since: Dict[str, float] = {}
+        while True:
+            time.sleep(max(0.5, min(5.0, self.session_grace / 2)))
+            with self._cond:
+                sessions = {t.session for t in self._waiting + self._running}
+            sessions.discard(None)
+            now = time.monotonic()
+            for session in sessions:
+                if _session_alive(session):
+                    gone_since.pop(session, None)
+                elif now - gone_since.setdefault(session, now) >= self.session_grace:
+                    self.cancel_session(session)
+            for session in set(gone_since) - sessions:
+                del gone_since[session]
+
+
+def _session_alive(session: str) -> bool:
+    """False once Streamlit no longer has a connected browser for the session."""
+    try:
+        from streamlit.runtime import Runtime
+
+        if not Runtime.exists():
+            return True
+        return Runtime.instance().is_active_session(session)
+    except Exception:
+        return True
+
+
+_scheduler_lock = threading.Lock()
+_scheduler: Optional[QueryScheduler] = None
+
+
+def get_scheduler() -> QueryScheduler:
+    """Process-wide statement scheduler, created on first use."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = QueryScheduler()
+        return _scheduler
+
+
+def scheduler_stats() -> Dict[str, Any]:
+    return get_scheduler().stats()
+
+
+def _notify_queue_listener() -> None:
+    """Pass the session's queue status to this thread's listener, if any."""
+    listener = getattr(_tls, "queue_listener", None)
+    session = getattr(_tls, "session", None)
+    if listener is not None and session is not None:
+        listener(get_scheduler().session_status(session))
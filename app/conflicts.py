@@ -0,0 +1,267 @@
+"""
+Optimistic concurrency for Edit Data.
+
+The page pins its reads to the Delta version current when the table was opened
+(table_version). Before a save, check_conflicts reads only the rows changed
+since that version through table_changes() (change data feed), restricted to
+the rows the change set touches, and compares them with the values the user
+started from:
+
+- clean: nobody touched those rows; apply as is
+- merged: others changed other columns of the same rows (our MERGE only sets
+  the columns we changed) or already deleted rows we delete; apply the rest
+- conflict: a row we update or delete changed in a column we rely on, was
+  deleted, or a key we insert now exists; reject
+
+Tables without a key are matched on the row hash, so any change to a row we
+edit is a conflict there. Without a change data feed only "unchanged since
+load" can be proven; any newer version is reported as a conflict.
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from common import run_sql as sqlQuery
+from editing import (
+    ROW_HASH_COL,
+    _bind_list,
+    _key_match,
+    _row_hash_expr,
+    _same_value,
+    _sql_fqn,
+    _sql_ident,
+    _values_sql,
+)
+
+# Replay order of change rows committed in the same version
+_CHANGE_ORDER = {"delete": 0, "update_preimage": 1, "update_postimage": 2, "insert": 3}
+
+
+def table_version(catalog: str, schema: str, table: str) -> Optional[int]:
+    """Latest Delta version of a table, or None when it has no history (not Delta)."""
+    try:
+        df = sqlQuery(f"DESCRIBE HISTORY {_sql_fqn(catalog, schema, table)} LIMIT 1")
+    except Exception:
+        return None
+    return int(df["version"].iloc[0]) if len(df) else None
+
+
+def pinned(fqn: str, version: Optional[int]) -> str:
+    """Table reference read at `version` (time travel), or as of now."""
+    return fqn if version is None else f"{fqn} VERSION AS OF {int(version)}"
+
+
+class ConflictReport:
+    def __init__(
+        self,
+        status: str,
+        version: Optional[int],
+        latest_version: Optional[int],
+        conflicts: Optional[List[Dict[str, Any]]] = None,
+        merged: int = 0,
+        already_deleted: Optional[List[Dict[str, Any]]] = None,
+    ) -> None:
+        self.status = status  # "clean", "merged" or "conflict"
+        self.version = version
+        self.latest_version = latest_version
+        self.conflicts = conflicts or []
+        self.merged = merged
+        # Our deletes another session already applied; drop them from the save
+        self.already_deleted = already_deleted or []
+
+    @property
+    def ok(self) -> bool:
+        return self.status != "conflict"
+
+
+def row_key(row: Dict[str, Any], key_cols: List[str]) -> Tuple[Any, ...]:
+    return tuple(None if pd.isna(row[k]) else row[k] for k in key_cols)
+
+
+def _latest_by_key(
+    changes: pd.DataFrame, key_cols: List[str]
+) -> Dict[Tuple[Any, ...], Dict[str, Any]]:
+    """Final state per key: the last change row in commit order."""
+    if changes.empty:
+        return {}
+    order = changes["_change_type"].map(_CHANGE_ORDER)
+    changes = changes.assign(_order=order).sort_values(["_commit_version", "_order"])
+    latest: Dict[Tuple[Any, ...], Dict[str, Any]] = {}
+    for row in changes.to_dict("records"):
+        latest[row_key(row, key_cols)] = row
+    return latest
+
+
+def _changes_by_key(
+    name: str,
+    start: int,
+    key_cols: List[str],
+    keys: List[Dict[str, Any]],
+) -> pd.DataFrame:
+    params: Dict[str, Any] = {"table": name, "start": start}
+    values_sql = _values_sql(keys, key_cols, params)
+    alias_sql = ", ".join(_sql_ident(k) for k in key_cols)
+    return sqlQuery(
+        f"""
+        select t.* from table_changes(:table, :start) t
+        join (select * from values {values_sql}) as s({alias_sql}) on {_key_match(key_cols)}
+        where t._change_type <> 'update_preimage'
+        """,
+        parameters=params,
+    )
+
+
+def _changed_hashes(
+    name: str, start: int, columns: List[str], hashes: List[str]
+) -> pd.DataFrame:
+    params: Dict[str, Any] = {"table": name, "start": start}
+    row_hash = _row_hash_expr(columns, table_alias="t")
+    return sqlQuery(
+        f"""
+        select {row_hash} as {ROW_HASH_COL}, t._change_type, t._commit_version
+        from table_changes(:table, :start) t
+        where t._change_type in ('delete', 'update_preimage')
+          and {row_hash} in ({_bind_list(hashes, params)})
+        """,
+        parameters=params,
+    )
+
+
+def check_conflicts(
+    catalog: str,
+    schema: str,
+    table: str,
+    columns: List[str],
+    version: Optional[int],
+    inserts: List[Dict[str, Any]],
+    updates: List[Dict[str, Any]],
+    deletes: List[Dict[str, Any]],
+    key_cols: Optional[List[str]] = None,
+    originals: Optional[Dict[Tuple[Any, ...], Dict[str, Any]]] = None,
+) -> ConflictReport:
+    """
+    Check a change set against what others committed since `version`.
+
+    With key_cols, updates/deletes/inserts carry key values and `originals` maps
+    each updated or deleted key to the row as it was loaded. Without, updates
+    and deletes carry the loaded row hash in '__row_hash'.
+    """
+    if version is None:
+        return ConflictReport("clean", None, None)
+    latest_version = table_version(catalog, schema, table)
+    if latest_version is None or latest_version == version:
+        return ConflictReport("clean", version, latest_version)
+    name = f"{catalog}.{schema}.{table}"
+    try:
+        if key_cols:
+            touched = [
+                {k: r.get(k) for k in key_cols} for r in updates + deletes + inserts
+            ]
+            changes = (
+                _changes_by_key(name, version + 1, key_cols, touched)
+                if touched
+                else pd.DataFrame()
+            )
+        else:
+            hashes = [r[ROW_HASH_COL] for r in updates + deletes]
+            changes = (
+                _changed_hashes(name, version + 1, columns, hashes)
+                if hashes
+                else pd.DataFrame()
+            )
+    except Exception as e:
+        # Typically delta.enableChangeDataFeed is off for the table
+        reason = f"table changed since load and its changes can't be read: {e}"
+        return ConflictReport("conflict", version, latest_version, [{"reason": reason}])
+    if key_cols:
+        return _resolve_by_key(
+            changes,
+            version,
+            latest_version,
+            inserts,
+            updates,
+            deletes,
+            key_cols,
+            originals or {},
+        )
+    changed = set(changes[ROW_HASH_COL]) if len(changes) else set()
+    conflicts = [
+        {ROW_HASH_COL: r[ROW_HASH_COL], "reason": "row changed or deleted since load"}
+        for r in updates + deletes
+        if r[ROW_HASH_COL] in changed
+    ]
+    status = "conflict" if conflicts else "clean"
+    return ConflictReport(status, version, latest_version, conflicts)
+
+
+def _resolve_by_key(
+    changes: pd.DataFrame,
+    version: int,
+    latest_version: Optional[int],
+    inserts: List[Dict[str, Any]],
+    updates: List[Dict[str, Any]],
+    deletes: List[Dict[str, Any]],
+    key_cols: List[str],
+    originals: Dict[Tuple[Any, ...], Dict[str, Any]],
+) -> ConflictReport:
+    latest = _latest_by_key(changes, key_cols)
+    conflicts: List[Dict[str, Any]] = []
+    already_deleted: List[Dict[str, Any]] = []
+    merged = 0
+
+    def conflict(row: Dict[str, Any], reason: str, theirs: Dict[str, Any]) -> None:
+        entry = {k: row.get(k) for k in key_cols}
+        entry["reason"] = reason
+        entry["commit_version"] = theirs.get("_commit_version")
+        conflicts.append(entry)
+
+    def differs(
+        key: Tuple[Any, ...], theirs: Dict[str, Any], cols: List[str]
+    ) -> List[str]:
+        original = originals.get(key, {})
+        return [
+            c
+            for c in cols
+            if c in original and not _same_value(theirs.get(c), original[c])
+        ]
+
+    for row in updates:
+        key = row_key(row, key_cols)
+        theirs = latest.get(key)
+        if theirs is None:
+            continue
+        if theirs["_change_type"] == "delete":
+            conflict(row, "deleted by another session", theirs)
+            continue
+        ours = [c for c in row if c not in key_cols]
+        clashing = differs(key, theirs, ours)
+        if clashing:
+            reason = f"also changed by another session: {', '.join(clashing)}"
+            conflict(row, reason, theirs)
+        elif differs(key, theirs, list(originals.get(key, {}))):
+            merged += 1
+    for row in deletes:
+        key = row_key(row, key_cols)
+        theirs = latest.get(key)
+        if theirs is None:
+            continue
+        if theirs["_change_type"] == "delete":
+            already_deleted.append(row)
+            merged += 1
+        elif differs(key, theirs, list(originals.get(key, {}))):
+            conflict(row, "changed by another session", theirs)
+    for row in inserts:
+        theirs = latest.get(row_key(row, key_cols))
+        if theirs is not None and theirs["_change_type"] != "delete":
+            conflict(row, "key inserted by another session", theirs)
+
+    if conflicts:
+        status = "conflict"
+    elif merged:
+        status = "merged"
+    else:
+        status = "clean"
+    return ConflictReport(
+        status, version, latest_version, conflicts, merged, already_deleted
+    )
@@ -0,0 +1,626 @@
+import bisect
+import time
+from typing import (
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+)
+
+import numpy as np
+import pandas as pd
+
+from common import invalidate_table, run_sql as sqlQuery
+
+# Values are sent as bound parameters; capping them per statement keeps the
+# request size, plan time and the error surface of a single batch contained.
+MAX_STATEMENT_PARAMS = 2_000
+MAX_BATCH_ROWS = 1_000
+
+ROW_HASH_COL = "__row_hash"
+
+
+def _sql_ident(name: str) -> str:
+    return f"`{name}`"
+
+
+def _sql_fqn(catalog: str, schema: str, table: str) -> str:
+    return f"`{catalog}`.`{schema}`.`{table}`"
+
+
+def _sql_param(value: Any) -> Any:
+    """Normalize a DataFrame value for binding as a query parameter."""
+    if isinstance(value, np.generic):
+        value = value.item()
+    if value is None or (not isinstance(value, (list, dict)) and pd.isna(value)):
+        return None
+    if isinstance(value, pd.Timestamp):
+        return value.to_pydatetime()
+    return value
+
+
+def _bind(value: Any, params: Dict[str, Any], prefix: str = "p") -> str:
+    """Add value to params under the next free name and return its marker."""
+    name = f"{prefix}{len(params)}"
+    params[name] = _sql_param(value)
+    return f":{name}"
+
+
+def _bind_list(values: Iterable[Any], params: Dict[str, Any], prefix: str = "p") -> str:
+    """`:p0, :p1, ...` for an IN list."""
+    return ", ".join(_bind(v, params, prefix) for v in values)
+
+
+def _row_hash_expr(columns: List[str], table_alias: Optional[str] = None) -> str:
+    """Return Spark SQL expression that computes the row hash for given columns."""
+    alias = table_alias or ""
+    alias_prefix = f"{alias}." if alias else ""
+    parts = []
+    for c in columns:
+        parts.append(f"'{c}', {alias_prefix}{_sql_ident(c)}")
+    named = f"named_struct({', '.join(parts)})"
+    return f"sha2(to_json({named}), 256)"
+
+
+# ---------- Diffing ----------
+def _column_changed(o: pd.Series, e: pd.Series) -> np.ndarray:
+    """Elementwise 'value changed' for two aligned columns, treating NaN == None."""
+    o_na = o.isna().to_numpy()
+    e_na = e.isna().to_numpy()
+    numeric = pd.api.types.is_numeric_dtype
+    ne = None
+    # Mixed dtypes are compared as Python values: pandas would otherwise parse
+    # strings edited into a datetime column and call them unchanged
+    if o.dtype == e.dtype or (numeric(o.dtype) and numeric(e.dtype)):
+        try:
+            ne = o.ne(e).to_numpy(dtype=bool, na_value=True)
+        except TypeError:
+            # e.g. categoricals with different categories or incomparable objects
+            pass
+    if ne is None:
+        ne = o.astype(object).ne(e.astype(object)).to_numpy(dtype=bool, na_value=True)
+    return (o_na != e_na) | (~o_na & ~e_na & ne)
+
+
+def changed_cells(
+    original: pd.DataFrame, edited: pd.DataFrame, columns: Optional[List[str]] = None
+) -> pd.DataFrame:
+    """
+    Boolean mask of changed cells for the rows present in both frames (matched on
+    index). Only rows with at least one change are kept, so the mask stays small.
+    """
+    cols = columns if columns is not None else list(original.columns)
+    common = original.index.intersection(edited.index, sort=False)
+    o = original.loc[common, cols]
+    e = edited.loc[common, cols]
+    mask = pd.DataFrame(
+        {c: _column_changed(o[c], e[c]) for c in cols}, index=common, columns=cols
+    )
+    return mask[mask.to_numpy().any(axis=1)] if len(cols) else mask.iloc[0:0]
+
+
+def _records(df: pd.DataFrame) -> List[Dict[str, Any]]:
+    return df.to_dict("records")
+
+
+def _updates_from_mask(
+    mask: pd.DataFrame, edited: pd.DataFrame
+) -> Iterator[Tuple[Any, Dict[str, Any]]]:
+    """Yield (index key, {changed column: edited value}) per changed row."""
+    if mask.empty:
+        return
+    cols = list(mask.columns)
+    values = edited.loc[mask.index, cols].to_numpy(dtype=object)
+    flags = mask.to_numpy()
+    for key, row_vals, row_flags in zip(mask.index, values, flags):
+        yield key, {c: v for c, v, f in zip(cols, row_vals, row_flags) if f}
+
+
+def _sorted_keys(index: pd.Index) -> pd.Index:
+    try:
+        return index.sort_values()
+    except TypeError:
+        return index
+
+
+def compute_changes(
+    original: pd.DataFrame, edited: pd.DataFrame, key_cols: List[str]
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    Returns (inserts, updates, deletes) where each entry is a row dict of column->value.
+    Updates contain both key values and changed non-key columns.
+    """
+    if not key_cols:
+        raise ValueError("Key columns must be specified to compute changes.")
+
+    # Ensure keys exist
+    for k in key_cols:
+        if k not in original.columns or k not in edited.columns:
+            raise ValueError(f"Key column '{k}' not present in data")
+
+    # Index by keys
+    orig_idxed = original.set_index(key_cols, drop=False)
+    edit_idxed = edited.set_index(key_cols, drop=False)
+
+    # Uniqueness check
+    if not orig_idxed.index.is_unique:
+        raise ValueError(
+            "Original data has duplicate key values. Please choose different key columns."
+        )
+    if not edit_idxed.index.is_unique:
+        raise ValueError(
+            "Edited data has duplicate key values. Please resolve duplicates before saving."
+        )
+
+    to_delete = _sorted_keys(orig_idxed.index.difference(edit_idxed.index, sort=False))
+    to_insert = _sorted_keys(edit_idxed.index.difference(orig_idxed.index, sort=False))
+
+    inserts = _records(edit_idxed.loc[to_insert])
+    deletes = _records(orig_idxed.loc[to_delete, key_cols])
+
+    non_key_cols = [c for c in original.columns if c not in key_cols]
+    mask = changed_cells(orig_idxed, edit_idxed, non_key_cols)
+    mask = mask.loc[_sorted_keys(mask.index)]
+    key_values = edit_idxed.loc[mask.index, key_cols].to_dict("records")
+    updates: List[Dict[str, Any]] = []
+    for (_, changes), keys in zip(_updates_from_mask(mask, edit_idxed), key_values):
+        changes.update(keys)
+        updates.append(changes)
+
+    return inserts, updates, deletes
+
+
+def compute_changes_by_index(
+    original: pd.DataFrame, edited: pd.DataFrame
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    Diff two DataFrames using their index as the row identifier (original row hash).
+    Returns (inserts, updates, deletes).
+    Each update dict contains a special key '__row_hash' with the original index value.
+    Each delete dict contains only '__row_hash'.
+    Inserts are full row dicts of the edited values.
+    """
+    if original.index.name is None:
+        original.index.name = "_row_hash"
+    if edited.index.name is None:
+        edited.index.name = "_row_hash"
+
+    # Ensure no duplicate indices
+    if not original.index.is_unique:
+        raise ValueError(
+            "Original data has duplicate synthetic keys; cannot compute diff."
+        )
+    if not edited.index.is_unique:
+        # Streamlit may produce duplicate indices for new rows; keep first occurrence
+        edited = edited[~edited.index.duplicated(keep="first")]
+
+    to_delete = _sorted_keys(original.index.difference(edited.index, sort=False))
+    to_insert = _sorted_keys(edited.index.difference(original.index, sort=False))
+
+    inserts = _records(edited.loc[to_insert])
+    deletes = [{ROW_HASH_COL: key} for key in to_delete]
+
+    mask = changed_cells(original, edited)
+    mask = mask.loc[_sorted_keys(mask.index)]
+    updates: List[Dict[str, Any]] = []
+    for key, changes in _updates_from_mask(mask, edited):
+        changes[ROW_HASH_COL] = key
+        updates.append(changes)
+
+    return inserts, updates, deletes
+
+
+# ---------- Editor deltas ----------
+def _is_na(value: Any) -> bool:
+    return value is None or (np.ndim(value) == 0 and bool(pd.isna(value)))
+
+
+def _same_value(a: Any, b: Any) -> bool:
+    a_na = _is_na(a)
+    b_na = _is_na(b)
+    if a_na or b_na:
+        return a_na and b_na
+    try:
+        return bool(a == b)
+    except (TypeError, ValueError):
+        return False
+
+
+class DeltaChanges:
+    """
+    Change set for one loaded page, built from st.data_editor deltas
+    (edited_rows / added_rows / deleted_rows) instead of a full-frame diff.
+
+    Editors are recreated on top of earlier edits (the editor's input is the
+    previous editor's output), so positions are resolved through row_ids: the
+    row's position in `original` (>= 0), or -n for the n-th row added. Folding
+    one editor's deltas costs O(edits), whatever the page size.
+    """
+
+    def __init__(self, original: pd.DataFrame) -> None:
+        self.original = original
+        self.row_ids: np.ndarray = np.arange(len(original), dtype=np.int64)
+        self.updates: Dict[int, Dict[str, Any]] = {}
+        self.deletes: Set[int] = set()
+        self.inserts: Dict[int, Dict[str, Any]] = {}
+        self._added = 0
+
+    def copy(self) -> "DeltaChanges":
+        out = DeltaChanges.__new__(DeltaChanges)
+        out.original = self.original
+        # row_ids is never modified in place, so copies can share it
+        out.row_ids = self.row_ids
+        out.updates = {k: dict(v) for k, v in self.updates.items()}
+        out.deletes = set(self.deletes)
+        out.inserts = {k: dict(v) for k, v in self.inserts.items()}
+        out._added = self._added
+        return out
+
+    def apply(self, state: Dict[str, Any], edited: pd.DataFrame) -> None:
+        """
+        Fold one editor's deltas into the change set. `state` is the editor's
+        session-state value; `edited` is what the editor returned, used for typed
+        values (deltas hold JSON-ish ones). Positions in `state` refer to the rows
+        the editor was given, i.e. the current row_ids.
+        """
+        deleted = sorted(int(p) for p in state.get("deleted_rows") or [])
+        deleted_set = set(deleted)
+        edits = [
+            (int(pos), cells)
+            for pos, cells in (state.get("edited_rows") or {}).items()
+            if int(pos) not in deleted_set
+        ]
+        added = len(state.get("added_rows") or [])
+        kept_rows = len(self.row_ids) - len(deleted)
+
+        # Typed values of every edited and added row, read from `edited` at once.
+        # Deleted rows are gone from it, the rest keep their order, added last.
+        positions = [pos - bisect.bisect_left(deleted, pos) for pos, _ in edits]
+        positions += range(kept_rows, kept_rows + added)
+        rows = edited.iloc[positions].to_dict("records") if positions else []
+        rids = [int(self.row_ids[pos]) for pos, _ in edits]
+        loaded = [rid for rid in rids if rid >= 0]
+        originals = dict(
+            zip(loaded, self.original.iloc[loaded].to_dict("records") if loaded else [])
+        )
+
+        for rid, (_, cells), row in zip(rids, edits, rows):
+            if rid < 0:
+                self.inserts[rid].update({c: row[c] for c in cells})
+                continue
+            changes = self.updates.setdefault(rid, {})
+            for c in cells:
+                if _same_value(row[c], originals[rid][c]):
+                    changes.pop(c, None)
+                else:
+                    changes[c] = row[c]
+            if not changes:
+                del self.updates[rid]
+
+        for pos in deleted:
+            rid = int(self.row_ids[pos])
+            if rid < 0:
+                del self.inserts[rid]
+            else:
+                self.updates.pop(rid, None)
+                self.deletes.add(rid)
+
+        if not deleted and not added:
+            return
+        kept = np.delete(self.row_ids, deleted)
+        new_ids = np.arange(-self._added - 1, -self._added - added - 1, -1)
+        for rid, row in zip(new_ids, rows[len(edits) :]):
+            self.inserts[int(rid)] = row
+        self._added += added
+        self.row_ids = np.concatenate([kept, new_ids])
+
+    def changes(
+        self,
+    ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """(inserts, updates, deletes) in the format of compute_changes_by_index."""
+        index = self.original.index
+        inserts = [self.inserts[k] for k in sorted(self.inserts, reverse=True)]
+        updates = []
+        for rid, cells in self.updates.items():
+            changes = {c: cells[c] for c in self.original.columns if c in cells}
+            changes[ROW_HASH_COL] = index[rid]
+            updates.append(changes)
+        deletes = [{ROW_HASH_COL: index[rid]} for rid in self.deletes]
+        # Same order as the full diff, which sorts by key
+        try:
+            updates.sort(key=lambda r: r[ROW_HASH_COL])
+            deletes.sort(key=lambda r: r[ROW_HASH_COL])
+        except TypeError:
+            pass
+        return inserts, updates, deletes
+
+
+def _same_rows(a: List[Dict[str, Any]], b: List[Dict[str, Any]]) -> bool:
+    return len(a) == len(b) and all(
+        r.keys() == q.keys() and all(_same_value(r[k], q[k]) for k in r)
+        for r, q in zip(a, b)
+    )
+
+
+def changes_equal(
+    a: Tuple[List[Dict[str, Any]], ...], b: Tuple[List[Dict[str, Any]], ...]
+) -> bool:
+    """Compare two (inserts, updates, deletes) results, NaN == None; insert order ignored."""
+
+    def order(row: Dict[str, Any]) -> str:
+        return repr([None if _is_na(v) else v for v in row.values()])
+
+    inserts_a, inserts_b = (sorted(x, key=order) for x in (a[0], b[0]))
+    return (
+        _same_rows(inserts_a, inserts_b)
+        and _same_rows(a[1], b[1])
+        and _same_rows(a[2], b[2])
+    )
+
+
+# ---------- Batching ----------
+# A statement is (kind, SQL template, named parameters, rows). Values are bound,
+# not rendered, so every full batch of the same shape has identical text.
+Statement = Tuple[str, str, Dict[str, Any], int]
+
+
+def _chunks(
+    rows: Sequence[Any], width: int, max_params: int, max_rows: int
+) -> Iterator[Sequence[Any]]:
+    """Fixed-size batches of at most max_rows rows and max_params bound values."""
+    size = max(1, min(max_rows, max_params // max(1, width)))
+    for i in range(0, len(rows), size):
+        yield rows[i : i + size]
+
+
+def _values_sql(
+    rows: Sequence[Dict[str, Any]], columns: Sequence[str], params: Dict[str, Any]
+) -> str:
+    """`(:p0, :p1), (:p2, :p3)` for rows, binding their values into params."""
+    rendered = []
+    for row in rows:
+        markers = [_bind(row.get(c), params) for c in columns]
+        rendered.append("(" + ", ".join(markers) + ")")
+    return ", ".join(rendered)
+
+
+def _group_by_changed_columns(
+    updates: List[Dict[str, Any]], settable: Sequence[str]
+) -> Dict[Tuple[str, ...], List[Dict[str, Any]]]:
+    """
+    Group update rows by the set of columns they change so every group becomes one
+    MERGE with a fixed SET list. Most saves touch one or two column combinations.
+    """
+    groups: Dict[Tuple[str, ...], List[Dict[str, Any]]] = {}
+    for row in updates:
+        cols = tuple(c for c in settable if c in row)
+        if cols:
+            groups.setdefault(cols, []).append(row)
+    return groups
+
+
+def _run_batch(
+    kind: str,
+    statement: str,
+    params: Dict[str, Any],
+    rows: int,
+    report: List[Dict[str, Any]],
+) -> None:
+    started = time.perf_counter()
+    sqlQuery(statement, parameters=params)
+    report.append(
+        {
+            "kind": kind,
+            "rows": rows,
+            "params": len(params),
+            "seconds": time.perf_counter() - started,
+        }
+    )
+
+
+def _key_match(key_cols: Sequence[str]) -> str:
+    # Null-safe equality keeps the old "IS NULL" key semantics
+    return " AND ".join(f"t.{_sql_ident(k)} <=> s.{_sql_ident(k)}" for k in key_cols)
+
+
+def _merge_statements(
+    kind: str,
+    head: str,
+    tail: str,
+    rows: Sequence[Dict[str, Any]],
+    columns: Sequence[str],
+    max_params: int,
+    max_rows: int,
+) -> List[Statement]:
+    statements: List[Statement] = []
+    for batch in _chunks(rows, len(columns), max_params, max_rows):
+        params: Dict[str, Any] = {}
+        values_sql = _values_sql(batch, columns, params)
+        statements.append((kind, f"{head}{values_sql}{tail}", params, len(batch)))
+    return statements
+
+
+def build_insert_statements(
+    fqn: str,
+    columns: List[str],
+    inserts: List[Dict[str, Any]],
+    max_params: int = MAX_STATEMENT_PARAMS,
+    max_rows: int = MAX_BATCH_ROWS,
+    key_cols: Optional[List[str]] = None,
+) -> List[Statement]:
+    """
+    Plain INSERTs, or with key_cols a MERGE that skips rows whose key already
+    exists, so a batch can be re-run after an ambiguous failure.
+    """
+    cols_sql = ", ".join(_sql_ident(c) for c in columns)
+    if key_cols:
+        values_sql = ", ".join(f"s.{_sql_ident(c)}" for c in columns)
+        head = f"MERGE INTO {fqn} t USING (SELECT * FROM VALUES "
+        tail = (
+            f") AS s({cols_sql}) ON {_key_match(key_cols)} "
+            f"WHEN NOT MATCHED THEN INSERT ({cols_sql}) VALUES ({values_sql})"
+        )
+    else:
+        head = f"INSERT INTO {fqn} ({cols_sql}) VALUES "
+        tail = ""
+    return _merge_statements(
+        "insert", head, tail, inserts, columns, max_params, max_rows
+    )
+
+
+def build_update_statements(
+    fqn: str,
+    columns: List[str],
+    updates: List[Dict[str, Any]],
+    key_cols: Optional[List[str]] = None,
+    max_params: int = MAX_STATEMENT_PARAMS,
+    max_rows: int = MAX_BATCH_ROWS,
+) -> List[Statement]:
+    """
+    One MERGE per (changed-column set, size batch), joining the target against a
+    staged VALUES relation. Without key_cols rows are matched on the content hash
+    carried in '__row_hash', so the hash is computed once per MERGE instead of once
+    per edited row.
+    """
+    statements: List[Statement] = []
+    settable = [c for c in columns if not key_cols or c not in key_cols]
+    for set_cols, rows in _group_by_changed_columns(updates, settable).items():
+        if key_cols:
+            match_cols = list(key_cols)
+            on_sql = _key_match(key_cols)
+        else:
+            match_cols = [ROW_HASH_COL]
+            on_sql = f"{_row_hash_expr(columns, table_alias='t')} = s.{ROW_HASH_COL}"
+        staged_cols = match_cols + list(set_cols)
+        alias_sql = ", ".join(_sql_ident(c) for c in staged_cols)
+        set_sql = ", ".join(f"t.{_sql_ident(c)} = s.{_sql_ident(c)}" for c in set_cols)
+        head = f"MERGE INTO {fqn} t USING (SELECT * FROM VALUES "
+        tail = f") AS s({alias_sql}) ON {on_sql} WHEN MATCHED THEN UPDATE SET {set_sql}"
+        statements += _merge_statements(
+            "update", head, tail, rows, staged_cols, max_params, max_rows
+        )
+    return statements
+
+
+def build_delete_statements(
+    fqn: str,
+    columns: List[str],
+    deletes: List[Dict[str, Any]],
+    key_cols: Optional[List[str]] = None,
+    max_params: int = MAX_STATEMENT_PARAMS,
+    max_rows: int = MAX_BATCH_ROWS,
+) -> List[Statement]:
+    if key_cols:
+        alias_sql = ", ".join(_sql_ident(k) for k in key_cols)
+        head = f"MERGE INTO {fqn} t USING (SELECT * FROM VALUES "
+        tail = f") AS s({alias_sql}) ON {_key_match(key_cols)} WHEN MATCHED THEN DELETE"
+        return _merge_statements(
+            "delete", head, tail, deletes, key_cols, max_params, max_rows
+        )
+    head = f"DELETE FROM {fqn} t WHERE {_row_hash_expr(columns, table_alias='t')} IN ("
+    statements: List[Statement] = []
+    for batch in _chunks(deletes, 1, max_params, max_rows):
+        params: Dict[str, Any] = {}
+        in_sql = _bind_list([r[ROW_HASH_COL] for r in batch], params)
+        statements.append(("delete", f"{head}{in_sql})", params, len(batch)))
+    return statements
+
+
+def build_change_statements(
+    fqn: str,
+    columns: List[str],
+    inserts: List[Dict[str, Any]],
+    updates: List[Dict[str, Any]],
+    deletes: List[Dict[str, Any]],
+    key_cols: Optional[List[str]] = None,
+    max_params: int = MAX_STATEMENT_PARAMS,
+    max_rows: int = MAX_BATCH_ROWS,
+    retry_safe: bool = False,
+) -> List[Statement]:
+    """
+    Statements for a change set, in execution order. Deletes and updates match
+    on the pre-edit content, so they run before inserts can introduce rows with
+    the same hash. With retry_safe, inserts into a keyed table skip existing
+    keys, so every statement except keyless inserts is idempotent.
+    """
+    return (
+        build_delete_statements(fqn, columns, deletes, key_cols, max_params, max_rows)
+        + build_update_statements(fqn, columns, updates, key_cols, max_params, max_rows)
+        + build_insert_statements(
+            fqn,
+            columns,
+            inserts,
+            max_params,
+            max_rows,
+            key_cols if retry_safe else None,
+        )
+    )
+
+
+def apply_changes_batched(
+    catalog: str,
+    schema: str,
+    table: str,
+    columns: List[str],
+    inserts: List[Dict[str, Any]],
+    updates: List[Dict[str, Any]],
+    deletes: List[Dict[str, Any]],
+    key_cols: Optional[List[str]] = None,
+    max_params: int = MAX_STATEMENT_PARAMS,
+    max_rows: int = MAX_BATCH_ROWS,
+) -> List[Dict[str, Any]]:
+    """
+    Apply a change set with a handful of set-based statements.
+
+    Rows are matched on key_cols when given, otherwise on the content hash in
+    '__row_hash' (as produced by compute_changes_by_index). Returns one timing
+    entry per executed statement: kind, rows, params and seconds.
+    See save_jobs for running a change set in the background.
+    """
+    fqn = _sql_fqn(catalog, schema, table)
+    report: List[Dict[str, Any]] = []
+    try:
+        for kind, statement, params, n in build_change_statements(
+            fqn, columns, inserts, updates, deletes, key_cols, max_params, max_rows
+        ):
+            _run_batch(kind, statement, params, n, report)
+    finally:
+        # Even a partially applied save changes the table
+        invalidate_table(catalog, schema, table)
+    return report
+
+
+def apply_changes(
+    catalog: str,
+    schema: str,
+    table: str,
+    columns: List[str],
+    key_cols: List[str],
+    inserts: List[Dict[str, Any]],
+    updates: List[Dict[str, Any]],
+    deletes: List[Dict[str, Any]],
+) -> List[Dict[str, Any]]:
+    if not key_cols:
+        raise ValueError("Key columns must be specified to apply changes.")
+    return apply_changes_batched(
+        catalog, schema, table, columns, inserts, updates, deletes, key_cols=key_cols
+    )
+
+
+def apply_changes_by_rowhash(
+    catalog: str,
+    schema: str,
+    table: str,
+    columns: List[str],
+    inserts: List[Dict[str, Any]],
+    updates: List[Dict[str, Any]],
+    deletes: List[Dict[str, Any]],
+) -> List[Dict[str, Any]]:
+    return apply_changes_batched(
+        catalog, schema, table, columns, inserts, updates, deletes
+    )
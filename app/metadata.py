@@ -0,0 +1,226 @@
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import pandas as pd
+
+from common import query_priority, run_sql as sqlQuery
+from editing import _bind_list
+
+logger = logging.getLogger(__name__)
+
+REFRESH_INTERVAL = float(os.getenv("METADATA_REFRESH_INTERVAL", "60"))
+
+_COLUMN_FIELDS = ["column_name", "data_type", "is_nullable"]
+
+
+def _same(a: Any, b: Any) -> bool:
+    return (pd.isna(a) and pd.isna(b)) or a == b
+
+
+class CatalogSnapshot:
+    """
+    In-memory copy of information_schema tables, columns and primary keys for one
+    catalog (optionally one schema), keyed by "schema.table".
+
+    The first load takes three queries. Refreshes re-read the table list and
+    reload columns/keys only for tables whose last_altered moved, so switching
+    tables on a page is a dict lookup.
+    """
+
+    def __init__(self, catalog: str, schema: Optional[str] = None) -> None:
+        self.catalog = catalog
+        self.schema = schema if schema and schema.strip() else None
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._tables: Dict[str, Any] = {}  # schema.table -> last_altered
+        self._columns: Dict[str, pd.DataFrame] = {}
+        self._primary_keys: Dict[str, List[str]] = {}
+        self.loaded_at: Optional[float] = None
+        self.refreshes = 0
+        self._thread: Optional[threading.Thread] = None
+
+    # -- queries --
+    # Schema and table names are bound as parameters, so each query text is fixed
+    def _schema_filter(self, params: Dict[str, Any], alias: str = "") -> str:
+        if not self.schema:
+            return ""
+        params["schema"] = self.schema
+        prefix = f"{alias}." if alias else ""
+        return f"and {prefix}table_schema = :schema\n"
+
+    def _table_filter(
+        self, keys: Optional[Set[str]], params: Dict[str, Any], alias: str = ""
+    ) -> str:
+        if keys is None:
+            return ""
+        prefix = f"{alias}." if alias else ""
+        qualified = f"concat({prefix}table_schema, '.', {prefix}table_name)"
+        return f"and {qualified} in ({_bind_list(sorted(keys), params, 'k')})\n"
+
+    def _load_tables(self) -> Dict[str, Any]:
+        params: Dict[str, Any] = {}
+        df = sqlQuery(
+            f"""
+            select table_schema, table_name, last_altered
+            from `{self.catalog}`.information_schema.tables
+            where table_type = 'MANAGED'
+            {self._schema_filter(params)}order by table_schema, table_name
+            """,
+            parameters=params,
+        )
+        return {
+            f"{s}.{t}": altered
+            for s, t, altered in zip(
+                df["table_schema"], df["table_name"], df["last_altered"]
+            )
+        }
+
+    def _load_columns(self, keys: Optional[Set[str]]) -> Dict[str, pd.DataFrame]:
+        params: Dict[str, Any] = {}
+        df = sqlQuery(
+            f"""
+            select table_schema, table_name, column_name, data_type, is_nullable
+            from `{self.catalog}`.information_schema.columns
+            where 1 = 1
+            {self._schema_filter(params)}{self._table_filter(keys, params)}
+            order by table_schema, table_name, ordinal_position
+            """,
+            parameters=params,
+        )
+        out: Dict[str, pd.DataFrame] = {}
+        for (s, t), group in df.groupby(["table_schema", "table_name"], sort=False):
+            out[f"{s}.{t}"] = group[_COLUMN_FIELDS].reset_index(drop=True)
+        return out
+
+    def _load_primary_keys(self, keys: Optional[Set[str]]) -> Dict[str, List[str]]:
+        params: Dict[str, Any] = {}
+        try:
+            df = sqlQuery(
+                f"""
+                select kcu.table_schema, kcu.table_name, kcu.column_name
+                from `{self.catalog}`.information_schema.table_constraints tc
+                join `{self.catalog}`.information_schema.key_column_usage kcu
+                  on tc.constraint_name = kcu.constraint_name
+                 and tc.table_schema = kcu.table_schema
+                 and tc.table_name = kcu.table_name
+                where tc.constraint_type = 'PRIMARY KEY'
+                {self._schema_filter(params, "tc")}{self._table_filter(keys, params, "tc")}
+                order by kcu.table_schema, kcu.table_name, kcu.ordinal_position
+                """,
+                parameters=params,
+            )
+        except Exception:
+            # Unity Catalog may not return constraints for some tables; fall back to none
+            return {}
+        out: Dict[str, List[str]] = {}
+        for s, t, c in zip(df["table_schema"], df["table_name"], df["column_name"]):
+            out.setdefault(f"{s}.{t}", []).append(c)
+        return out
+
+    # -- refresh --
+    def refresh(self, full: bool = False) -> Set[str]:
+        """Sync with information_schema and return the keys that changed."""
+        # Pages wait on these lookups; they go ahead of ad-hoc SQL in the queue
+        with self._refresh_lock, query_priority("interactive"):
+            return self._refresh(full)
+
+    def _refresh(self, full: bool) -> Set[str]:
+        tables = self._load_tables()
+        with self._lock:
+            known = dict(self._tables)
+        if full or self.loaded_at is None:
+            changed: Optional[Set[str]] = None
+        else:
+            changed = {
+                k for k, v in tables.items() if k not in known or not _same(known[k], v)
+            }
+        dropped = set(known) - set(tables)
+        columns: Dict[str, pd.DataFrame] = {}
+        primary_keys: Dict[str, List[str]] = {}
+        if changed is None or changed:
+            columns = self._load_columns(changed)
+            primary_keys = self._load_primary_keys(changed)
+        with self._lock:
+            if changed is None:
+                self._columns = columns
+                self._primary_keys = primary_keys
+            else:
+                for key in changed | dropped:
+                    self._columns.pop(key, None)
+                    self._primary_keys.pop(key, None)
+                self._columns.update(columns)
+                self._primary_keys.update(primary_keys)
+            self._tables = tables
+            self.loaded_at = time.time()
+            self.refreshes += 1
+        return set(tables) if changed is None else changed | dropped
+
+    def ensure_loaded(self) -> "CatalogSnapshot":
+        with self._refresh_lock, query_priority("interactive"):
+            if self.loaded_at is None:
+                self._refresh(full=True)
+        return self
+
+    def start(self, interval: float = REFRESH_INTERVAL) -> None:
+        """Refresh incrementally in a daemon thread every `interval` seconds."""
+        with self._lock:
+            if self._thread is not None or interval <= 0:
+                return
+            self._thread = threading.Thread(
+                target=self._refresh_loop,
+                args=(interval,),
+                name=f"metadata-{self.catalog}",
+                daemon=True,
+            )
+        self._thread.start()
+
+    def _refresh_loop(self, interval: float) -> None:
+        while True:
+            time.sleep(interval)
+            try:
+                self.refresh()
+            except Exception:
+                logger.exception("Metadata refresh failed for %s", self.catalog)
+
+    # -- lookups --
+    def tables(self) -> pd.DataFrame:
+        with self._lock:
+            keys = list(self._tables)
+        rows = [k.split(".", 1) for k in keys]
+        return pd.DataFrame(rows, columns=["table_schema", "table_name"])
+
+    def columns(self, schema: str, table: str) -> pd.DataFrame:
+        with self._lock:
+            df = self._columns.get(f"{schema}.{table}")
+        return df if df is not None else pd.DataFrame(columns=_COLUMN_FIELDS)
+
+    def primary_keys(self, schema: str, table: str) -> List[str]:
+        with self._lock:
+            return list(self._primary_keys.get(f"{schema}.{table}", []))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "tables": len(self._tables),
+                "loaded_at": self.loaded_at,
+                "refreshes": self.refreshes,
+            }
+
+
+_snapshots_lock = threading.Lock()
+_snapshots: Dict[Tuple[str, Optional[str]], CatalogSnapshot] = {}
+
+
+def get_snapshot(catalog: str, schema: Optional[str] = None) -> CatalogSnapshot:
+    """Process-wide snapshot for a catalog/schema, loaded on first use."""
+    key = (catalog, schema if schema and schema.strip() else None)
+    with _snapshots_lock:
+        snapshot = _snapshots.get(key)
+        if snapshot is None:
+            snapshot = _snapshots[key] = CatalogSnapshot(*key)
+    snapshot.ensure_loaded()
+    snapshot.start()
+    return snapshot
@@ -1,30 +1,95 @@
+from typing import Dict, Tuple
+
 import streamlit as st
-from common import run_sql as sqlQuery
+from common import run_sql as sqlQuery, set_page
+from viz import density_bins, show_table
+from warmup import show_warehouse_state
 
 
 st.set_page_config(page_title="Taxi Fares", layout="wide")
+set_page("Taxi Fares")
+show_warehouse_state()
+
+TRIPS = "samples.nyctaxi.trips"
+DISTANCE_BIN = 0.25  # miles
+FARE_BIN = 1.0  # dollars
+
+
+@st.cache_data(ttl=3600)
+def getFareLookup() -> Dict[Tuple[int, int], float]:
+    # One aggregate over the whole table; lookups are then a dict access per keystroke
+    df = sqlQuery(
+        f"""
+        select pickup_zip, dropoff_zip, avg(fare_amount) as mean_fare
+        from {TRIPS}
+        where pickup_zip is not null and dropoff_zip is not null
+        group by pickup_zip, dropoff_zip
+        """,
+        ttl=86400,
+        stale_ttl=86400,
+    )
+    return {
+        (int(p), int(d)): float(f)
+        for p, d, f in zip(df["pickup_zip"], df["dropoff_zip"], df["mean_fare"])
+    }
 
 
-@st.cache_data(ttl=30)
-def getData():
-    return sqlQuery("select * from samples.nyctaxi.trips limit 5000")
+@st.cache_data(ttl=3600)
+def getFareDistribution():
+    # Bin distance/fare on the warehouse so the chart covers every trip while
+    # only a few thousand points are transferred.
+    return sqlQuery(
+        f"""
+        select
+          floor(trip_distance / {DISTANCE_BIN}) * {DISTANCE_BIN} as trip_distance,
+          floor(fare_amount / {FARE_BIN}) * {FARE_BIN} as fare_amount,
+          count(*) as trips
+        from {TRIPS}
+        where trip_distance >= 0 and fare_amount >= 0
+        group by 1, 2
+        """,
+        ttl=86400,
+        stale_ttl=86400,
+    )
+
+
+@st.cache_data(ttl=3600)
+def getSample():
+    query = f"select * from {TRIPS} limit 5000"
+    return sqlQuery(query, ttl=86400, arrow_dtypes=True, categorize=True)
 
 
-data = getData()
+def _zip(value: str) -> int:
+    try:
+        return int(value)
+    except ValueError:
+        return -1
+
 
 st.header("Taxi fare distribution")
 col1, col2 = st.columns([3, 1])
 with col1:
+    # The warehouse bins by fixed widths; coarsen further if that is still more
+    # points than the browser should draw
+    distribution, outliers = density_bins(
+        getFareDistribution(), "trip_distance", "fare_amount", weight="trips"
+    )
     st.scatter_chart(
-        data=data, height=400, width=700, y="fare_amount", x="trip_distance"
+        data=distribution,
+        height=400,
+        width=700,
+        y="fare_amount",
+        x="trip_distance",
+        size="trips",
     )
+    if outliers:
+        st.caption(f"{outliers:,.0f} trips with outlying distance or fare not shown")
 with col2:
     st.subheader("Predict fare")
     pickup = st.text_input("From (zipcode)", value="10003")
     dropoff = st.text_input("To (zipcode)", value="11238")
-    d = data[
-        (data["pickup_zip"] == int(pickup)) & (data["dropoff_zip"] == int(dropoff))
-    ]
-    st.write(f"# **${d['fare_amount'].mean() if len(d) > 0 else 99:.2f}**")
+    fare = getFareLookup().get((_zip(pickup), _zip(dropoff)), 99)
+    st.write(f"# **${fare:.2f}**")
 
-st.dataframe(data=data, height=600)
+if st.toggle("Show sample trips"):
+    show_table(getSample(), key="taxi_sample", height=600)
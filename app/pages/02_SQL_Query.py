@@ -1,8 +1,37 @@
+import os
+from typing import List
+
+import pyarrow as pa
 import streamlit as st
-from common import run_sql as sqlQuery
+from common import STREAM_MAX_BYTES, STREAM_MAX_ROWS, run_sql_stream, set_page
+from query_planner import (
+    EXPORT_MAX_BYTES,
+    EXPORT_MAX_ROWS,
+    FORMATS,
+    PREVIEW_ROWS,
+    export,
+    export_path,
+    plan_query,
+)
+from viz import VIZ_PAGE_ROWS, show_chart, show_table
+from warmup import show_warehouse_state
 
 
 st.set_page_config(page_title="SQL Query", layout="wide")
+# Ad-hoc statements queue behind the other pages' lookups
+set_page("SQL Query", priority="adhoc")
+show_warehouse_state()
+
+MODE_LABELS = {
+    "preview": "Preview (first rows)",
+    "sample": "Random sample (TABLESAMPLE)",
+    "as_written": "As written",
+}
+
+
+def _mb(n: float) -> str:
+    return f"{n / (1024 * 1024):,.1f} MB"
+
 
 st.title("Run a SQL query")
 with st.form("sql_form"):
@@ -14,16 +43,175 @@ with st.form("sql_form"):
     # Ensure type is str for type checkers
     if query is None:
         query = ""
+    col1, col2, col3, col4 = st.columns([2, 1, 1, 1])
+    with col1:
+        mode = st.radio(
+            "Rows to show",
+            options=list(MODE_LABELS),
+            format_func=MODE_LABELS.get,
+            horizontal=True,
+            help="Previews and samples are rewritten so they never read the whole "
+            "result; use the download below for everything.",
+        )
+    with col2:
+        preview_rows = st.number_input(
+            "Preview rows",
+            min_value=1,
+            max_value=STREAM_MAX_ROWS,
+            value=min(PREVIEW_ROWS, STREAM_MAX_ROWS),
+        )
+    with col3:
+        max_rows = st.number_input(
+            "Max rows", min_value=1, max_value=STREAM_MAX_ROWS, value=STREAM_MAX_ROWS
+        )
+    with col4:
+        max_mb = st.number_input(
+            "Max MB",
+            min_value=1,
+            max_value=STREAM_MAX_BYTES // (1024 * 1024),
+            value=STREAM_MAX_BYTES // (1024 * 1024),
+        )
     run = st.form_submit_button("Run query")
 
 if run:
     st.session_state["last_query"] = query
+    try:
+        plan = plan_query(query, mode=str(mode), preview_rows=int(preview_rows))
+    except ValueError as e:
+        st.error(str(e))
+        st.stop()
+    estimate = []
+    if plan.est_rows is not None:
+        estimate.append(f"~{plan.est_rows:,} rows")
+    if plan.est_bytes is not None:
+        estimate.append(f"~{_mb(plan.est_bytes)}")
+    if plan.mode == "preview":
+        applied = f"showing at most {plan.limit:,} rows"
+    elif plan.mode == "sample":
+        applied = (
+            f"showing a {plan.sample_percent}% sample, at most {plan.limit:,} rows"
+        )
+    else:
+        applied = "running as written"
+    st.caption(
+        f"Estimate: {', '.join(estimate) or 'unknown'}; {applied}. "
+        + " ".join(plan.notes)
+    )
+    too_big = plan.est_bytes is not None and plan.est_bytes > int(max_mb) * 1024 * 1024
+    if plan.mode == "as_written" and too_big:
+        st.warning(
+            f"The result is estimated at {_mb(plan.est_bytes)}; only the first "
+            f"{int(max_mb)} MB will be shown. Download it instead."
+        )
+    if plan.rewritten:
+        with st.expander("Statement run"):
+            st.code(plan.statement, language="sql")
+
+    stream = run_sql_stream(
+        plan.statement, max_rows=int(max_rows), max_bytes=int(max_mb) * 1024 * 1024
+    )
+    status = st.empty()
+    table_slot = st.empty()
+    batches: List[pa.Table] = []
+    next_render = 1
+    failed = False
     with st.spinner("Running query..."):
         try:
-            df = sqlQuery(query)
+            for batch in stream:
+                batches.append(batch)
+                # Re-render on a doubling schedule so the first rows show up at once;
+                # only the first page is sent while the rest streams in
+                if len(batches) >= next_render:
+                    head = pa.concat_tables(batches).slice(0, VIZ_PAGE_ROWS)
+                    table_slot.dataframe(head)
+                    status.caption(f"Fetched {stream.rows} rows so far...")
+                    next_render *= 2
         except Exception as e:
             st.error(f"Query failed: {e}")
-            df = None
-    if df is not None:
-        st.success(f"Returned {len(df)} rows")
-        st.dataframe(df)
+            failed = True
+    if not failed:
+        result = pa.concat_tables(batches) if batches else None
+        if result is not None:
+            with table_slot.container():
+                show_table(result, key="sql_result")
+        elif stream.schema is not None:
+            table_slot.dataframe(stream.schema.empty_table())
+        mb = stream.bytes / (1024 * 1024)
+        if stream.truncated:
+            status.warning(
+                f"Result truncated at {stream.rows} rows / {mb:.1f} MB. "
+                "Add a LIMIT or raise the budget to see more."
+            )
+        elif plan.rewritten:
+            status.info(
+                f"Returned {stream.rows} rows ({mb:.1f} MB) of a "
+                f"{'sample' if plan.mode == 'sample' else 'preview'}."
+            )
+        else:
+            status.success(f"Returned {stream.rows} rows ({mb:.1f} MB)")
+        if result is not None:
+            with st.expander("Chart"):
+                show_chart(result, key="sql_chart")
+
+
+# ---------- Download ----------
+@st.fragment
+def _download() -> None:
+    """Full result of the last query, streamed to a file in chunks."""
+    last_query = st.session_state.get("last_query")
+    if not last_query:
+        return
+    with st.expander("Download full result"):
+        st.caption(
+            f"Runs the query as written, up to {EXPORT_MAX_ROWS:,} rows / "
+            f"{_mb(EXPORT_MAX_BYTES)}, and writes it batch by batch."
+        )
+        fmt = st.selectbox("Format", list(FORMATS), format_func=str.upper)
+        exported = st.session_state.get("sql_export")
+        if st.button("Prepare file"):
+            if exported and os.path.exists(exported["path"]):
+                os.remove(exported["path"])
+            path = export_path(fmt)
+            progress = st.empty()
+            try:
+                stream = export(
+                    last_query,
+                    path,
+                    fmt,
+                    on_batch=lambda s: progress.caption(
+                        f"Written {s.rows:,} rows ({_mb(s.bytes)} of Arrow data)..."
+                    ),
+                )
+            except Exception as e:
+                os.remove(path)
+                st.session_state.pop("sql_export", None)
+                st.error(f"Export failed: {e}")
+                return
+            progress.empty()
+            exported = {
+                "path": path,
+                "format": fmt,
+                "query": last_query,
+                "rows": stream.rows,
+                "truncated": stream.truncated,
+            }
+            st.session_state["sql_export"] = exported
+        if not exported or exported["query"] != last_query:
+            return
+        if not os.path.exists(exported["path"]):
+            # Temp files do not survive a restart
+            st.session_state.pop("sql_export", None)
+            return
+        if exported["truncated"]:
+            st.warning(f"Export stopped at the budget: {exported['rows']:,} rows.")
+        size = os.path.getsize(exported["path"])
+        with open(exported["path"], "rb") as f:
+            st.download_button(
+                f"Download {exported['rows']:,} rows ({_mb(size)})",
+                data=f,
+                file_name=f"query_result.{exported['format']}",
+                mime=FORMATS[exported["format"]],
+            )
+
+
+_download()
@@ -1,336 +1,169 @@
+import copy
+import math
 import os
-from typing import List, Dict, Tuple, Any, Optional
+from typing import Any, Dict, List, Optional, Set, Tuple
 
 import pandas as pd
 import streamlit as st
 
+from bulk_import import BULK_MAX_ERRORS, get_stage, stage_file, submit_import
+from common import (
+    QueryGroup,
+    QueryHandle,
+    arrow_to_pandas,
+    invalidate_table,
+    run_sql_arrow,
+    set_page,
+    submit,
+)
 from common import run_sql as sqlQuery
+from conflicts import check_conflicts, pinned, row_key, table_version
+from editing import (
+    _row_hash_expr,
+    _sql_fqn,
+    _sql_ident,
+    _sql_param,
+    DeltaChanges,
+    changes_equal,
+    compute_changes_by_index,
+)
+from metadata import get_snapshot
+from row_identity import RowIndex, row_fingerprints
+from save_jobs import ACTIVE, SaveJob, get_save_jobs
+from warmup import show_warehouse_state
 
 st.set_page_config(page_title="Edit Data", layout="wide")
+set_page("Edit Data")
+show_warehouse_state()
+
+# Shared result-cache TTL (seconds); writes from this page invalidate table data
+DATA_TTL = 600
+# Seconds to wait for the row count and a page load before giving up
+COUNT_TIMEOUT = 120
+PAGE_TIMEOUT = 300
 
 
 # ---------- Helpers ----------
 @st.cache_data(ttl=30)
-def list_tables(catalog: str, schema: Optional[str] = None) -> pd.DataFrame:
-    where_schema = (
-        f"and table_schema = '{schema}'\n" if schema and len(schema.strip()) > 0 else ""
-    )
-    query = f"""
-    select table_schema, table_name
-    from `{catalog}`.information_schema.tables
-    where table_type = 'MANAGED'
-    {where_schema}order by table_schema, table_name
-    """
-    return sqlQuery(query)
+def count_rows(catalog: str, schema: str, table: str, version: Optional[int]) -> int:
+    fqn = pinned(_sql_fqn(catalog, schema, table), version)
+    df = sqlQuery(f"select count(*) as n from {fqn}", ttl=DATA_TTL)
+    return int(df["n"].iloc[0]) if df is not None and len(df) else 0
 
 
-@st.cache_data(ttl=30)
-def get_columns(catalog: str, schema: str, table: str) -> pd.DataFrame:
-    query = f"""
-    select column_name, data_type, is_nullable
-    from `{catalog}`.information_schema.columns
-    where table_schema = '{schema}' and table_name = '{table}'
-    order by ordinal_position
+def _keyset_column(order_cols: List[str]) -> Optional[str]:
     """
-    return sqlQuery(query)
-
-
-@st.cache_data(ttl=30)
-def get_primary_keys(catalog: str, schema: str, table: str) -> List[str]:
-    # Try to fetch PK columns from information_schema
-    query = f"""
-    select kcu.column_name
-    from `{catalog}`.information_schema.table_constraints tc
-    join `{catalog}`.information_schema.key_column_usage kcu
-      on tc.constraint_name = kcu.constraint_name
-     and tc.table_schema = kcu.table_schema
-     and tc.table_name = kcu.table_name
-    where tc.table_schema = '{schema}'
-      and tc.table_name = '{table}'
-      and tc.constraint_type = 'PRIMARY KEY'
-    order by kcu.ordinal_position
+    The column pages can be read by keyset (`> last value`) on: a single-column
+    PK. Keyless tables page by OFFSET instead: identical rows share a _row_hash,
+    so `_row_hash > :after` would skip the duplicates that straddle a page
+    boundary. OFFSET keeps them, since rows tied on the hash are the same row
+    whichever order the warehouse returns them in.
     """
-    try:
-        df = sqlQuery(query)
-        return df["column_name"].tolist() if df is not None and len(df) else []
-    except Exception:
-        # Unity Catalog may not return constraints for some tables; fall back to none
-        return []
+    if len(order_cols) == 1 and order_cols[0] != "_row_hash":
+        return order_cols[0]
+    return None
 
 
-@st.cache_data(ttl=30)
-def get_table_data(
-    catalog: str, schema: str, table: str, limit: int, columns_for_hash: List[str]
+def _load_table_page(
+    catalog: str,
+    schema: str,
+    table: str,
+    columns_for_hash: List[str],
+    order_cols: List[str],
+    page_size: int,
+    page: int,
+    version: Optional[int],
+    after: Any = None,
 ) -> pd.DataFrame:
-    fqn = f"`{catalog}`.`{schema}`.`{table}`"
-
-    # Build named_struct for stable row hashing on the server side
-    def _named_struct(cols: List[str], alias: str = "t") -> str:
-        parts = []
-        for c in cols:
-            parts.append(f"'{c}', {alias}.{_sql_ident(c)}")
-        return f"named_struct({', '.join(parts)})"
-
-    hash_expr = f"sha2(to_json({_named_struct(columns_for_hash)}), 256) as _row_hash"
-    query = f"select {hash_expr}, t.* from {fqn} t limit {int(limit)}"
-    return sqlQuery(query)
-
-
-def _sql_ident(name: str) -> str:
-    return f"`{name}`"
-
-
-def _sql_fqn(catalog: str, schema: str, table: str) -> str:
-    return f"`{catalog}`.`{schema}`.`{table}`"
-
-
-def _sql_literal(value: Any) -> str:
-    if pd.isna(value):
-        return "NULL"
-    if isinstance(value, bool):
-        return "TRUE" if value else "FALSE"
-    if isinstance(value, (int,)):
-        return str(value)
-    if isinstance(value, float):
-        if pd.isna(value) or pd.isnull(value):
-            return "NULL"
-        return "%r" % value
-    # Dates, timestamps, decimals and everything else as strings
-    s = str(value)
-    s = s.replace("'", "''")
-    return f"'{s}'"
-
-
-def _row_hash_expr(columns: List[str], table_alias: Optional[str] = None) -> str:
-    """Return Spark SQL expression that computes the row hash for given columns."""
-    alias = table_alias or ""
-    alias_prefix = f"{alias}." if alias else ""
-    parts = []
-    for c in columns:
-        parts.append(f"'{c}', {alias_prefix}{_sql_ident(c)}")
-    named = f"named_struct({', '.join(parts)})"
-    return f"sha2(to_json({named}), 256)"
-
-
-def compute_changes(
-    original: pd.DataFrame, edited: pd.DataFrame, key_cols: List[str]
-) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]], List[Dict[str, Any]]]:
-    """
-    Returns (inserts, updates, deletes) where each entry is a row dict of column->value.
-    Updates contain both key values and changed non-key columns.
     """
-    if not key_cols:
-        raise ValueError("Key columns must be specified to compute changes.")
-
-    # Ensure keys exist
-    for k in key_cols:
-        if k not in original.columns or k not in edited.columns:
-            raise ValueError(f"Key column '{k}' not present in data")
-
-    # Index by keys
-    orig_idxed = original.set_index(key_cols, drop=False)
-    edit_idxed = edited.set_index(key_cols, drop=False)
-
-    # Uniqueness check
-    if not orig_idxed.index.is_unique:
-        raise ValueError(
-            "Original data has duplicate key values. Please choose different key columns."
-        )
-    if not edit_idxed.index.is_unique:
-        raise ValueError(
-            "Edited data has duplicate key values. Please resolve duplicates before saving."
-        )
-
-    orig_keys = set(orig_idxed.index.tolist())
-    edit_keys = set(edit_idxed.index.tolist())
-
-    to_delete_keys = sorted(orig_keys - edit_keys)
-    to_insert_keys = sorted(edit_keys - orig_keys)
-    maybe_update_keys = sorted(orig_keys & edit_keys)
-
-    inserts: List[Dict[str, Any]] = []
-    updates: List[Dict[str, Any]] = []
-    deletes: List[Dict[str, Any]] = []
+    Load one page ordered by order_cols (the PK, or the row hash when there is none).
+    With a single-column PK and its last value on the previous page in `after`,
+    the page is read by keyset instead of OFFSET (see _keyset_column). Pages are read at the
+    Delta `version` the table was opened at, so saves can detect later changes.
 
-    # Inserts
-    for key in to_insert_keys:
-        row = edit_idxed.loc[key]
-        # When set_index with multiple keys and single match, row is Series
-        if isinstance(row, pd.Series):
-            inserts.append(row.to_dict())
-        else:
-            # Shouldn't happen due to uniqueness check
-            for _, r in row.iterrows():
-                inserts.append(r.to_dict())
-
-    # Deletes
-    for key in to_delete_keys:
-        row = orig_idxed.loc[key]
-        if isinstance(row, pd.Series):
-            deletes.append({k: row[k] for k in key_cols})
-        else:
-            for _, r in row.iterrows():
-                deletes.append({k: r[k] for k in key_cols})
-
-    # Updates
-    non_key_cols = [c for c in original.columns if c not in key_cols]
-    for key in maybe_update_keys:
-        o_row = orig_idxed.loc[key]
-        e_row = edit_idxed.loc[key]
-        if isinstance(o_row, pd.DataFrame) or isinstance(e_row, pd.DataFrame):
-            # Defensive; uniqueness should prevent this
-            o_row = o_row.iloc[0] if isinstance(o_row, pd.DataFrame) else o_row
-            e_row = e_row.iloc[0] if isinstance(e_row, pd.DataFrame) else e_row
-        changes = {}
-        for c in non_key_cols:
-            o_val = o_row[c]
-            e_val = e_row[c]
-            # Treat NaN == None
-            if pd.isna(o_val) and pd.isna(e_val):
-                continue
-            if (pd.isna(o_val) and not pd.isna(e_val)) or (
-                not pd.isna(o_val) and pd.isna(e_val)
-            ):
-                changes[c] = e_val
-            elif o_val != e_val:
-                changes[c] = e_val
-        if changes:
-            # Include keys
-            for k in key_cols:
-                changes[k] = e_row[k]
-            updates.append(changes)
-
-    return inserts, updates, deletes
-
-
-def compute_changes_by_index(
-    original: pd.DataFrame, edited: pd.DataFrame
-) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]], List[Dict[str, Any]]]:
-    """
-    Diff two DataFrames using their index as the row identifier (original row hash).
-    Returns (inserts, updates, deletes).
-    Each update dict contains a special key '__row_hash' with the original index value.
-    Each delete dict contains only '__row_hash'.
-    Inserts are full row dicts of the edited values.
+    Tables with a PK are read as plain `t.*` and fingerprinted on the client;
+    only tables without one still need the warehouse to hash (and sort) rows.
     """
-    if original.index.name is None:
-        original.index.name = "_row_hash"
-    if edited.index.name is None:
-        edited.index.name = "_row_hash"
-
-    # Ensure no duplicate indices
-    if not original.index.is_unique:
-        raise ValueError(
-            "Original data has duplicate synthetic keys; cannot compute diff."
-        )
-    if not edited.index.is_unique:
-        # Streamlit may produce duplicate indices for new rows; keep first occurrence
-        edited = edited[~edited.index.duplicated(keep="first")]
-
-    orig_keys = set(original.index.tolist())
-    edit_keys = set(edited.index.tolist())
-
-    to_delete_keys = sorted(orig_keys - edit_keys)
-    to_insert_keys = sorted(edit_keys - orig_keys)
-    maybe_update_keys = sorted(orig_keys & edit_keys)
-
-    inserts: List[Dict[str, Any]] = []
-    updates: List[Dict[str, Any]] = []
-    deletes: List[Dict[str, Any]] = []
-
-    # Inserts: take entire row values
-    for key in to_insert_keys:
-        row = edited.loc[key]
-        if isinstance(row, pd.Series):
-            inserts.append(row.to_dict())
-        else:
-            for _, r in row.iterrows():
-                inserts.append(r.to_dict())
-
-    # Deletes: only identifier
-    for key in to_delete_keys:
-        deletes.append({"__row_hash": key})
-
-    # Updates: compare non-index columns
-    non_index_cols = [c for c in original.columns]
-    for key in maybe_update_keys:
-        o_row = original.loc[key]
-        e_row = edited.loc[key]
-        if isinstance(o_row, pd.DataFrame) or isinstance(e_row, pd.DataFrame):
-            o_row = o_row.iloc[0] if isinstance(o_row, pd.DataFrame) else o_row
-            e_row = e_row.iloc[0] if isinstance(e_row, pd.DataFrame) else e_row
-        changes: Dict[str, Any] = {}
-        for c in non_index_cols:
-            o_val = o_row[c]
-            e_val = e_row[c]
-            if pd.isna(o_val) and pd.isna(e_val):
-                continue
-            if (pd.isna(o_val) and not pd.isna(e_val)) or (
-                not pd.isna(o_val) and pd.isna(e_val)
-            ):
-                changes[c] = e_val
-            elif o_val != e_val:
-                changes[c] = e_val
-        if changes:
-            changes["__row_hash"] = key
-            updates.append(changes)
+    fqn = pinned(_sql_fqn(catalog, schema, table), version)
+    row_hash = _row_hash_expr(columns_for_hash, table_alias="t")
+
+    def _order_expr(c: str) -> str:
+        return row_hash if c == "_row_hash" else f"t.{_sql_ident(c)}"
+
+    order_sql = ", ".join(_order_expr(c) for c in order_cols)
+    where_sql = ""
+    offset_sql = ""
+    params: Dict[str, Any] = {}
+    if after is not None and _keyset_column(order_cols) is not None:
+        # Bound, so every keyset page of a table shares one statement text
+        params["after"] = _sql_param(after)
+        where_sql = f" where {_order_expr(order_cols[0])} > :after"
+    elif page > 0:
+        offset_sql = f" offset {int(page) * int(page_size)}"
+    tail_sql = f"{where_sql} order by {order_sql} limit {int(page_size)}{offset_sql}"
+    # Saves through editing.apply_changes_* invalidate these entries explicitly
+    if "_row_hash" in order_cols:
+        query = f"select {row_hash} as _row_hash, t.* from {fqn} t{tail_sql}"
+        return sqlQuery(query, ttl=DATA_TTL, parameters=params)
+    arrow = run_sql_arrow(
+        f"select t.* from {fqn} t{tail_sql}", ttl=DATA_TTL, parameters=params
+    )
+    fingerprints, _ = row_fingerprints(arrow, columns_for_hash)
+    # Another session may hold the same table (single flight); don't free it
+    df = arrow_to_pandas(arrow, self_destruct=False)
+    df.insert(0, "_row_hash", fingerprints)
+    return df
+
 
-    return inserts, updates, deletes
+def _page_cache() -> Dict[Tuple[str, int], QueryHandle]:
+    return st.session_state.setdefault("edit_page_cache", {})
 
 
-def apply_changes(
+def fetch_page(
+    table_key: str,
     catalog: str,
     schema: str,
     table: str,
-    columns: List[str],
-    key_cols: List[str],
-    inserts: List[Dict[str, Any]],
-    updates: List[Dict[str, Any]],
-    deletes: List[Dict[str, Any]],
-) -> None:
-    fqn = _sql_fqn(catalog, schema, table)
-
-    # Inserts
-    if inserts:
-        cols_sql = ", ".join(_sql_ident(c) for c in columns)
-        for row in inserts:
-            vals_sql = ", ".join(_sql_literal(row.get(c)) for c in columns)
-            sqlQuery(f"INSERT INTO {fqn} ({cols_sql}) VALUES ({vals_sql})")
-
-    # Updates
-    if updates:
-        non_key_cols = [c for c in columns if c not in key_cols]
-        for row in updates:
-            set_exprs = []
-            for c in non_key_cols:
-                if c in key_cols:
-                    continue
-                if c in row:
-                    set_exprs.append(f"{_sql_ident(c)} = {_sql_literal(row[c])}")
-            if not set_exprs:
-                continue
-            where_exprs = []
-            for k in key_cols:
-                v = row[k]
-                if pd.isna(v):
-                    where_exprs.append(f"{_sql_ident(k)} IS NULL")
-                else:
-                    where_exprs.append(f"{_sql_ident(k)} = {_sql_literal(v)}")
-            sqlQuery(
-                f"UPDATE {fqn} SET {', '.join(set_exprs)} WHERE {' AND '.join(where_exprs)}"
-            )
+    columns_for_hash: List[str],
+    order_cols: List[str],
+    page_size: int,
+    page: int,
+    version: Optional[int],
+) -> QueryHandle:
+    """Return the (possibly still running) load of a page, submitting it if needed."""
+    cache = _page_cache()
+    fut = cache.get((table_key, page))
+    if fut is not None and not (fut.done() and fut.exception() is not None):
+        return fut
+    after = None
+    prev = cache.get((table_key, page - 1))
+    prev_ok = prev is not None and prev.done() and prev.exception() is None
+    keyset = _keyset_column(order_cols)
+    if keyset is not None and prev_ok:
+        prev_df = prev.result()
+        if len(prev_df):
+            after = prev_df[keyset].iloc[-1]
+    fut = submit(
+        _load_table_page,
+        catalog,
+        schema,
+        table,
+        columns_for_hash,
+        order_cols,
+        page_size,
+        page,
+        version,
+        after,
+    )
+    cache[(table_key, page)] = fut
+    return fut
+
 
-    # Deletes
-    if deletes:
-        for row in deletes:
-            where_exprs = []
-            for k in key_cols:
-                v = row[k]
-                if pd.isna(v):
-                    where_exprs.append(f"{_sql_ident(k)} IS NULL")
-                else:
-                    where_exprs.append(f"{_sql_ident(k)} = {_sql_literal(v)}")
-            sqlQuery(f"DELETE FROM {fqn} WHERE {' AND '.join(where_exprs)}")
+def drop_pages(table_key: str, keep: Optional[Set[int]] = None) -> None:
+    cache = _page_cache()
+    for key in [k for k in cache if k[0] == table_key]:
+        if keep is None or key[1] not in keep:
+            cache.pop(key)
 
 
 # ---------- UI ----------
@@ -343,9 +176,10 @@ if not catalog:
     st.error("CATALOG_NAME environment variable is not set. Add it to your .env file.")
     st.stop()
 
-# Table selection
+# Table selection; tables, columns and keys come from a shared in-memory snapshot
 try:
-    tables_df = list_tables(catalog, fixed_schema)
+    snapshot = get_snapshot(catalog, fixed_schema)
+    tables_df = snapshot.tables()
 except Exception as e:
     st.error(f"Failed to list tables for catalog '{catalog}': {e}")
     st.stop()
@@ -376,15 +210,104 @@ if "." not in selected_qualified:
     st.stop()
 schema, table = selected_qualified.split(".", 1)
 
-limit = st.number_input("Row limit", min_value=10, max_value=10000, value=500, step=10)
+table_id = f"{catalog}.{schema}.{table}"
+# Loaded pages and unsaved edits are keyed by (table_id, page number)
+pending: Dict[Tuple[str, int], pd.DataFrame] = st.session_state.setdefault(
+    "edit_pending_pages", {}
+)
+has_pending = any(k == table_id for (k, _) in pending)
+
+# Edits are tracked by position within their page, so the page size is held
+# while the table has unsaved edits
+page_size = int(
+    st.number_input(
+        "Rows per page",
+        min_value=10,
+        max_value=10000,
+        value=500,
+        step=10,
+        key=f"edit_page_size:{table_id}",
+        disabled=has_pending,
+        help="Save or reload to change the page size" if has_pending else None,
+    )
+)
+page_sizes: Dict[str, int] = st.session_state.setdefault("edit_page_sizes", {})
+if page_sizes.get(table_id, page_size) != page_size:
+    # Page numbers now cover other rows; loaded pages are of no use
+    drop_pages(table_id)
+page_sizes[table_id] = page_size
+
+cols_df = snapshot.columns(schema, table)
+all_columns: List[str] = cols_df["column_name"].tolist()
+detected_pk = snapshot.primary_keys(schema, table)
+
+page = int(st.number_input("Page", min_value=1, value=1)) - 1
 
-with st.spinner("Loading table metadata and data..."):
-    cols_df = get_columns(catalog, schema, table)
-    all_columns: List[str] = (
-        cols_df["column_name"].tolist() if cols_df is not None else []
+order_cols = detected_pk or ["_row_hash"]
+baselines: Dict[Tuple[str, int], pd.DataFrame] = st.session_state.setdefault(
+    "edit_baselines", {}
+)
+editor_gen: Dict[Tuple[str, int], int] = st.session_state.setdefault(
+    "edit_editor_gen", {}
+)
+# Edits are tracked as data_editor deltas: those of the live editor per page, and
+# those of earlier editors on the page folded into a DeltaChanges
+deltas: Dict[Tuple[str, int], Dict[str, Any]] = st.session_state.setdefault(
+    "edit_deltas", {}
+)
+trackers: Dict[Tuple[str, int], DeltaChanges] = st.session_state.setdefault(
+    "edit_trackers", {}
+)
+touched_pages = {p for (k, p) in pending if k == table_id}
+
+# Optimistic concurrency: pages are read at the table version current when the
+# table was opened; saves check what changed since (see conflicts.py)
+versions: Dict[str, Optional[int]] = st.session_state.setdefault("edit_versions", {})
+if table_id not in versions:
+    drop_pages(table_id)
+    versions[table_id] = table_version(catalog, schema, table)
+version = versions[table_id]
+
+# Our own save jobs keep the pin until they finish and re-pin to their version;
+# meanwhile the editor is read-only so no edit is based on the pre-save rows
+save_jobs = get_save_jobs()
+own_jobs: Set[str] = st.session_state.setdefault("edit_own_jobs", set())
+saving = any(
+    j.status in ACTIVE and j.id in own_jobs
+    for j in save_jobs.jobs(catalog, schema, table)
+)
+
+# Keep a small window of pages around the current one, plus every edited page
+drop_pages(table_id, keep={page - 1, page, page + 1} | touched_pages)
+
+
+def _fetch(p: int) -> QueryHandle:
+    return fetch_page(
+        table_id,
+        catalog,
+        schema,
+        table,
+        all_columns,
+        order_cols,
+        page_size,
+        p,
+        version,
     )
-    detected_pk = get_primary_keys(catalog, schema, table)
-    data = get_table_data(catalog, schema, table, limit, all_columns)
+
+
+# The row count and the page are independent; load them side by side.
+# Navigating away mid-load raises out of wait() and the group cancels the rest.
+loading = st.empty()
+with st.spinner("Loading page..."):
+    with QueryGroup(timeout=COUNT_TIMEOUT) as group:
+        group.submit(count_rows, catalog, schema, table, version)
+        page_handle = _fetch(page)
+        (total_rows,) = group.wait(heartbeat=loading.empty)
+    data = page_handle.result(timeout=PAGE_TIMEOUT)
+n_pages = max(1, math.ceil(total_rows / page_size))
+st.caption(f"Page {page + 1} of {n_pages} ({total_rows} rows)")
+if page + 1 < n_pages:
+    _fetch(page + 1)  # prefetch in the background
 
 if data is None:
     st.warning("No data returned.")
@@ -394,92 +317,220 @@ if data is None:
 if "_row_hash" in data.columns:
     data = data.set_index("_row_hash", drop=True)
 
-st.caption(
-    f"Editing: `{catalog}`.`{schema}`.`{table}` — using content-hash for row identity (no PK required)"
-)
+if detected_pk:
+    st.caption(
+        f"Editing: `{catalog}`.`{schema}`.`{table}` — saving by primary key ({', '.join(detected_pk)})"
+    )
+else:
+    st.caption(
+        f"Editing: `{catalog}`.`{schema}`.`{table}` — using content-hash for row identity (no PK required)"
+    )
 
-# Keep a copy of original for diffing
-original_df = data.copy()
+# The loaded page stays untouched as the original for diffing
+original_df = data
+
+# Returning to a page with unsaved edits starts a fresh editor on top of them;
+# while the page stays selected the editor input must not change between runs.
+page_key = (table_id, page)
+if st.session_state.get("edit_current_page") != page_key:
+    st.session_state["edit_current_page"] = page_key
+    if page_key in deltas:
+        # The previous editor on this page is gone; keep its deltas
+        tracker = trackers.setdefault(page_key, DeltaChanges(original_df))
+        tracker.apply(deltas.pop(page_key), pending[page_key])
+    editor_gen[page_key] = editor_gen.get(page_key, 0) + 1
+    baselines[page_key] = pending.get(page_key, original_df)
+editor_key = f"editor:{table_id}:{page}:{editor_gen[page_key]}"
 
 st.subheader("Data editor")
 edited_df = st.data_editor(
-    data,
-    num_rows="dynamic",  # allow adds
+    baselines.get(page_key, original_df),
+    num_rows="fixed" if saving else "dynamic",  # allow adds
     height=500,
     hide_index=True,
+    disabled=saving,
+    key=editor_key,
+)
+if saving:
+    st.caption("Editing resumes once your save job finishes.")
+editor_state = st.session_state.get(editor_key) or {}
+has_edits = any(
+    editor_state.get(k) for k in ("edited_rows", "added_rows", "deleted_rows")
 )
+if page_key in pending or has_edits:
+    pending[page_key] = edited_df
+    touched_pages.add(page)
+if has_edits:
+    deltas[page_key] = copy.deepcopy(
+        {k: editor_state.get(k) for k in ("edited_rows", "added_rows", "deleted_rows")}
+    )
+
+if touched_pages:
+    st.caption(
+        f"Unsaved edits on page(s): {', '.join(str(p + 1) for p in sorted(touched_pages))}"
+    )
 
 colA, colB = st.columns([1, 3])
 with colA:
     refresh = st.button("Reload data", type="secondary")
 with colB:
-    save = st.button("Save changes", type="primary")
+    save = st.button("Save changes", type="primary", disabled=saving)
+verify = st.checkbox(
+    "Verify against a full diff of the loaded pages (slower)",
+    value=False,
+    help="Compare the change set built from editor deltas with a row-by-row diff",
+)
+
+
+def _forget_edits(repin: bool = True) -> None:
+    drop_pages(table_id)
+    for key in [k for k in pending if k[0] == table_id]:
+        pending.pop(key, None)
+        baselines.pop(key, None)
+        deltas.pop(key, None)
+        trackers.pop(key, None)
+    if repin:
+        versions.pop(table_id, None)
+    st.session_state.pop("edit_conflicts", None)
+    st.session_state.pop("edit_current_page", None)
+
 
 if refresh:
-    list_tables.clear()
-    get_columns.clear()
-    get_primary_keys.clear()
-    get_table_data.clear()
+    invalidate_table(catalog, schema, table)
+    snapshot.refresh(full=True)
+    count_rows.clear()
+    _forget_edits()
     st.rerun()
 
-if save:
+
+# ---------- Save jobs ----------
+def _render_save_jobs() -> None:
+    jobs = save_jobs.jobs(catalog, schema, table)
+    if not jobs:
+        return
+    finished = {j.id for j in jobs if j.status not in ACTIVE}
+    seen: Set[str] = st.session_state.setdefault("edit_seen_jobs", set(finished))
+    if finished - seen:
+        # A save landed since the last run: reload pages that have no local edits
+        landed = [j for j in jobs if j.id in finished - seen and j.status == "done"]
+        seen |= finished
+        if landed:
+            count_rows.clear()
+            drop_pages(table_id, keep=touched_pages)
+            if all(j.id in own_jobs and j.version is not None for j in landed):
+                # Only our own commits landed: re-pin past them so they are never
+                # reported as conflicts with edits made since
+                versions[table_id] = max(j.version for j in landed)
+            elif not touched_pages:
+                # Nothing is based on the old version any more; read the new one
+                versions.pop(table_id, None)
+            st.rerun(scope="app")
+    st.subheader("Save jobs")
+    for job in jobs:
+        p = job.progress()
+        label = (
+            f"{p['status']}: {p['statements_done']}/{p['statements_total']} statements, "
+            f"{p['rows_affected']} rows affected, {p['elapsed']:.1f}s"
+        )
+        if job.status in ACTIVE:
+            total = max(1, p["statements_total"])
+            st.progress(p["statements_done"] / total, text=label)
+        elif job.status == "done":
+            st.caption(f"Job {job.id} {label}")
+        else:
+            col1, col2 = st.columns([4, 1])
+            col1.error(f"Job {job.id} {label}. {p['error']}")
+            if col2.button("Resume", key=f"resume:{job.id}"):
+                save_jobs.resume(job.id)
+                st.rerun()
+        with st.expander(f"Job {job.id}: statement timings"):
+            st.dataframe(pd.DataFrame(job.report()))
+
+
+if st.session_state.get("edit_save_message"):
+    st.success(st.session_state.pop("edit_save_message"))
+
+# Poll while a job for this table is still queued or running
+_has_active = any(j.status in ACTIVE for j in save_jobs.jobs(catalog, schema, table))
+st.fragment(run_every=1.0 if _has_active else None)(_render_save_jobs)()
+
+# ---------- Conflicts ----------
+conflict_state = st.session_state.get("edit_conflicts")
+if conflict_state and conflict_state[0] == table_id:
+    st.error(
+        "Not saved: other sessions changed rows you edited since you opened the "
+        "table. Reload to start from the current data, or overwrite their changes."
+    )
+    st.dataframe(pd.DataFrame(conflict_state[1]), hide_index=True)
+    st.button(
+        "Overwrite and save",
+        on_click=lambda: st.session_state.update(edit_force_save=True),
+    )
+
+force = st.session_state.pop("edit_force_save", False)
+if save or force:
     try:
-        inserts, updates, deletes = compute_changes_by_index(original_df, edited_df)
+        # Turn the recorded editor deltas into a change set; the cost follows the
+        # number of edits, not the number of loaded rows
+        inserts: List[Dict[str, Any]] = []
+        updates: List[Dict[str, Any]] = []
+        deletes: List[Dict[str, Any]] = []
+        # Loaded values of every keyed row we update or delete, for conflict checks
+        originals: Dict[Tuple[Any, ...], Dict[str, Any]] = {}
+        for p in sorted(touched_pages):
+            key = (table_id, p)
+            base = _fetch(p).result().set_index("_row_hash", drop=True)
+            edited_page = pending[key]
+            tracker = trackers.get(key, DeltaChanges(base)).copy()
+            if key in deltas:
+                tracker.apply(deltas[key], edited_page)
+            i, u, d = tracker.changes()
+            if verify and not changes_equal(
+                (i, u, d), compute_changes_by_index(base, edited_page)
+            ):
+                raise RuntimeError(
+                    f"Editor deltas and the full diff disagree on page {p + 1}; "
+                    "nothing was saved. Reload the data and edit again."
+                )
+            if detected_pk:
+                for r in u + d:
+                    loaded = base.loc[r["__row_hash"]].to_dict()
+                    originals[row_key(loaded, detected_pk)] = loaded
+                # Match on the primary key so writes can skip files, not on a hash
+                i, u, d = RowIndex(base).rekey(edited_page, i, u, d, detected_pk)
+            inserts += i
+            updates += u
+            deletes += d
+
+        report = None
+        if not force and any([inserts, updates, deletes]):
+            # Reads only the rows changed since `version` that this save touches
+            report = check_conflicts(
+                catalog,
+                schema,
+                table,
+                all_columns,
+                version,
+                inserts,
+                updates,
+                deletes,
+                key_cols=detected_pk or None,
+                originals=originals,
+            )
+            if not report.ok:
+                st.session_state["edit_conflicts"] = (table_id, report.conflicts)
+                st.rerun()
+            if report.already_deleted:
+                gone = {row_key(r, detected_pk) for r in report.already_deleted}
+                deletes = [r for r in deletes if row_key(r, detected_pk) not in gone]
 
         if not any([inserts, updates, deletes]):
             st.info("No changes to save.")
         else:
-            with st.spinner("Applying changes..."):
-                # Apply by content-hash matching
-                def apply_changes_by_rowhash(
-                    catalog: str,
-                    schema: str,
-                    table: str,
-                    columns: List[str],
-                    inserts: List[Dict[str, Any]],
-                    updates: List[Dict[str, Any]],
-                    deletes: List[Dict[str, Any]],
-                ) -> None:
-                    fqn = _sql_fqn(catalog, schema, table)
-                    # Inserts
-                    if inserts:
-                        cols_sql = ", ".join(_sql_ident(c) for c in columns)
-                        for row in inserts:
-                            vals_sql = ", ".join(
-                                _sql_literal(row.get(c)) for c in columns
-                            )
-                            sqlQuery(
-                                f"INSERT INTO {fqn} ({cols_sql}) VALUES ({vals_sql})"
-                            )
-
-                    # Updates
-                    if updates:
-                        settable_cols = columns
-                        rowhash_sql = _row_hash_expr(columns, table_alias="t")
-                        for row in updates:
-                            set_exprs = []
-                            for c in settable_cols:
-                                if c in row:
-                                    set_exprs.append(
-                                        f"{_sql_ident(c)} = {_sql_literal(row[c])}"
-                                    )
-                            if not set_exprs:
-                                continue
-                            rh = row["__row_hash"]
-                            sqlQuery(
-                                f"UPDATE {fqn} t SET {', '.join(set_exprs)} WHERE {rowhash_sql} = '{rh}'"
-                            )
-
-                    # Deletes
-                    if deletes:
-                        rowhash_sql = _row_hash_expr(columns, table_alias="t")
-                        for row in deletes:
-                            rh = row["__row_hash"]
-                            sqlQuery(
-                                f"DELETE FROM {fqn} t WHERE {rowhash_sql} = '{rh}'"
-                            )
-
-                apply_changes_by_rowhash(
+            # The statements run on a background worker; the job outlives this
+            # session and can be resumed from the batch that failed
+            job = save_jobs.submit(
+                SaveJob.build(
                     catalog=catalog,
                     schema=schema,
                     table=table,
@@ -487,12 +538,79 @@ if save:
                     inserts=inserts,
                     updates=updates,
                     deletes=deletes,
+                    key_cols=detected_pk or None,
                 )
-            # Clear caches and reload
-            get_table_data.clear()
-            st.success(
-                f"Saved: +{len(inserts)} inserts, {len(updates)} updates, -{len(deletes)} deletes"
+            )
+            own_jobs.add(job.id)
+            # Pages are re-read at the pinned version until the job lands
+            _forget_edits(repin=False)
+            merged = ""
+            if report is not None and report.status == "merged":
+                merged = f", merged with {report.merged} concurrent change(s)"
+            st.session_state["edit_save_message"] = (
+                f"Saving in the background: +{len(inserts)} inserts, "
+                f"{len(updates)} updates, -{len(deletes)} deletes (job {job.id}{merged})"
             )
             st.rerun()
     except Exception as e:
         st.error(f"Failed to save changes: {e}")
+
+
+# ---------- Bulk import ----------
+with st.expander("Bulk import"):
+    stage = get_stage()
+    if stage is None:
+        st.caption("Set BULK_STAGE_PATH to a volume directory to enable bulk import.")
+        st.stop()
+    st.caption(
+        "Loads a CSV or Parquet file in one statement. The file is checked against "
+        "the table's column types first and staged as Parquet; nothing is written "
+        "if any row is invalid."
+    )
+    uploaded = st.file_uploader(
+        "CSV or Parquet file", type=["csv", "parquet"], key=f"bulk_file:{table_id}"
+    )
+    modes = {"append": "Append (COPY INTO)"}
+    if detected_pk:
+        modes["upsert"] = f"Upsert by key ({', '.join(detected_pk)}) (MERGE)"
+    import_mode = st.radio(
+        "Load as", options=list(modes), format_func=modes.get, horizontal=True
+    )
+    if uploaded is not None and st.button("Validate and load"):
+        fmt = "parquet" if uploaded.name.lower().endswith(".parquet") else "csv"
+        progress = st.progress(0.0, text="Validating...")
+        size = max(1, uploaded.size)
+        try:
+            staged = stage_file(
+                uploaded,
+                fmt,
+                cols_df,
+                stage,
+                on_progress=lambda rows, read: progress.progress(
+                    min(1.0, read / size), text=f"Validated and staged {rows:,} rows"
+                ),
+            )
+        except Exception as e:
+            progress.empty()
+            st.error(f"Could not read the file: {e}")
+            st.stop()
+        progress.empty()
+        if staged.errors:
+            capped = len(staged.errors) >= BULK_MAX_ERRORS
+            st.error(
+                "Not loaded: the file does not match the table"
+                + (f" (first {BULK_MAX_ERRORS} problems shown)." if capped else ".")
+            )
+            st.dataframe(pd.DataFrame(staged.errors), hide_index=True)
+        else:
+            job = submit_import(
+                staged,
+                catalog,
+                schema,
+                table,
+                key_cols=detected_pk if import_mode == "upsert" else None,
+            )
+            st.session_state["edit_save_message"] = (
+                f"Loading {staged.rows:,} rows in the background (job {job.id})"
+            )
+            st.rerun()
@@ -0,0 +1,101 @@
+import json
+
+import pandas as pd
+import streamlit as st
+
+from common import (
+    clear_query_events,
+    pool_stats,
+    query_events,
+    result_cache_stats,
+    scheduler_stats,
+    set_page,
+    single_flight_stats,
+)
+from viz import show_table
+from warmup import get_warmer, show_warehouse_state
+
+st.set_page_config(page_title="Performance", layout="wide")
+set_page("Performance")
+show_warehouse_state()
+
+PERCENTILES = {"p50": 0.5, "p95": 0.95, "p99": 0.99}
+
+
+def latency_table(events: pd.DataFrame, by: list) -> pd.DataFrame:
+    grouped = events.groupby(by, dropna=False)
+    out = grouped.agg(
+        queries=("total_ms", "size"),
+        errors=("error", "count"),
+        rows=("rows", "sum"),
+        mb=("bytes", lambda b: b.sum() / (1024 * 1024)),
+        cache_hits=("cache", lambda c: c.isin(["hit", "stale"]).sum()),
+        shared=("shared", "sum"),
+    )
+    for name, q in PERCENTILES.items():
+        out[f"{name}_ms"] = grouped["total_ms"].quantile(q)
+    return out.sort_values("p95_ms", ascending=False).reset_index()
+
+
+st.title("Query performance")
+st.caption(
+    "Events recorded by this app process since it started (bounded ring buffer)."
+)
+
+events = query_events()
+if not events:
+    st.info("No queries recorded yet. Use the other pages, then come back.")
+    st.stop()
+
+df = pd.DataFrame(events)
+phases = pd.json_normalize(df["phases"]).add_suffix("_ms")
+df = pd.concat([df.drop(columns=["phases"]), phases], axis=1)
+df["page"] = df["page"].fillna("(none)")
+
+col1, col2, col3, col4 = st.columns(4)
+col1.metric("Queries", len(df))
+col2.metric("p95 latency", f"{df['total_ms'].quantile(0.95):.0f} ms")
+col3.metric("Errors", int(df["error"].notna().sum()))
+cache_stats = result_cache_stats()
+col4.metric("Result cache hit rate", f"{cache_stats.get('hit_rate', 0.0):.0%}")
+
+st.subheader("By query fingerprint")
+by_fp = latency_table(df, ["fingerprint"])
+sql_text = df.drop_duplicates("fingerprint").set_index("fingerprint")["sql"]
+by_fp["sql"] = by_fp["fingerprint"].map(sql_text)
+st.dataframe(by_fp, hide_index=True)
+
+st.subheader("By page")
+st.dataframe(latency_table(df, ["page"]), hide_index=True)
+
+st.subheader("Mean phase time by page (ms)")
+if len(phases.columns):
+    st.bar_chart(df.groupby("page")[list(phases.columns)].mean())
+
+with st.expander("Scheduler, connection pool, result cache and warehouse"):
+    st.json(
+        {
+            "scheduler": scheduler_stats(),
+            "pool": pool_stats(),
+            "result_cache": cache_stats,
+            "single_flight": single_flight_stats(),
+            "warehouse": get_warmer().status(),
+        }
+    )
+
+with st.expander("Recent events"):
+    recent = df.sort_values("ts", ascending=False)
+    show_table(recent, key="perf_events", hide_index=True)
+
+colA, colB = st.columns([1, 3])
+with colA:
+    st.download_button(
+        "Export JSONL",
+        data="\n".join(json.dumps(e, default=str) for e in events),
+        file_name="query_events.jsonl",
+        mime="application/json",
+    )
+with colB:
+    if st.button("Clear events"):
+        clear_query_events()
+        st.rerun()
@@ -0,0 +1,264 @@
+"""
+Guardrails for ad-hoc SQL (SQL Query page).
+
+plan_query() inspects a statement, asks the warehouse for a cost estimate
+(EXPLAIN COST reads statistics, not data) and rewrites previews so they cannot
+pull a whole table: a LIMIT around the query, or TABLESAMPLE on the only table
+of a plain scan. export() writes a full result to Parquet or CSV batch by batch,
+straight from Arrow, so large downloads never go through pandas.
+"""
+
+import os
+import re
+import tempfile
+from typing import Any, Callable, List, Optional, Tuple
+
+from common import STREAM_BATCH_ROWS, ArrowStream, run_sql as sqlQuery, run_sql_stream
+from result_cache import is_read_query
+
+# Rows shown by a preview when the query has no smaller LIMIT of its own
+PREVIEW_ROWS = int(os.getenv("SQL_PREVIEW_ROWS", "10000"))
+# Budget for "download full result"
+EXPORT_MAX_ROWS = int(os.getenv("SQL_EXPORT_MAX_ROWS", "50000000"))
+EXPORT_MAX_BYTES = int(os.getenv("SQL_EXPORT_MAX_BYTES", str(4 * 1024**3)))
+EXPORT_DIR = os.getenv(
+    "SQL_EXPORT_DIR", os.path.join(tempfile.gettempdir(), "streamlit_sql_exports")
+)
+ESTIMATE_TTL = 300
+
+MODES = ("preview", "sample", "as_written")
+FORMATS = {"parquet": "application/vnd.apache.parquet", "csv": "text/csv"}
+
+# Quoted text and comments; masked before the statement is inspected
+_TOKENS = re.compile(
+    r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"|`[^`]*`|--[^\n]*|/\*.*?\*/", re.S
+)
+_IDENT = r"(?:`[^`]+`|[\w$]+)"
+_NAME = rf"{_IDENT}(?:\s*\.\s*{_IDENT})*"
+_TOP_LIMIT = re.compile(r"\blimit\s+(\d+)(?:\s+offset\s+\d+)?\s*;?\s*$", re.I)
+_SCAN = re.compile(
+    rf"^\s*select\s+(?P<cols>.+?)\s+from\s+(?P<table>{_NAME})(?P<rest>\s.*)?;?\s*$",
+    re.I | re.S,
+)
+# Anything that makes a sample of the base table a different query than a
+# sample of the result
+_NOT_SCAN = re.compile(
+    r"\b(join|group\s+by|having|union|intersect|except|minus|window|qualify|"
+    r"lateral|pivot|unpivot|distinct|tablesample)\b",
+    re.I,
+)
+# `from a, b` (implicit join), with or without an alias for a
+_IMPLICIT_JOIN = re.compile(r"^\s*(?:(?:as\s+)?\w+\s*)?,", re.I)
+_WRAPPABLE = ("select", "with", "values", "(")
+_STATS = re.compile(
+    r"Statistics\(sizeInBytes=([\d.]+)\s*([KMGTPE]i)?B(?:,\s*rowCount=([\d.E+]+))?"
+)
+_UNITS = {None: 1, "Ki": 1024, "Mi": 1024**2, "Gi": 1024**3, "Ti": 1024**4}
+_UNITS.update({"Pi": 1024**5, "Ei": 1024**6})
+# Spark reports Long.MaxValue (8.0 EiB) when it knows nothing about the size
+_UNKNOWN_BYTES = 8 * 1024**6
+
+
+def _mask(query: str) -> str:
+    """
+    Same-length copy of `query` with comments and quoted text blanked and the
+    inside of parentheses blanked, so regexes see only the top level and match
+    offsets still point into the original text.
+    """
+    out = list(query)
+    for m in _TOKENS.finditer(query):
+        start, end = m.span()
+        token = m.group()
+        if token.startswith(("--", "/*")):
+            out[start:end] = " " * (end - start)
+        elif token[0] in "'\"`":
+            out[start + 1 : end - 1] = "_" * (end - start - 2)
+    depth = 0
+    for i, c in enumerate(out):
+        if c == "(":
+            depth += 1
+            if depth > 1:
+                out[i] = " "
+        elif c == ")":
+            depth -= 1
+            if depth > 0:
+                out[i] = " "
+        elif depth > 0:
+            out[i] = " "
+    return "".join(out)
+
+
+def statement_count(query: str) -> int:
+    masked = _mask(query)
+    return sum(1 for part in masked.split(";") if part.strip())
+
+
+def top_level_limit(query: str) -> Optional[int]:
+    m = _TOP_LIMIT.search(_mask(query))
+    return int(m.group(1)) if m else None
+
+
+def scanned_table(query: str) -> Optional[Tuple[int, int]]:
+    """Span of the table name when the query is a plain single-table scan."""
+    masked = _mask(query)
+    m = _SCAN.match(masked)
+    if not m:
+        return None
+    cols, rest = m.group("cols"), m.group("rest") or ""
+    # A call in the select list may be an aggregate
+    if "(" in cols or _NOT_SCAN.search(cols):
+        return None
+    if _NOT_SCAN.search(rest) or _IMPLICIT_JOIN.match(rest):
+        return None
+    return m.span("table")
+
+
+def estimate(query: str) -> Tuple[Optional[int], Optional[int]]:
+    """(rows, bytes) of the result according to EXPLAIN COST; None when unknown."""
+    try:
+        plan = sqlQuery(f"EXPLAIN COST {query}", ttl=ESTIMATE_TTL)
+    except Exception:
+        return None, None
+    text = "\n".join(str(v) for v in plan.iloc[:, 0]) if len(plan) else ""
+    # The first node of the optimized plan is the result
+    m = _STATS.search(text.split("== Optimized Logical Plan ==", 1)[-1])
+    if not m:
+        return None, None
+    size = int(float(m.group(1)) * _UNITS[m.group(2)])
+    rows = int(float(m.group(3))) if m.group(3) else None
+    return rows, None if size >= _UNKNOWN_BYTES else size
+
+
+class QueryPlan:
+    """What the SQL Query page runs for a submitted statement, and why."""
+
+    def __init__(self, query: str, statement: str, mode: str) -> None:
+        self.query = query
+        self.statement = statement
+        self.mode = mode  # what was applied: "preview", "sample" or "as_written"
+        self.est_rows: Optional[int] = None
+        self.est_bytes: Optional[int] = None
+        self.limit: Optional[int] = None
+        self.sample_percent: Optional[float] = None
+        self.notes: List[str] = []
+
+    @property
+    def rewritten(self) -> bool:
+        return self.statement != self.query
+
+
+def _with_limit(query: str, rows: int) -> str:
+    # On its own line so a trailing `--` comment cannot swallow the parenthesis
+    return f"select * from (\n{query}\n) limit {int(rows)}"
+
+
+def plan_query(
+    query: str,
+    mode: str = "preview",
+    preview_rows: int = PREVIEW_ROWS,
+    estimate_cost: bool = True,
+) -> QueryPlan:
+    """
+    Plan a submitted statement. "preview" caps the rows returned with a LIMIT,
+    "sample" reads a TABLESAMPLE of the scanned table sized for preview_rows
+    (falling back to a preview), "as_written" runs the query unchanged.
+    Raises ValueError for more than one statement.
+    """
+    query = query.strip().rstrip(";").strip()
+    if statement_count(query) > 1:
+        raise ValueError("Run one statement at a time.")
+    # Leading comments do not count
+    head = _mask(query).strip().lower()
+    plan = QueryPlan(query, query, "as_written")
+    if not is_read_query(head):
+        plan.notes.append("Not a read query; run as written.")
+        return plan
+    if not head.startswith(_WRAPPABLE):
+        # SHOW / DESCRIBE / EXPLAIN: small results that cannot be wrapped
+        return plan
+    if estimate_cost:
+        plan.est_rows, plan.est_bytes = estimate(query)
+    if mode == "as_written":
+        return plan
+    plan.mode = mode
+
+    explicit = top_level_limit(query)
+    if explicit is not None and explicit <= preview_rows:
+        plan.mode = "as_written"
+        plan.limit = explicit
+        return plan
+    if plan.est_rows is not None and plan.est_rows <= preview_rows:
+        # Small enough; the stream budget still applies if the estimate is off
+        plan.mode = "as_written"
+        return plan
+
+    statement = query
+    if mode == "sample":
+        span = scanned_table(query)
+        if span is None:
+            plan.notes.append(
+                "Sampling needs a plain single-table select; showing a preview."
+            )
+        elif plan.est_rows is None:
+            plan.notes.append("No row estimate to size the sample; showing a preview.")
+        else:
+            # Oversample a little: TABLESAMPLE is per file block and approximate
+            percent = min(100.0, max(0.001, preview_rows / plan.est_rows * 150))
+            plan.sample_percent = round(percent, 3)
+            end = span[1]
+            sample = f" TABLESAMPLE ({plan.sample_percent} PERCENT)"
+            statement = query[:end] + sample + query[end:]
+    if plan.sample_percent is None:
+        plan.mode = "preview"
+    plan.limit = preview_rows
+    plan.statement = _with_limit(statement, preview_rows)
+    return plan
+
+
+def export(
+    query: str,
+    path: str,
+    fmt: str = "parquet",
+    max_rows: int = EXPORT_MAX_ROWS,
+    max_bytes: int = EXPORT_MAX_BYTES,
+    batch_rows: int = STREAM_BATCH_ROWS,
+    on_batch: Optional[Callable[[ArrowStream], Any]] = None,
+) -> ArrowStream:
+    """
+    Stream a result into a Parquet or CSV file one Arrow batch at a time.
+    Returns the finished stream (rows, bytes, truncated).
+    """
+    # Only needed when someone downloads; kept out of the page's import time
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+
+        writer_cls: Any = pq.ParquetWriter
+    elif fmt == "csv":
+        import pyarrow.csv as pcsv
+
+        writer_cls = pcsv.CSVWriter
+    else:
+        raise ValueError(f"Unknown export format: {fmt}")
+    stream = run_sql_stream(query, max_rows, max_bytes, batch_rows)
+    writer = None
+    try:
+        for batch in stream:
+            if writer is None:
+                writer = writer_cls(path, batch.schema)
+            writer.write_table(batch)
+            if on_batch is not None:
+                on_batch(stream)
+        if writer is None and stream.schema is not None:
+            # Empty result: still a valid file with the columns
+            writer = writer_cls(path, stream.schema)
+    finally:
+        if writer is not None:
+            writer.close()
+    return stream
+
+
+def export_path(fmt: str) -> str:
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    fd, path = tempfile.mkstemp(suffix=f".{fmt}", dir=EXPORT_DIR)
+    os.close(fd)
+    return path
@@ -0,0 +1,341 @@
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Set, Tuple
+
+import pyarrow as pa
+
+CACHE_DIR = os.getenv(
+    "SQL_RESULT_CACHE_DIR",
+    os.path.join(tempfile.gettempdir(), "databricks-streamlit-app-cache"),
+)
+CACHE_MAX_BYTES = int(os.getenv("SQL_RESULT_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))
+# How often the directory is rescanned for entries written by other replicas
+CACHE_SCAN_INTERVAL = float(os.getenv("SQL_RESULT_CACHE_SCAN_INTERVAL", "60"))
+
+_META_KEY = b"result_cache"
+_MARKERS = "invalidated"
+_QUOTED = re.compile(r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|`[^`]*`)")
+_IDENT = r"(?:`[^`]+`|[\w$]+)"
+_TABLE_REF = re.compile(
+    rf"\b(?:from|join|into|update|table)\s+({_IDENT}(?:\s*\.\s*{_IDENT})*)", re.I
+)
+_READ_PREFIXES = (
+    "select",
+    "with",
+    "show",
+    "describe",
+    "desc",
+    "explain",
+    "values",
+    "(",
+)
+
+
+def normalize_sql(query: str) -> str:
+    """Collapse whitespace and trailing semicolons outside of quoted text."""
+    parts = _QUOTED.split(query.strip().rstrip(";").strip())
+    return "".join(p if i % 2 else re.sub(r"\s+", " ", p) for i, p in enumerate(parts))
+
+
+def is_read_query(query: str) -> bool:
+    return normalize_sql(query).lower().startswith(_READ_PREFIXES)
+
+
+def referenced_tables(query: str) -> Set[str]:
+    """Best-effort set of lower-cased, unquoted table names referenced by a query."""
+    names = set()
+    for match in _TABLE_REF.finditer(normalize_sql(query)):
+        name = re.sub(r"\s*\.\s*", ".", match.group(1)).replace("`", "").lower()
+        names.add(name)
+    return names
+
+
+def _matches(referenced: str, fqn: str) -> bool:
+    # "cat.sch.tbl" is hit by references to "cat.sch.tbl", "sch.tbl" and "tbl"
+    return fqn == referenced or fqn.endswith("." + referenced)
+
+
+class ResultCache:
+    """Interface for query-result caches plugged under common.run_sql."""
+
+    def get(self, key: str) -> Optional[pa.Table]:
+        return self.lookup(key)[0]
+
+    def lookup(
+        self, key: str, max_stale: float = 0.0
+    ) -> Tuple[Optional[pa.Table], bool]:
+        """Return (table, stale); entries up to max_stale seconds past expiry are served."""
+        return None, False
+
+    def put(self, key: str, table: pa.Table, ttl: float, tables: Iterable[str]) -> None:
+        pass
+
+    def invalidate_table(self, fqn: str) -> int:
+        return 0
+
+    def clear(self) -> None:
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {}
+
+
+def cache_key(
+    query: str, warehouse_id: str, parameters: Optional[Dict[str, Any]] = None
+) -> str:
+    raw = f"{warehouse_id}\n{normalize_sql(query)}"
+    if parameters:
+        raw += "\n" + json.dumps(parameters, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class DiskResultCache(ResultCache):
+    """
+    Arrow IPC files on local disk, read back through memory maps.
+
+    Entries carry their expiry, creation time and referenced tables in the
+    file's schema metadata, and are found by their key's file name, so a
+    directory on a shared volume can serve several replicas: each one serves
+    entries the others wrote. invalidate_table() also leaves a per-table marker
+    file; entries created before the latest marker of a table they reference
+    are dropped on lookup, whichever replica wrote them. Eviction is LRU by
+    total bytes; the index is refreshed from the directory every
+    CACHE_SCAN_INTERVAL seconds so entries of other replicas count too.
+    Invalidation compares wall clocks, so replicas are assumed to be in sync.
+    """
+
+    def __init__(
+        self,
+        directory: str = CACHE_DIR,
+        max_bytes: int = CACHE_MAX_BYTES,
+        scan_interval: float = CACHE_SCAN_INTERVAL,
+    ):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.scan_interval = scan_interval
+        self._markers = os.path.join(directory, _MARKERS)
+        self._lock = threading.Lock()
+        # key -> {"path", "bytes"}; least recently used first
+        self._index: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._bytes = 0
+        self._scanned_at = 0.0
+        # marker file name -> (mtime, fqn, invalidated_at)
+        self._marker_cache: Dict[str, Tuple[float, str, float]] = {}
+        self._stats = {
+            "hits": 0,
+            "stale_hits": 0,
+            "misses": 0,
+            "expired": 0,
+            "puts": 0,
+            "evictions": 0,
+            "invalidations": 0,
+            "invalidated_on_lookup": 0,
+            "bytes_read": 0,
+            "bytes_written": 0,
+        }
+        os.makedirs(self._markers, exist_ok=True)
+        self._scan()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.arrow")
+
+    def _scan(self) -> None:
+        """Rebuild the index from the directory, least recently read first."""
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".arrow"):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_atime, name[: -len(".arrow")], path, stat.st_size))
+        with self._lock:
+            index: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+            for _, key, path, size in sorted(entries):
+                index[key] = {"path": path, "bytes": size}
+            # Keep this process's recency order for entries it already knows
+            for key in self._index:
+                if key in index:
+                    index.move_to_end(key)
+            self._index = index
+            self._bytes = sum(entry["bytes"] for entry in index.values())
+            self._scanned_at = time.monotonic()
+
+    @staticmethod
+    def _remove_file(path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _forget(self, key: str) -> None:
+        entry = self._index.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry["bytes"]
+
+    def _drop(self, key: str) -> None:
+        self._forget(key)
+        self._remove_file(self._path(key))
+
+    def _evict(self) -> None:
+        while self._bytes > self.max_bytes and self._index:
+            key = next(iter(self._index))
+            self._drop(key)
+            self._stats["evictions"] += 1
+
+    # -- invalidation markers --
+    def _marker_path(self, fqn: str) -> str:
+        name = hashlib.sha1(fqn.encode("utf-8")).hexdigest()[:20]
+        return os.path.join(self._markers, f"{name}.json")
+
+    def _invalidations(self) -> Dict[str, float]:
+        """fqn -> time of its latest invalidation, from every replica's markers."""
+        out: Dict[str, float] = {}
+        cache: Dict[str, Tuple[float, str, float]] = {}
+        with os.scandir(self._markers) as it:
+            for item in it:
+                if not item.name.endswith(".json"):
+                    continue
+                try:
+                    mtime = item.stat().st_mtime
+                    known = self._marker_cache.get(item.name)
+                    if known is None or known[0] != mtime:
+                        with open(item.path, encoding="utf-8") as f:
+                            marker = json.load(f)
+                        known = (mtime, marker["fqn"], marker["at"])
+                except (OSError, ValueError, KeyError):
+                    continue
+                cache[item.name] = known
+                out[known[1]] = max(out.get(known[1], 0.0), known[2])
+        self._marker_cache = cache
+        return out
+
+    def _invalidated(self, info: Dict[str, Any]) -> bool:
+        created_at = info.get("created_at", 0.0)
+        return any(
+            at >= created_at and any(_matches(t, fqn) for t in info["tables"])
+            for fqn, at in self._invalidations().items()
+        )
+
+    # -- public API --
+    def lookup(
+        self, key: str, max_stale: float = 0.0
+    ) -> Tuple[Optional[pa.Table], bool]:
+        # The file, not the index, is authoritative: another replica may have
+        # written, replaced or removed it
+        path = self._path(key)
+        try:
+            with pa.memory_map(path) as source:
+                reader = pa.ipc.open_file(source)
+                info = json.loads((reader.schema.metadata or {})[_META_KEY])
+                now = time.time()
+                expired = info["expires_at"] + max_stale < now
+                invalidated = not expired and self._invalidated(info)
+                table = None if expired or invalidated else reader.read_all()
+            size = os.path.getsize(path)
+        except (OSError, KeyError, ValueError, pa.ArrowInvalid):
+            # Missing, removed by another replica or truncated; treat as a miss
+            with self._lock:
+                self._forget(key)
+                self._stats["misses"] += 1
+            return None, False
+        with self._lock:
+            if table is None:
+                self._drop(key)
+                self._stats["expired" if expired else "invalidated_on_lookup"] += 1
+                self._stats["misses"] += 1
+                return None, False
+            if key not in self._index:
+                self._index[key] = {"path": path, "bytes": size}
+                self._bytes += size
+            self._index.move_to_end(key)
+            stale = info["expires_at"] < now
+            self._stats["stale_hits" if stale else "hits"] += 1
+            self._stats["bytes_read"] += size
+        return table.replace_schema_metadata(None), stale
+
+    def put(self, key: str, table: pa.Table, ttl: float, tables: Iterable[str]) -> None:
+        if time.monotonic() - self._scanned_at > self.scan_interval:
+            self._scan()
+        tables = sorted(set(tables))
+        now = time.time()
+        info = {"expires_at": now + ttl, "created_at": now, "tables": tables}
+        meta = {_META_KEY: json.dumps(info)}
+        path = self._path(key)
+        tmp = os.path.join(self.directory, f".{key}.{uuid.uuid4().hex}.tmp")
+        try:
+            table = table.replace_schema_metadata(meta)
+            with pa.OSFile(tmp, "wb") as sink:
+                with pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+            os.replace(tmp, path)
+        except Exception:
+            # Caching is best effort; a full or read-only disk must not fail the query
+            self._remove_file(tmp)
+            return
+        size = os.path.getsize(path)
+        with self._lock:
+            self._forget(key)
+            self._index[key] = {"path": path, "bytes": size}
+            self._bytes += size
+            self._stats["puts"] += 1
+            self._stats["bytes_written"] += size
+            self._evict()
+
+    def invalidate_table(self, fqn: str) -> int:
+        """
+        Mark the table invalidated for every replica and drop the entries that
+        reference it from this one's index; returns how many were dropped here.
+        """
+        fqn = fqn.replace("`", "").lower()
+        path = self._marker_path(fqn)
+        tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"fqn": fqn, "at": time.time()}, f)
+            os.replace(tmp, path)
+        except OSError:
+            self._remove_file(tmp)
+        self._scan()
+        dropped = 0
+        for key in list(self._index):
+            try:
+                with pa.memory_map(self._path(key)) as source:
+                    meta = pa.ipc.open_file(source).schema.metadata or {}
+                tables = json.loads(meta[_META_KEY])["tables"]
+            except (OSError, KeyError, ValueError, pa.ArrowInvalid):
+                continue
+            if any(_matches(t, fqn) for t in tables):
+                with self._lock:
+                    self._drop(key)
+                dropped += 1
+        with self._lock:
+            self._stats["invalidations"] += dropped
+        return dropped
+
+    def clear(self) -> None:
+        self._scan()
+        with self._lock:
+            for key in list(self._index):
+                self._drop(key)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            served = self._stats["hits"] + self._stats["stale_hits"]
+            lookups = served + self._stats["misses"]
+            return {
+                "entries": len(self._index),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hit_rate": served / lookups if lookups else 0.0,
+                **self._stats,
+            }
@@ -0,0 +1,163 @@
+"""
+Row identity computed on the client.
+
+row_fingerprints() reproduces `sha2(to_json(named_struct(...)), 256)` (see
+editing._row_hash_expr) from an Arrow table, so loading a page no longer asks the
+warehouse to hash every row. It matches the server for strings, integers,
+booleans, decimals, dates, doubles and floats, including NULLs (to_json omits
+null fields, so do we) and duplicate rows (equal content, equal hash).
+
+Known differences, reported through `compatible=False`:
+- timestamps: the server formats them in the session time zone
+- binary, interval, nested and other types: not rendered like Spark's to_json
+- NaN/Infinity: Spark's output depends on JSON generator options
+- doubles are printed like Java's Double.toString using Python's shortest
+  repr; older JDKs occasionally print a longer digit string for the same value
+
+Incompatible fingerprints are still stable on the client and fine as an editor
+index. They must not be matched against _row_hash_expr on the server.
+"""
+
+import hashlib
+import json
+import math
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# Control characters Jackson escapes with a short form; the rest become \u00XX
+_SHORT_ESCAPES = {"\b": "\\b", "\f": "\\f", "\n": "\\n", "\r": "\\r", "\t": "\\t"}
+
+
+def _java_float_str(x: float, shortest: str) -> str:
+    """Format like Java's Double/Float.toString given Python's shortest repr."""
+    if x == 0:
+        return "-0.0" if math.copysign(1.0, x) < 0 else "0.0"
+    a = abs(x)
+    if 1e-3 <= a < 1e7:
+        s = format(Decimal(shortest), "f")
+        return s if "." in s else s + ".0"
+    sign, digits, exp = Decimal(shortest).as_tuple()
+    digits_s = "".join(map(str, digits)).rstrip("0") or "0"
+    exponent = exp + len(digits) - 1
+    mantissa = digits_s[0] + "." + (digits_s[1:] or "0")
+    return f"{'-' if sign else ''}{mantissa}E{exponent}"
+
+
+def _json_floats(arr: pa.Array, single: bool) -> Tuple[pa.Array, bool]:
+    out: List[Optional[str]] = []
+    compatible = True
+    for v in arr.to_pylist():
+        if v is None:
+            out.append(None)
+        elif math.isnan(v) or math.isinf(v):
+            compatible = False
+            out.append(json.dumps(str(v)))
+        else:
+            shortest = str(np.float32(v)) if single else repr(v)
+            out.append(_java_float_str(v, shortest))
+    return pa.array(out, pa.string()), compatible
+
+
+def _json_strings(arr: pa.Array) -> pa.Array:
+    s = pc.cast(arr, pa.string())
+    s = pc.replace_substring(s, "\\", "\\\\")
+    s = pc.replace_substring(s, '"', '\\"')
+    if pc.any(pc.match_substring_regex(s, "[\\x00-\\x1f]")).as_py():
+        for code in range(0x20):
+            ch = chr(code)
+            s = pc.replace_substring(s, ch, _SHORT_ESCAPES.get(ch, f"\\u{code:04x}"))
+    return pc.binary_join_element_wise('"', s, '"', "")
+
+
+def _json_values(arr: pa.Array) -> Tuple[pa.Array, bool]:
+    """Render one column as JSON value text (nulls stay null)."""
+    t = arr.type
+    if pa.types.is_dictionary(t):
+        return _json_values(arr.cast(t.value_type))
+    if pa.types.is_string(t) or pa.types.is_large_string(t):
+        return _json_strings(arr), True
+    if pa.types.is_integer(t) or pa.types.is_boolean(t) or pa.types.is_decimal(t):
+        return pc.cast(arr, pa.string()), True
+    if pa.types.is_date(t):
+        return _json_strings(pc.cast(arr, pa.string())), True
+    if pa.types.is_float64(t):
+        return _json_floats(arr, single=False)
+    if pa.types.is_float32(t) or pa.types.is_float16(t):
+        return _json_floats(arr, single=True)
+    if pa.types.is_null(t):
+        return arr.cast(pa.string()), True
+    values = [None if v is None else json.dumps(str(v)) for v in arr.to_pylist()]
+    return pa.array(values, pa.string()), False
+
+
+def row_fingerprints(
+    table: pa.Table, columns: Optional[List[str]] = None
+) -> Tuple[List[str], bool]:
+    """
+    Return (sha256 hex per row, compatible) for `columns` (default: all, in order).
+    `compatible` is True when every value was rendered exactly like Spark's to_json.
+    """
+    columns = columns if columns is not None else table.column_names
+    pieces = []
+    compatible = True
+    for name in columns:
+        values, ok = _json_values(table.column(name).combine_chunks())
+        compatible &= ok
+        key = "," + json.dumps(name, ensure_ascii=False) + ":"
+        # ,key:value, or nothing for NULL: to_json leaves out null fields
+        field = pc.binary_join_element_wise(key, values, "")
+        pieces.append(pc.fill_null(field, ""))
+    # Joined without null handling: skipping nulls drops rows that are all NULL
+    body = pc.binary_join_element_wise(
+        *pieces, pa.array([""] * table.num_rows, pa.string()), ""
+    )
+    body = pc.binary_join_element_wise("{", pc.utf8_slice_codeunits(body, 1), "}", "")
+    digests = [hashlib.sha256(b.encode("utf-8")).hexdigest() for b in body.to_pylist()]
+    return digests, compatible
+
+
+class RowIndex:
+    """Fingerprint -> original row lookup for one loaded page."""
+
+    def __init__(self, original: pd.DataFrame) -> None:
+        self.original = original
+
+    def key_values(self, fingerprint: str, key_cols: List[str]) -> Dict[str, Any]:
+        row = self.original.loc[fingerprint]
+        return {k: row[k] for k in key_cols}
+
+    def rekey(
+        self,
+        edited: pd.DataFrame,
+        inserts: List[Dict[str, Any]],
+        updates: List[Dict[str, Any]],
+        deletes: List[Dict[str, Any]],
+        key_cols: List[str],
+        row_hash_col: str = "__row_hash",
+    ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """
+        Turn fingerprint-based changes into primary-key based ones, so writes match
+        on the key (and can use data skipping) instead of hashing the table.
+        Edits that change a key column become a delete plus an insert.
+        """
+        new_inserts = list(inserts)
+        new_updates: List[Dict[str, Any]] = []
+        new_deletes: List[Dict[str, Any]] = []
+        for row in deletes:
+            new_deletes.append(self.key_values(row[row_hash_col], key_cols))
+        for row in updates:
+            fingerprint = row[row_hash_col]
+            keys = self.key_values(fingerprint, key_cols)
+            if any(k in row for k in key_cols):
+                new_deletes.append(keys)
+                new_inserts.append(edited.loc[fingerprint].to_dict())
+                continue
+            changes = {c: v for c, v in row.items() if c != row_hash_col}
+            changes.update(keys)
+            new_updates.append(changes)
+        return new_inserts, new_updates, new_deletes
@@ -0,0 +1,458 @@
+"""
+Background save jobs for Edit Data.
+
+A save is rendered into its statements up front and queued. A single worker
+thread applies them in order, retrying idempotent batches with backoff, and
+writes the job to disk after every batch. Each batch carries a token derived
+from the job id, its statement and its bound values; tokens recorded as done
+are never run again,
+so resuming a failed or interrupted job only runs what is left.
+
+Deletes and updates are idempotent as written. Inserts are only when the table
+has a key (they become MERGE ... WHEN NOT MATCHED); a keyless insert batch that
+fails is not retried automatically because it may already have been applied.
+"""
+
+import base64
+import datetime
+import decimal
+import hashlib
+import json
+import logging
+import os
+import queue
+import tempfile
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Union
+
+from common import invalidate_table, run_sql as sqlQuery, set_page
+from conflicts import table_version
+from editing import (
+    MAX_BATCH_ROWS,
+    MAX_STATEMENT_PARAMS,
+    Statement,
+    _sql_fqn,
+    build_change_statements,
+)
+
+logger = logging.getLogger(__name__)
+
+SAVE_JOBS_DIR = os.getenv(
+    "SAVE_JOBS_DIR", os.path.join(tempfile.gettempdir(), "streamlit_save_jobs")
+)
+SAVE_JOB_RETRIES = int(os.getenv("SAVE_JOB_RETRIES", "3"))
+SAVE_JOB_BACKOFF = float(os.getenv("SAVE_JOB_BACKOFF", "2"))
+# Finished jobs older than this are dropped from disk on startup
+SAVE_JOB_KEEP = float(os.getenv("SAVE_JOB_KEEP", str(24 * 3600)))
+
+ACTIVE = ("queued", "running")
+RESUMABLE = ("failed", "interrupted")
+
+
+def _digest(statement: str, params: Dict[str, Any]) -> str:
+    raw = statement + "\n" + json.dumps(params, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+# Bound values are stored with a type tag, so a resumed job binds the same
+# types (TIMESTAMP, DATE, DECIMAL, ...) as the original one, not strings
+_TAG = "$type"
+_DECODERS: Dict[str, Callable[[Any], Any]] = {
+    "datetime": datetime.datetime.fromisoformat,
+    "date": datetime.date.fromisoformat,
+    "time": datetime.time.fromisoformat,
+    "timedelta": lambda v: datetime.timedelta(microseconds=v),
+    "decimal": decimal.Decimal,
+    "bytes": base64.b64decode,
+}
+
+
+def _encode_param(value: Any) -> Any:
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    # datetime before date: a datetime is also a date
+    if isinstance(value, datetime.datetime):
+        return {_TAG: "datetime", "value": value.isoformat()}
+    if isinstance(value, datetime.date):
+        return {_TAG: "date", "value": value.isoformat()}
+    if isinstance(value, datetime.time):
+        return {_TAG: "time", "value": value.isoformat()}
+    if isinstance(value, datetime.timedelta):
+        return {_TAG: "timedelta", "value": value // datetime.timedelta(microseconds=1)}
+    if isinstance(value, decimal.Decimal):
+        return {_TAG: "decimal", "value": str(value)}
+    if isinstance(value, (bytes, bytearray)):
+        return {_TAG: "bytes", "value": base64.b64encode(value).decode("ascii")}
+    if isinstance(value, (list, tuple)):
+        return {_TAG: "list", "value": [_encode_param(v) for v in value]}
+    if isinstance(value, dict):
+        return {_TAG: "dict", "value": {k: _encode_param(v) for k, v in value.items()}}
+    raise TypeError(f"Cannot store a {type(value).__name__} parameter")
+
+
+def _decode_param(value: Any) -> Any:
+    if not isinstance(value, dict):
+        return value
+    tag, raw = value[_TAG], value["value"]
+    if tag == "list":
+        return [_decode_param(v) for v in raw]
+    if tag == "dict":
+        return {k: _decode_param(v) for k, v in raw.items()}
+    return _DECODERS[tag](raw)
+
+
+def _affected_rows(result: Any, default: int) -> int:
+    # DML on Databricks returns num_affected_rows; fall back to the batch size
+    try:
+        return int(result["num_affected_rows"].iloc[0])
+    except Exception:
+        return default
+
+
+class SaveJob:
+    """One change set for one table, applied batch by batch."""
+
+    def __init__(
+        self,
+        catalog: str,
+        schema: str,
+        table: str,
+        batches: List[Dict[str, Any]],
+        job_id: Optional[str] = None,
+        submit_key: str = "",
+    ) -> None:
+        self.id = job_id or uuid.uuid4().hex[:12]
+        self.catalog = catalog
+        self.schema = schema
+        self.table = table
+        self.batches = batches
+        self.submit_key = submit_key
+        # Staged files to remove once the job is done (bulk import)
+        self.staged_dir: Optional[str] = None
+        # Table version right after the last batch; the page re-pins to it
+        self.version: Optional[int] = None
+        self.status = "queued"
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    @classmethod
+    def build(
+        cls,
+        catalog: str,
+        schema: str,
+        table: str,
+        columns: List[str],
+        inserts: List[Dict[str, Any]],
+        updates: List[Dict[str, Any]],
+        deletes: List[Dict[str, Any]],
+        key_cols: Optional[List[str]] = None,
+        max_params: int = MAX_STATEMENT_PARAMS,
+        max_rows: int = MAX_BATCH_ROWS,
+    ) -> "SaveJob":
+        fqn = _sql_fqn(catalog, schema, table)
+        statements = build_change_statements(
+            fqn,
+            columns,
+            inserts,
+            updates,
+            deletes,
+            key_cols,
+            max_params,
+            max_rows,
+            retry_safe=True,
+        )
+        return cls.from_statements(
+            catalog,
+            schema,
+            table,
+            statements,
+            retry_safe=lambda kind: kind != "insert" or bool(key_cols),
+        )
+
+    @classmethod
+    def from_statements(
+        cls,
+        catalog: str,
+        schema: str,
+        table: str,
+        statements: List[Statement],
+        retry_safe: Union[bool, Callable[[str], bool]] = False,
+        staged_dir: Optional[str] = None,
+    ) -> "SaveJob":
+        """
+        Job running rendered (kind, statement, params, rows) in order. retry_safe
+        is a flag or a function of the kind; staged_dir is removed (bulk_import)
+        once the job is done.
+        """
+        digests = [_digest(statement, params) for _, statement, params, _ in statements]
+        submit_key = hashlib.sha256("\n".join(digests).encode("utf-8")).hexdigest()
+        job = cls(catalog, schema, table, [], submit_key=submit_key)
+        job.staged_dir = staged_dir
+        safe = retry_safe if callable(retry_safe) else lambda kind: retry_safe
+        for i, (kind, statement, params, n) in enumerate(statements):
+            job.batches.append(
+                {
+                    "token": f"{job.id}:{i}:{digests[i][:16]}",
+                    "kind": kind,
+                    "rows": n,
+                    "statement": statement,
+                    "parameters": params,
+                    "retry_safe": bool(safe(kind)),
+                    "status": "pending",
+                    "attempts": 0,
+                    "affected": None,
+                    "seconds": None,
+                    "error": None,
+                }
+            )
+        return job
+
+    @property
+    def table_key(self) -> str:
+        return f"{self.catalog}.{self.schema}.{self.table}"
+
+    def progress(self) -> Dict[str, Any]:
+        done = [b for b in self.batches if b["status"] == "done"]
+        end = self.finished_at or time.time()
+        return {
+            "id": self.id,
+            "status": self.status,
+            "statements_done": len(done),
+            "statements_total": len(self.batches),
+            "rows_done": sum(b["rows"] for b in done),
+            "rows_total": sum(b["rows"] for b in self.batches),
+            "rows_affected": sum(b["affected"] or 0 for b in done),
+            "elapsed": end - self.started_at if self.started_at else 0.0,
+            "error": self.error,
+        }
+
+    def report(self) -> List[Dict[str, Any]]:
+        """Per-batch state without the statement and its values."""
+        hidden = ("statement", "parameters")
+        return [{k: v for k, v in b.items() if k not in hidden} for b in self.batches]
+
+    def to_dict(self) -> Dict[str, Any]:
+        """JSON-ready state; parameter values are stored with type tags."""
+        data = dict(self.__dict__)
+        data["batches"] = [
+            {
+                **b,
+                "parameters": {
+                    k: _encode_param(v) for k, v in (b["parameters"] or {}).items()
+                },
+            }
+            for b in self.batches
+        ]
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "SaveJob":
+        batches = [
+            {
+                **b,
+                "parameters": {
+                    k: _decode_param(v) for k, v in (b["parameters"] or {}).items()
+                },
+            }
+            for b in data["batches"]
+        ]
+        job = cls(data["catalog"], data["schema"], data["table"], batches)
+        job.__dict__.update({**data, "batches": batches})
+        return job
+
+
+class SaveJobQueue:
+    """
+    Process-wide queue of save jobs with one worker thread, so writes to a table
+    are applied in submission order while sessions keep browsing.
+    """
+
+    def __init__(
+        self,
+        directory: str = SAVE_JOBS_DIR,
+        retries: int = SAVE_JOB_RETRIES,
+        backoff: float = SAVE_JOB_BACKOFF,
+    ) -> None:
+        self.directory = directory
+        self.retries = retries
+        self.backoff = backoff
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, SaveJob] = {}
+        self._queue: "queue.Queue[str]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    # -- persistence --
+    def _path(self, job_id: str) -> str:
+        return os.path.join(self.directory, f"{job_id}.json")
+
+    def _persist(self, job: SaveJob) -> None:
+        try:
+            with self._lock:
+                data = json.dumps(job.to_dict(), default=str)
+        except TypeError:
+            # The job still runs; it just cannot be resumed after a restart
+            logger.exception("Could not serialize save job %s", job.id)
+            return
+        tmp = self._path(job.id) + f".{uuid.uuid4().hex}.tmp"
+        try:
+            with open(tmp, "w") as f:
+                f.write(data)
+            os.replace(tmp, self._path(job.id))
+        except OSError:
+            logger.exception("Could not persist save job %s", job.id)
+
+    def _load(self) -> None:
+        now = time.time()
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(path) as f:
+                    job = SaveJob.from_dict(json.load(f))
+            except (OSError, ValueError, KeyError):
+                continue
+            if job.status == "done" and now - (job.finished_at or 0) > SAVE_JOB_KEEP:
+                os.remove(path)
+                continue
+            if job.status in ACTIVE:
+                # The process stopped mid-job; finished batches keep their tokens
+                job.status = "interrupted"
+            self._jobs[job.id] = job
+
+    # -- public API --
+    def submit(self, job: SaveJob) -> SaveJob:
+        """Queue a job; an identical change set still queued or running is reused."""
+        with self._lock:
+            for existing in self._jobs.values():
+                if existing.submit_key == job.submit_key and existing.status in ACTIVE:
+                    return existing
+            self._jobs[job.id] = job
+        self._persist(job)
+        self._enqueue(job)
+        return job
+
+    def resume(self, job_id: str) -> SaveJob:
+        """Re-queue a failed or interrupted job; batches already done are skipped."""
+        with self._lock:
+            job = self._jobs[job_id]
+            if job.status not in RESUMABLE:
+                return job
+            job.status = "queued"
+            job.error = None
+            job.finished_at = None
+        self._persist(job)
+        self._enqueue(job)
+        return job
+
+    def get(self, job_id: str) -> Optional[SaveJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def jobs(
+        self, catalog: str, schema: str, table: str, limit: int = 10
+    ) -> List[SaveJob]:
+        """Most recent jobs for a table, newest first."""
+        key = f"{catalog}.{schema}.{table}"
+        with self._lock:
+            found = [j for j in self._jobs.values() if j.table_key == key]
+        found.sort(key=lambda j: j.created_at, reverse=True)
+        return found[:limit]
+
+    # -- worker --
+    def _enqueue(self, job: SaveJob) -> None:
+        self._queue.put(job.id)
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._worker, name="save-jobs", daemon=True
+                )
+                self._thread.start()
+
+    def _worker(self) -> None:
+        set_page("Save jobs")
+        while True:
+            job = self.get(self._queue.get())
+            if job is None or job.status != "queued":
+                continue
+            try:
+                self._run(job)
+            except Exception:
+                logger.exception("Save job %s crashed", job.id)
+
+    def _run(self, job: SaveJob) -> None:
+        with self._lock:
+            job.status = "running"
+            job.started_at = job.started_at or time.time()
+        self._persist(job)
+        try:
+            for batch in job.batches:
+                if batch["status"] == "done":
+                    continue
+                self._run_batch(batch)
+                self._persist(job)
+            version = table_version(job.catalog, job.schema, job.table)
+            with self._lock:
+                job.version = version
+                job.status = "done"
+            if job.staged_dir:
+                self._remove_staged(job)
+        except Exception as e:
+            with self._lock:
+                job.status = "failed"
+                job.error = str(e)
+        finally:
+            with self._lock:
+                job.finished_at = time.time()
+            # Even a partially applied job changes the table
+            invalidate_table(job.catalog, job.schema, job.table)
+            self._persist(job)
+
+    def _remove_staged(self, job: SaveJob) -> None:
+        # Kept while the job can still be resumed; a leftover is only disk space
+        from bulk_import import remove_staged
+
+        try:
+            remove_staged(job.staged_dir)
+            job.staged_dir = None
+        except Exception:
+            logger.exception("Could not remove staged files of save job %s", job.id)
+
+    def _run_batch(self, batch: Dict[str, Any]) -> None:
+        attempts = 1 + (self.retries if batch["retry_safe"] else 0)
+        for attempt in range(attempts):
+            batch["attempts"] += 1
+            started = time.perf_counter()
+            try:
+                result = sqlQuery(batch["statement"], parameters=batch["parameters"])
+            except Exception as e:
+                batch["error"] = str(e)
+                if attempt + 1 >= attempts:
+                    batch["status"] = "failed"
+                    raise
+                time.sleep(self.backoff * 2**attempt)
+                continue
+            batch["status"] = "done"
+            batch["error"] = None
+            batch["seconds"] = time.perf_counter() - started
+            batch["affected"] = _affected_rows(result, batch["rows"])
+            return
+
+
+_save_jobs_lock = threading.Lock()
+_save_jobs: Optional[SaveJobQueue] = None
+
+
+def get_save_jobs() -> SaveJobQueue:
+    """Process-wide save job queue, created on first use."""
+    global _save_jobs
+    with _save_jobs_lock:
+        if _save_jobs is None:
+            _save_jobs = SaveJobQueue()
+        return _save_jobs
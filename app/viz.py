@@ -0,0 +1,261 @@
+"""
+Data reduction for what pages send to the browser.
+
+Streamlit serializes every point of a chart and every cell of a dataframe into
+the page, so payload and render time grow with the data. These helpers cap both:
+
+- density_bins() aggregates scatter points onto a grid of at most
+  VIZ_MAX_POINTS cells, each weighted by the points it covers
+- downsample_line() keeps VIZ_MAX_POINTS points of a line chosen by
+  Largest-Triangle-Three-Buckets (LTTB), which keeps peaks and dips
+- show_table() sends one page of the selected columns, at most VIZ_MAX_CELLS
+  cells, and pages through the rest inside a fragment, so paging never reruns
+  the page (or its query)
+"""
+
+import math
+import os
+from typing import Any, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import streamlit as st
+
+# Points drawn by one chart
+VIZ_MAX_POINTS = int(os.getenv("VIZ_MAX_POINTS", "5000"))
+# Rows and cells sent per table page
+VIZ_PAGE_ROWS = int(os.getenv("VIZ_PAGE_ROWS", "1000"))
+VIZ_MAX_CELLS = int(os.getenv("VIZ_MAX_CELLS", "50000"))
+# Share of the weight a density chart covers; the rest is outliers
+VIZ_RANGE_QUANTILE = 0.999
+
+Data = Union[pd.DataFrame, pa.Table]
+
+
+def _num_rows(data: Data) -> int:
+    return data.num_rows if isinstance(data, pa.Table) else len(data)
+
+
+def _column_names(data: Data) -> List[str]:
+    return list(data.column_names if isinstance(data, pa.Table) else data.columns)
+
+
+def _project(data: Data, columns: List[str], start: int = 0, stop: Any = None) -> Data:
+    if isinstance(data, pa.Table):
+        stop = data.num_rows if stop is None else stop
+        # Zero-copy: only the slice of the chosen columns is serialized
+        return data.select(columns).slice(start, max(0, stop - start))
+    return data.iloc[start:stop][columns]
+
+
+def _to_pandas(data: Data, columns: List[str]) -> pd.DataFrame:
+    if isinstance(data, pa.Table):
+        return data.select(columns).to_pandas()
+    return data[columns]
+
+
+# ---------- Scatter ----------
+def _weighted_range(
+    values: np.ndarray, weights: Optional[np.ndarray], quantile: float
+) -> Tuple[float, float]:
+    if weights is None:
+        # Partition-based, no full sort
+        lo, hi = np.quantile(values, [1 - quantile, quantile], method="nearest")
+        return float(lo), float(hi)
+    order = np.argsort(values, kind="stable")
+    cumulative = np.cumsum(weights[order])
+    total = cumulative[-1]
+    if total <= 0:
+        return float(values.min()), float(values.max())
+    lo = np.searchsorted(cumulative, total * (1 - quantile), side="left")
+    hi = np.searchsorted(cumulative, total * quantile, side="left")
+    last = len(values) - 1
+    return float(values[order[min(lo, last)]]), float(values[order[min(hi, last)]])
+
+
+def density_bins(
+    df: pd.DataFrame,
+    x: str,
+    y: str,
+    weight: Optional[str] = None,
+    max_points: int = VIZ_MAX_POINTS,
+    quantile: float = VIZ_RANGE_QUANTILE,
+) -> Tuple[pd.DataFrame, float]:
+    """
+    Points of a scatter chart aggregated onto a grid of at most max_points
+    cells, returned as (frame, weight left out). Each cell is drawn at its
+    center with the summed `weight` (or the point count, as "count"). The grid
+    spans the central `quantile` of the weight on each axis, so a few outliers
+    do not squash everything else into one cell; what falls outside (and NaN)
+    is dropped and its weight returned. Frames that already fit are returned
+    unchanged.
+    """
+    weight_col = weight or "count"
+    if len(df) <= max_points:
+        if weight is None:
+            df = df.assign(count=1)
+        return df, 0.0
+    xs = pd.to_numeric(df[x], errors="coerce").to_numpy(dtype=float)
+    ys = pd.to_numeric(df[y], errors="coerce").to_numpy(dtype=float)
+    if weight is None:
+        ws = np.ones(len(df))
+    else:
+        ws = pd.to_numeric(df[weight], errors="coerce").to_numpy(dtype=float)
+    finite = np.isfinite(xs) & np.isfinite(ys) & np.isfinite(ws)
+    if not finite.any():
+        return pd.DataFrame({x: [], y: [], weight_col: []}), float(np.nansum(ws))
+    range_weights = None if weight is None else ws[finite]
+    x_lo, x_hi = _weighted_range(xs[finite], range_weights, quantile)
+    y_lo, y_hi = _weighted_range(ys[finite], range_weights, quantile)
+    inside = finite & (xs >= x_lo) & (xs <= x_hi) & (ys >= y_lo) & (ys <= y_hi)
+
+    grid = max(1, int(math.sqrt(max_points)))
+    x_width = (x_hi - x_lo) / grid or 1.0
+    y_width = (y_hi - y_lo) / grid or 1.0
+    xi = np.minimum(((xs[inside] - x_lo) / x_width).astype(np.int64), grid - 1)
+    yi = np.minimum(((ys[inside] - y_lo) / y_width).astype(np.int64), grid - 1)
+    cell = xi * grid + yi
+    counts = np.bincount(cell, minlength=grid * grid)
+    sums = np.bincount(cell, weights=ws[inside], minlength=grid * grid)
+    occupied = np.nonzero(counts)[0]
+    out = pd.DataFrame(
+        {
+            x: x_lo + (occupied // grid + 0.5) * x_width,
+            y: y_lo + (occupied % grid + 0.5) * y_width,
+            weight_col: sums[occupied],
+        }
+    )
+    return out, float(np.nansum(ws[~inside]))
+
+
+# ---------- Line ----------
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """
+    Indices of `threshold` points of the line (x sorted ascending) chosen by
+    Largest-Triangle-Three-Buckets; the first and last points are always kept.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = x.astype(float)
+    y = y.astype(float)
+    # Bucket i covers [starts[i], starts[i + 1]); the first and last points
+    # are buckets of their own
+    starts = (np.arange(threshold - 1) * ((n - 2) / (threshold - 2))).astype(
+        np.int64
+    ) + 1
+    out = np.empty(threshold, dtype=np.int64)
+    out[0], out[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, stop = starts[i], starts[i + 1]
+        following = starts[i + 2] if i + 2 < len(starts) else n
+        avg_x = x[stop:following].mean()
+        avg_y = y[stop:following].mean()
+        # Twice the triangle area of (a, candidate, average of the next bucket)
+        area = np.abs(
+            (x[a] - avg_x) * (y[start:stop] - y[a])
+            - (x[a] - x[start:stop]) * (avg_y - y[a])
+        )
+        a = start + int(np.argmax(area))
+        out[i + 1] = a
+    return out
+
+
+def downsample_line(
+    df: pd.DataFrame, x: str, ys: List[str], max_points: int = VIZ_MAX_POINTS
+) -> pd.DataFrame:
+    """Rows of df (sorted by x) that draw every series in ys within max_points."""
+    df = df.dropna(subset=[x]).sort_values(x, kind="stable")
+    if len(df) <= max_points or not ys:
+        return df
+    xs = df[x].to_numpy()
+    if np.issubdtype(xs.dtype, np.datetime64):
+        xs = xs.astype("datetime64[ns]").astype(np.int64)
+    xs = xs.astype(float)
+    keep = []
+    per_series = max(3, max_points // len(ys))
+    for col in ys:
+        values = pd.to_numeric(df[col], errors="coerce").to_numpy(dtype=float)
+        valid = np.flatnonzero(np.isfinite(values))
+        keep.append(valid[lttb(xs[valid], values[valid], per_series)])
+    return df.iloc[np.unique(np.concatenate(keep))]
+
+
+# ---------- Streamlit ----------
+@st.fragment
+def show_table(
+    data: Data,
+    key: str,
+    page_rows: int = VIZ_PAGE_ROWS,
+    max_cells: int = VIZ_MAX_CELLS,
+    **dataframe_kwargs: Any,
+) -> None:
+    """
+    st.dataframe for results of any size: past one page, only the chosen
+    columns of the current page are sent. Runs as a fragment.
+    """
+    names = _column_names(data)
+    rows = _num_rows(data)
+    if rows <= page_rows and rows * len(names) <= max_cells:
+        st.dataframe(data, **dataframe_kwargs)
+        return
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        columns = (
+            st.multiselect("Columns", names, default=names, key=f"{key}:columns")
+            or names
+        )
+    per_page = max(1, min(page_rows, max_cells // len(columns)))
+    pages = max(1, math.ceil(rows / per_page))
+    with col2:
+        page = int(
+            st.number_input(
+                f"Page (of {pages:,})",
+                min_value=1,
+                max_value=pages,
+                value=1,
+                key=f"{key}:page",
+            )
+        )
+    start = (page - 1) * per_page
+    stop = min(rows, start + per_page)
+    st.dataframe(_project(data, columns, start, stop), **dataframe_kwargs)
+    st.caption(f"Rows {start + 1:,}-{stop:,} of {rows:,}")
+
+
+@st.fragment
+def show_chart(data: Data, key: str, max_points: int = VIZ_MAX_POINTS) -> None:
+    """Line or scatter chart of chosen columns, reduced to max_points."""
+    names = _column_names(data)
+    if not names:
+        return
+    col1, col2, col3 = st.columns([1, 1, 2])
+    with col1:
+        kind = st.radio("Chart", ["line", "scatter"], key=f"{key}:kind")
+    with col2:
+        x = st.selectbox("X", names, key=f"{key}:x")
+    with col3:
+        ys = st.multiselect(
+            "Y",
+            [n for n in names if n != x],
+            key=f"{key}:y",
+            # A density chart has one value axis
+            max_selections=5 if kind == "line" else 1,
+        )
+    if not ys:
+        st.caption("Pick a Y column.")
+        return
+    df = _to_pandas(data, [x] + ys)
+    if kind == "line":
+        reduced = downsample_line(df, x, ys, max_points)
+        st.line_chart(reduced, x=x, y=ys)
+        st.caption(f"{len(reduced):,} of {len(df):,} points drawn (LTTB)")
+        return
+    reduced, left_out = density_bins(df, x, ys[0], max_points=max_points)
+    st.scatter_chart(reduced, x=x, y=ys[0], size="count")
+    note = f"{len(reduced):,} points drawn from {len(df):,} rows"
+    if left_out:
+        note += f"; {left_out:,.0f} outliers outside the range shown"
+    st.caption(note)
@@ -0,0 +1,299 @@
+"""
+Warehouse wake-up and keep-warm.
+
+start_warmer() is called by every page and starts one daemon thread per process.
+It opens pooled connections, runs a probe query and loads the catalog snapshot
+as soon as the app boots, so the first user does not wait for a stopped
+serverless warehouse. It then probes again every KEEP_WARM_INTERVAL seconds
+during KEEP_WARM_HOURS on KEEP_WARM_DAYS, so the warehouse does not auto-stop
+while people are likely to use the app.
+"""
+
+import logging
+import os
+import threading
+import time
+from contextlib import ExitStack
+from datetime import datetime
+from typing import Any, Dict, Optional, Set, Tuple
+from zoneinfo import ZoneInfo
+
+import streamlit as st
+
+from common import (
+    POOL_MAX_SIZE,
+    SQL_MAX_CONCURRENT,
+    SQL_MAX_PER_USER,
+    _connection,
+    get_config,
+    query_priority,
+    run_sql as sqlQuery,
+    set_page,
+    set_queue_listener,
+)
+
+logger = logging.getLogger(__name__)
+
+# "0" disables the boot-time warm-up (and keep-warm)
+WARMUP_ENABLED = os.getenv("SQL_WARMUP", "1") != "0"
+WARMUP_CONNECTIONS = int(os.getenv("SQL_WARMUP_CONNECTIONS", "2"))
+# Seconds between keep-warm probes; keep it below the warehouse's auto-stop. 0 disables.
+KEEP_WARM_INTERVAL = float(os.getenv("KEEP_WARM_INTERVAL", "240"))
+KEEP_WARM_HOURS = os.getenv("KEEP_WARM_HOURS", "08:00-18:00")
+KEEP_WARM_DAYS = os.getenv("KEEP_WARM_DAYS", "mon,tue,wed,thu,fri")
+KEEP_WARM_TZ = os.getenv("KEEP_WARM_TZ", "UTC")
+# Without a recent probe the warehouse is assumed stopped after this many seconds
+WAREHOUSE_AUTO_STOP = float(os.getenv("WAREHOUSE_AUTO_STOP", "600"))
+# How often the warehouse state is read from the API (no query, does not wake it)
+STATE_POLL_INTERVAL = float(os.getenv("WAREHOUSE_STATE_POLL", "60"))
+
+_DAYS = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+
+
+def _parse_hours(spec: str) -> Tuple[int, int]:
+    """'08:00-18:00' -> minutes since midnight (start, end)."""
+    start, end = (part.strip() for part in spec.split("-", 1))
+
+    def minutes(hhmm: str) -> int:
+        h, _, m = hhmm.partition(":")
+        return int(h) * 60 + int(m or 0)
+
+    return minutes(start), minutes(end)
+
+
+def _parse_days(spec: str) -> Set[int]:
+    return {_DAYS.index(d.strip().lower()[:3]) for d in spec.split(",") if d.strip()}
+
+
+class Warmer:
+    """Boot-time warm-up plus a business-hours keep-warm loop for one warehouse."""
+
+    def __init__(
+        self,
+        connections: int = WARMUP_CONNECTIONS,
+        interval: float = KEEP_WARM_INTERVAL,
+        hours: str = KEEP_WARM_HOURS,
+        days: str = KEEP_WARM_DAYS,
+        tz: str = KEEP_WARM_TZ,
+    ) -> None:
+        # Every connection holds a scheduler slot of the app user while the rest open
+        self.connections = max(
+            0, min(connections, POOL_MAX_SIZE, SQL_MAX_CONCURRENT, SQL_MAX_PER_USER)
+        )
+        self.interval = interval
+        self.hours = _parse_hours(hours)
+        self.days = _parse_days(days)
+        self.tz = ZoneInfo(tz)
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.warming = False
+        self.warehouse_state: Optional[str] = None
+        self.state_checked_at: Optional[float] = None
+        self.last_probe_at: Optional[float] = None
+        self.last_probe_ms: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.probes = 0
+
+    def in_business_hours(self, now: Optional[datetime] = None) -> bool:
+        """Whether `now` falls in the keep-warm window; naive times are in self.tz."""
+        if now is None:
+            now = datetime.now(self.tz)
+        elif now.tzinfo is None:
+            now = now.replace(tzinfo=self.tz)
+        else:
+            now = now.astimezone(self.tz)
+        start, end = self.hours
+        minute = now.hour * 60 + now.minute
+        return now.weekday() in self.days and start <= minute < end
+
+    # -- actions --
+    def warm_up(self) -> None:
+        """Open pooled connections, probe the warehouse and load the catalog snapshot."""
+        with self._lock:
+            self.warming = True
+        try:
+            # Through the scheduler like any query, so the connections count
+            # against its caps and wait behind interactive work
+            with query_priority("background"), ExitStack() as held:
+                # The first connect waits for a stopped warehouse; the rest are quick
+                for _ in range(self.connections):
+                    held.enter_context(_connection())
+            self.probe()
+            catalog = os.getenv("CATALOG_NAME")
+            if catalog:
+                from metadata import get_snapshot
+
+                get_snapshot(catalog, os.getenv("SCHEMA_NAME"))
+        finally:
+            with self._lock:
+                self.warming = False
+
+    def probe(self) -> None:
+        started = time.perf_counter()
+        try:
+            sqlQuery("select 1 as ok")
+        except Exception as e:
+            with self._lock:
+                self.last_error = str(e)
+            raise
+        with self._lock:
+            self.last_probe_at = time.time()
+            self.last_probe_ms = (time.perf_counter() - started) * 1000
+            self.last_error = None
+            self.probes += 1
+            # A query just ran, so the warehouse is up whatever the API said last
+            self.warehouse_state = "RUNNING"
+
+    def check_state(self) -> Optional[str]:
+        """Read the warehouse state (RUNNING, STOPPED, STARTING, ...) from the API."""
+        warehouse_id = os.getenv("DATABRICKS_WAREHOUSE_ID")
+        if not warehouse_id:
+            return None
+        try:
+            from databricks.sdk import WorkspaceClient
+
+            client = WorkspaceClient(config=get_config())
+            info = client.warehouses.get(warehouse_id)
+            state = info.state.value if info.state else None
+        except Exception:
+            # Missing CAN_MONITOR permission or an older SDK; fall back to probes
+            state = None
+        with self._lock:
+            self.warehouse_state = state
+            self.state_checked_at = time.time()
+        return state
+
+    def wake(self) -> None:
+        """Warm up in the background now, unless a warm-up is already running."""
+        with self._lock:
+            if self.warming:
+                return
+            self.warming = True
+        threading.Thread(target=self._wake, name="warehouse-wake", daemon=True).start()
+
+    def _wake(self) -> None:
+        set_page("Warmup", priority="background")
+        try:
+            self.warm_up()
+        except Exception:
+            logger.exception("Warehouse wake-up failed")
+
+    # -- background thread --
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is not None:
+                return
+            self.warming = True
+            self._thread = threading.Thread(
+                target=self._loop, name="warehouse-warmer", daemon=True
+            )
+        self._thread.start()
+
+    def _loop(self) -> None:
+        set_page("Warmup", priority="background")
+        try:
+            self.warm_up()
+        except Exception:
+            logger.exception("Warehouse warm-up failed")
+        tick = min(STATE_POLL_INTERVAL, self.interval or STATE_POLL_INTERVAL)
+        while True:
+            time.sleep(tick)
+            self.check_state()
+            due = self.last_probe_at is None or (
+                time.time() - self.last_probe_at >= self.interval
+            )
+            if self.interval > 0 and due and self.in_business_hours():
+                try:
+                    self.probe()
+                except Exception:
+                    logger.exception("Keep-warm probe failed")
+
+    # -- state --
+    def status(self) -> Dict[str, Any]:
+        """warm / warming / cold, with the details behind it."""
+        with self._lock:
+            recent = self.last_probe_at is not None and (
+                time.time() - self.last_probe_at < WAREHOUSE_AUTO_STOP
+            )
+            if self.warming or self.warehouse_state in ("STARTING", "STOPPING"):
+                state = "warming"
+            elif self.warehouse_state == "RUNNING" or (
+                self.warehouse_state is None and recent
+            ):
+                state = "warm"
+            else:
+                state = "cold"
+            return {
+                "state": state,
+                "warehouse_state": self.warehouse_state,
+                "last_probe_at": self.last_probe_at,
+                "last_probe_ms": self.last_probe_ms,
+                "last_error": self.last_error,
+                "probes": self.probes,
+                "keep_warm_now": self.interval > 0 and self.in_business_hours(),
+            }
+
+
+_warmer_lock = threading.Lock()
+_warmer: Optional[Warmer] = None
+
+
+def get_warmer() -> Warmer:
+    global _warmer
+    with _warmer_lock:
+        if _warmer is None:
+            _warmer = Warmer()
+        return _warmer
+
+
+def start_warmer() -> Optional[Warmer]:
+    """Start the process-wide warmer once; cheap to call on every page run."""
+    if not WARMUP_ENABLED:
+        return None
+    warmer = get_warmer()
+    warmer.start()
+    return warmer
+
+
+def _show_queue_position() -> None:
+    """Sidebar line with the session's place in the query queue while it waits."""
+    slot = st.sidebar.empty()
+
+    def _show(status: Optional[Dict[str, Any]]) -> None:
+        if status is None:
+            slot.empty()
+        elif status["user_limited"]:
+            slot.info(
+                f"{status['waiting']} queued: you already have "
+                f"{status['user_running']} queries running"
+            )
+        else:
+            slot.info(
+                f"Waiting for the warehouse: number {status['position']} of "
+                f"{status['queued']} in line ({status['seconds']:.0f}s)"
+            )
+
+    set_queue_listener(_show)
+
+
+def show_warehouse_state() -> None:
+    """
+    Sidebar lines telling users whether the first query will be slow and, while
+    their queries wait for a slot, where they are in the queue.
+    """
+    _show_queue_position()
+    warmer = start_warmer()
+    if warmer is None:
+        return
+    status = warmer.status()
+    if status["state"] == "warm":
+        detail = ""
+        if status["last_probe_ms"] is not None:
+            detail = f" (probe {status['last_probe_ms']:.0f} ms)"
+        st.sidebar.caption(f"Warehouse: warm{detail}")
+    elif status["state"] == "warming":
+        st.sidebar.caption("Warehouse: starting, first queries may take a while")
+    else:
+        # Someone is here: start the warehouse before their first query needs it
+        warmer.wake()
+        st.sidebar.caption("Warehouse: stopped, starting it now")
@@ -0,0 +1,537 @@
+"""
+Local stand-in for `databricks.sql`, backed by SQLite, for benchmarks.
+
+    SQL_CONNECTOR=fake_warehouse PYTHONPATH=bench streamlit run app/Home.py
+
+common._connect() imports the module named by SQL_CONNECTOR and calls its
+connect(), so the app runs unchanged against a SQLite file (FAKE_WAREHOUSE_DB)
+that every connection and thread shares. Latency is injected per connect, per
+statement and per fetched row, and FAKE_WAREHOUSE_SLOTS caps how many
+statements run at once, like a warehouse's concurrency limit.
+
+Only the SQL the app generates is translated: three-part names, backticks,
+`<=>`, the MERGE shapes built in editing.py and the row hash expression, and
+the bulk loads of bulk_import.py from a local stage directory. Time
+travel (VERSION AS OF) is ignored and DESCRIBE HISTORY fails, so the app treats
+tables as non-Delta. Tables created with create_table() are listed in their
+catalog's information_schema (tables, columns and primary keys), which is what
+the Edit Data page reads.
+"""
+
+import datetime
+import decimal
+import hashlib
+import json
+import math
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import pyarrow as pa
+
+# Same double formatting as the client-side fingerprints (app/ is on sys.path)
+from row_identity import _java_float_str
+
+FAKE_WAREHOUSE_DB = os.getenv(
+    "FAKE_WAREHOUSE_DB", os.path.join(tempfile.gettempdir(), "fake_warehouse.db")
+)
+CONNECT_LATENCY = float(os.getenv("FAKE_WAREHOUSE_CONNECT_MS", "0")) / 1000
+QUERY_LATENCY = float(os.getenv("FAKE_WAREHOUSE_QUERY_MS", "0")) / 1000
+ROW_LATENCY = float(os.getenv("FAKE_WAREHOUSE_ROW_US", "0")) / 1_000_000
+SLOTS = int(os.getenv("FAKE_WAREHOUSE_SLOTS", "0"))
+
+_slots = threading.BoundedSemaphore(SLOTS) if SLOTS > 0 else None
+
+
+class Error(Exception):
+    pass
+
+
+# ---------- Dialect ----------
+_THREE_PART = re.compile(r"`?(\w+)`?\.`?(\w+)`?\.`?(\w+)`?")
+_BACKTICK = re.compile(r"`([^`]*)`")
+_VERSION_AS_OF = re.compile(r"\s+VERSION\s+AS\s+OF\s+\d+", re.IGNORECASE)
+_DELETE_ALIAS = re.compile(
+    r"^(\s*DELETE\s+FROM\s+\S+)\s+(?!AS\b|WHERE\b)(\w+)\s+WHERE\b", re.IGNORECASE
+)
+_MERGE = re.compile(
+    r"^\s*MERGE\s+INTO\s+(?P<target>\S+)\s+t\s+USING\s+\(SELECT\s+\*\s+FROM\s+VALUES\s+"
+    r"(?P<values>.*)\)\s+AS\s+s\((?P<cols>[^)]*)\)\s+ON\s+(?P<on>.*?)\s+"
+    r"WHEN\s+(?P<when>MATCHED|NOT\s+MATCHED)\s+THEN\s+(?P<action>.*)$",
+    re.IGNORECASE | re.DOTALL,
+)
+_SET_TARGET = re.compile(r"(^|,\s*)t\.")
+_COPY_INTO = re.compile(
+    r"^\s*COPY\s+INTO\s+(?P<target>\S+)\s+FROM\s+'(?P<path>[^']*)'\s+"
+    r"FILEFORMAT\s*=\s*PARQUET\b",
+    re.IGNORECASE,
+)
+_MERGE_FILES = re.compile(
+    r"^\s*MERGE\s+INTO\s+(?P<target>\S+)\s+t\s+USING\s+\(SELECT\s+(?P<cols>.*?)\s+"
+    r"FROM\s+read_files\('(?P<path>[^']*)',\s*format\s*=>\s*'parquet'\)\)\s+s\s+"
+    r"ON\s+(?P<on>.*?)\s+(?P<whens>WHEN\s.*)$",
+    re.IGNORECASE | re.DOTALL,
+)
+_WHEN = re.compile(
+    r"WHEN\s+(?P<when>MATCHED|NOT\s+MATCHED)\s+THEN\s+(?P<action>.*?)\s*(?=WHEN\s|$)",
+    re.IGNORECASE | re.DOTALL,
+)
+
+
+def _merge(m: "re.Match[str]") -> str:
+    target, on, action = m["target"], m["on"], m["action"].strip()
+    head = f"WITH s({m['cols']}) AS (VALUES {m['values']}) "
+    if m["when"].upper() == "MATCHED" and action.upper() == "DELETE":
+        # Driven by s, so an index on the target's key is used
+        matched = f"SELECT t.rowid FROM s JOIN {target} AS t ON {on}"
+        return f"{head}DELETE FROM {target} WHERE rowid IN ({matched})"
+    if m["when"].upper() == "MATCHED":
+        set_sql = _SET_TARGET.sub(r"\1", action[len("UPDATE SET") :].strip())
+        return f"{head}UPDATE {target} AS t SET {set_sql} FROM s WHERE {on}"
+    insert = re.match(r"INSERT\s+\((.*?)\)\s+VALUES\s+\((.*)\)$", action, re.DOTALL)
+    if not insert:
+        raise Error(f"unsupported MERGE action: {action}")
+    return (
+        f"{head}INSERT INTO {target} ({insert[1]}) SELECT {insert[2]} FROM s "
+        f"WHERE NOT EXISTS (SELECT 1 FROM {target} AS t WHERE {on})"
+    )
+
+
+def _merge_files(m: "re.Match[str]") -> List[str]:
+    # The staged files are loaded into the temp table s first (see Cursor)
+    target, on = m["target"], m["on"]
+    statements = []
+    for when in _WHEN.finditer(m["whens"]):
+        action = when["action"]
+        if when["when"].upper() == "MATCHED":
+            set_sql = _SET_TARGET.sub(r"\1", action[len("UPDATE SET") :].strip())
+            statements.append(f"UPDATE {target} AS t SET {set_sql} FROM s WHERE {on}")
+            continue
+        insert = re.match(r"INSERT\s+\((.*?)\)\s+VALUES\s+\((.*)\)$", action, re.DOTALL)
+        if not insert:
+            raise Error(f"unsupported MERGE action: {action}")
+        statements.append(
+            f"INSERT INTO {target} ({insert[1]}) SELECT {insert[2]} FROM s "
+            f"WHERE NOT EXISTS (SELECT 1 FROM {target} AS t WHERE {on})"
+        )
+    return statements
+
+
+def translate(query: str) -> str:
+    """Databricks SQL as generated by the app -> SQLite."""
+    query = _VERSION_AS_OF.sub("", query)
+    query = _THREE_PART.sub(lambda m: f'"{m[1]}.{m[2]}.{m[3]}"', query)
+    query = _BACKTICK.sub(lambda m: '"' + m[1].replace('"', '""') + '"', query)
+    query = query.replace("<=>", " IS ")
+    merge = _MERGE.match(query)
+    if merge:
+        return _merge(merge)
+    return _DELETE_ALIAS.sub(r"\1 AS \2 WHERE", query)
+
+
+# ---------- Functions ----------
+def _json_value(value: Any) -> str:
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, int):
+        return str(value)
+    if isinstance(value, float):
+        if math.isnan(value) or math.isinf(value):
+            return json.dumps(str(value))
+        return _java_float_str(value, repr(value))
+    return json.dumps(value, ensure_ascii=False)
+
+
+def _named_struct(*args: Any) -> str:
+    # Rendered straight to JSON; to_json() is then the identity. Null fields are
+    # left out like Spark does.
+    fields = [
+        f"{json.dumps(args[i], ensure_ascii=False)}:{_json_value(args[i + 1])}"
+        for i in range(0, len(args), 2)
+        if args[i + 1] is not None
+    ]
+    return "{" + ",".join(fields) + "}"
+
+
+def _sha2(value: Optional[str], bits: int) -> Optional[str]:
+    if value is None:
+        return None
+    return hashlib.new(f"sha{int(bits)}", str(value).encode("utf-8")).hexdigest()
+
+
+def _register(conn: sqlite3.Connection) -> None:
+    conn.create_function("named_struct", -1, _named_struct, deterministic=True)
+    conn.create_function("to_json", 1, lambda v: v, deterministic=True)
+    conn.create_function("sha2", 2, _sha2, deterministic=True)
+    # Built in from SQLite 3.44 only
+    conn.create_function(
+        "concat",
+        -1,
+        lambda *a: None if None in a else "".join(map(str, a)),
+        deterministic=True,
+    )
+    conn.create_function(
+        "floor", 1, lambda v: None if v is None else math.floor(v), deterministic=True
+    )
+
+
+# ---------- Files ----------
+def _sqlite_value(value: Any) -> Any:
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, datetime.datetime):
+        return value.isoformat(sep=" ")
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    return value
+
+
+def _parquet_files(path: str) -> List[str]:
+    if not os.path.isdir(path):
+        raise Error(f"path does not exist: {path}")
+    return sorted(
+        os.path.join(path, n) for n in os.listdir(path) if n.endswith(".parquet")
+    )
+
+
+def _parquet_rows(path: str) -> Iterable[tuple]:
+    import pyarrow.parquet as pq
+
+    for batch in pq.ParquetFile(path).iter_batches():
+        columns = [batch.column(i).to_pylist() for i in range(batch.num_columns)]
+        for row in zip(*columns):
+            yield tuple(_sqlite_value(v) for v in row)
+
+
+# ---------- Arrow ----------
+def _to_arrow(
+    names: Sequence[str], rows: List[tuple], schema: Optional[pa.Schema]
+) -> pa.Table:
+    columns = list(zip(*rows)) if rows else [()] * len(names)
+    if schema is not None:
+        arrays = [pa.array(c, type=f.type) for c, f in zip(columns, schema)]
+        return pa.Table.from_arrays(arrays, schema=schema)
+    arrays = [pa.array(c) if rows else pa.array([], pa.null()) for c in columns]
+    return pa.Table.from_arrays(arrays, names=list(names))
+
+
+# ---------- DB-API ----------
+class Cursor:
+    def __init__(self, connection: "Connection") -> None:
+        self.connection = connection
+        self._cursor = connection._db.cursor()
+        self._names: List[str] = []
+        self._schema: Optional[pa.Schema] = None
+        self._affected: Optional[int] = None
+
+    def __enter__(self) -> "Cursor":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+    def execute(self, query: str, parameters: Optional[Dict[str, Any]] = None) -> None:
+        if _slots is not None:
+            _slots.acquire()
+        try:
+            time.sleep(QUERY_LATENCY)
+            changes = self.connection._db.total_changes
+            statement = translate(query)
+            bulk = self._bulk_load(statement)
+            if bulk is None:
+                self._cursor.execute(statement, parameters or {})
+        except sqlite3.Error as e:
+            raise Error(str(e)) from e
+        finally:
+            if _slots is not None:
+                _slots.release()
+        self._schema = None
+        if self._cursor.description and bulk is None:
+            self._names = [d[0] for d in self._cursor.description]
+            self._affected = None
+        else:
+            # DML: the warehouse answers with the affected row count (rowcount is
+            # -1 for statements starting with WITH)
+            self._names = []
+            self._affected = self.connection._db.total_changes - changes - (bulk or 0)
+
+    def _bulk_load(self, statement: str) -> Optional[int]:
+        """
+        Run a COPY INTO or a MERGE from read_files and return the number of
+        bookkeeping rows it wrote; None for any other statement.
+        """
+        copy, merge = _COPY_INTO.match(statement), _MERGE_FILES.match(statement)
+        if copy is None and merge is None:
+            return None
+        db = self.connection._db
+        changes = db.total_changes
+        bookkeeping = 0
+        db.execute("BEGIN")
+        try:
+            if copy is not None:
+                target = copy["target"]
+                # COPY INTO skips files it loaded before
+                db.execute(
+                    "CREATE TABLE IF NOT EXISTS __copy_into_files (tbl TEXT, file TEXT)"
+                )
+                done = {
+                    f
+                    for (f,) in db.execute(
+                        "SELECT file FROM __copy_into_files WHERE tbl = ?", (target,)
+                    )
+                }
+                for path in _parquet_files(copy["path"]):
+                    if path in done:
+                        continue
+                    self._insert_file(target, path)
+                    db.execute(
+                        "INSERT INTO __copy_into_files VALUES (?, ?)", (target, path)
+                    )
+                    bookkeeping += 1
+            else:
+                db.execute("DROP TABLE IF EXISTS temp.s")
+                db.execute(
+                    f"CREATE TEMP TABLE s AS SELECT {merge['cols']} "
+                    f"FROM {merge['target']} WHERE 0"
+                )
+                for path in _parquet_files(merge["path"]):
+                    self._insert_file("temp.s", path)
+                # The staged rows are not changes to the table
+                bookkeeping = db.total_changes - changes
+                for sql in _merge_files(merge):
+                    db.execute(sql)
+                db.execute("DROP TABLE temp.s")
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        return bookkeeping
+
+    def _insert_file(self, target: str, path: str) -> None:
+        import pyarrow.parquet as pq
+
+        names = pq.ParquetFile(path).schema_arrow.names
+        cols_sql = ", ".join('"' + n.replace('"', '""') + '"' for n in names)
+        marks = ", ".join("?" for _ in names)
+        self.connection._db.executemany(
+            f"INSERT INTO {target} ({cols_sql}) VALUES ({marks})", _parquet_rows(path)
+        )
+
+    def executemany(
+        self, query: str, seq_of_parameters: Iterable[Dict[str, Any]]
+    ) -> None:
+        # The real connector sends one request per parameter set
+        for parameters in seq_of_parameters:
+            self.execute(query, parameters)
+
+    def _rows(self, size: Optional[int]) -> List[tuple]:
+        if self._affected is not None:
+            return []
+        rows = self._cursor.fetchall() if size is None else self._cursor.fetchmany(size)
+        time.sleep(ROW_LATENCY * len(rows))
+        return rows
+
+    def _arrow(self, size: Optional[int]) -> pa.Table:
+        if self._affected is not None:
+            affected, self._affected = self._affected, None
+            return pa.table({"num_affected_rows": pa.array([affected], pa.int64())})
+        table = _to_arrow(self._names, self._rows(size), self._schema)
+        if self._schema is None and table.num_rows:
+            # Later batches keep the types of the first one
+            self._schema = table.schema
+        return table
+
+    def fetchall(self) -> List[tuple]:
+        return self._rows(None)
+
+    def fetchall_arrow(self) -> pa.Table:
+        return self._arrow(None)
+
+    def fetchmany_arrow(self, size: int) -> pa.Table:
+        return self._arrow(size)
+
+    def cancel(self) -> None:
+        self.connection._db.interrupt()
+
+    def close(self) -> None:
+        self._cursor.close()
+
+
+class Connection:
+    def __init__(self, path: str = FAKE_WAREHOUSE_DB) -> None:
+        time.sleep(CONNECT_LATENCY)
+        self._db = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None, timeout=60
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        _register(self._db)
+        self.open = True
+
+    def __enter__(self) -> "Connection":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+    def cursor(self) -> Cursor:
+        return Cursor(self)
+
+    def close(self) -> None:
+        if self.open:
+            self._db.close()
+            self.open = False
+
+
+def connect(**_: Any) -> Connection:
+    """Same call as databricks.sql.connect; connection arguments are ignored."""
+    return Connection()
+
+
+# ---------- Seeding ----------
+def create_table(
+    fqn: str,
+    table: pa.Table,
+    index: Sequence[str] = (),
+    path: Optional[str] = None,
+    replace: bool = True,
+    primary_key: Sequence[str] = (),
+) -> None:
+    """
+    Create `catalog.schema.table` from an Arrow table, without latency, and
+    list it in information_schema.
+    """
+    path = path or FAKE_WAREHOUSE_DB
+    types = {
+        pa.types.is_integer: "INTEGER",
+        pa.types.is_floating: "REAL",
+        pa.types.is_boolean: "INTEGER",
+    }
+    cols = []
+    for field in table.schema:
+        sql_type = next((t for check, t in types.items() if check(field.type)), "TEXT")
+        cols.append(f'"{field.name}" {sql_type}')
+    name = f'"{fqn}"'
+    marks = ", ".join("?" for _ in table.column_names)
+    rows = zip(*(table.column(c).to_pylist() for c in table.column_names))
+    with sqlite3.connect(path, isolation_level=None) as db:
+        db.execute("PRAGMA journal_mode=WAL")
+        if replace:
+            db.execute(f"DROP TABLE IF EXISTS {name}")
+        db.execute(f"CREATE TABLE IF NOT EXISTS {name} ({', '.join(cols)})")
+        if index:
+            # Stands in for data skipping on the key
+            cols_sql = ", ".join(f'"{c}"' for c in index)
+            db.execute(f'CREATE INDEX IF NOT EXISTS "{fqn}.idx" ON {name} ({cols_sql})')
+        db.execute("BEGIN")
+        db.executemany(f"INSERT INTO {name} VALUES ({marks})", rows)
+        db.execute("COMMIT")
+    db.close()
+    describe_table(fqn, table.schema, primary_key, path)
+
+
+_INFORMATION_SCHEMA = {
+    "tables": "table_schema, table_name, table_type, last_altered",
+    "columns": "table_schema, table_name, column_name, data_type, is_nullable, "
+    "ordinal_position",
+    "table_constraints": "constraint_name, table_schema, table_name, constraint_type",
+    "key_column_usage": "constraint_name, table_schema, table_name, column_name, "
+    "ordinal_position",
+}
+_DATA_TYPES = [
+    (pa.types.is_int8, "tinyint"),
+    (pa.types.is_int16, "smallint"),
+    (pa.types.is_int32, "int"),
+    (pa.types.is_integer, "bigint"),
+    (pa.types.is_float32, "float"),
+    (pa.types.is_floating, "double"),
+    (pa.types.is_boolean, "boolean"),
+    (pa.types.is_date, "date"),
+    (pa.types.is_timestamp, "timestamp"),
+    (pa.types.is_decimal, "decimal"),
+]
+
+
+def _data_type(dtype: pa.DataType) -> str:
+    name = next((n for check, n in _DATA_TYPES if check(dtype)), "string")
+    if name == "decimal":
+        return f"decimal({dtype.precision},{dtype.scale})"
+    return name
+
+
+def _information_schema(db: sqlite3.Connection, catalog: str) -> Dict[str, str]:
+    names = {}
+    for view, cols in _INFORMATION_SCHEMA.items():
+        names[view] = f'"{catalog}.information_schema.{view}"'
+        db.execute(f"CREATE TABLE IF NOT EXISTS {names[view]} ({cols})")
+    return names
+
+
+def describe_table(
+    fqn: str,
+    schema: pa.Schema,
+    primary_key: Sequence[str] = (),
+    path: Optional[str] = None,
+    last_altered: Optional[str] = None,
+) -> None:
+    """(Re)list a table in information_schema; last_altered defaults to now."""
+    catalog, schema_name, table = fqn.split(".")
+    altered = last_altered or datetime.datetime.now().isoformat(sep=" ")
+    with sqlite3.connect(path or FAKE_WAREHOUSE_DB, isolation_level=None) as db:
+        db.execute("BEGIN")
+        _forget(db, catalog, schema_name, table)
+        views = _information_schema(db, catalog)
+        db.execute(
+            f"INSERT INTO {views['tables']} VALUES (?, ?, 'MANAGED', ?)",
+            (schema_name, table, altered),
+        )
+        db.executemany(
+            f"INSERT INTO {views['columns']} VALUES (?, ?, ?, ?, ?, ?)",
+            [
+                (
+                    schema_name,
+                    table,
+                    f.name,
+                    _data_type(f.type),
+                    "NO" if f.name in primary_key else "YES",
+                    i + 1,
+                )
+                for i, f in enumerate(schema)
+            ],
+        )
+        if primary_key:
+            constraint = f"{table}_pk"
+            db.execute(
+                f"INSERT INTO {views['table_constraints']} "
+                "VALUES (?, ?, ?, 'PRIMARY KEY')",
+                (constraint, schema_name, table),
+            )
+            db.executemany(
+                f"INSERT INTO {views['key_column_usage']} VALUES (?, ?, ?, ?, ?)",
+                [
+                    (constraint, schema_name, table, c, i + 1)
+                    for i, c in enumerate(primary_key)
+                ],
+            )
+        db.execute("COMMIT")
+    db.close()
+
+
+def _forget(db: sqlite3.Connection, catalog: str, schema: str, table: str) -> None:
+    for view in _information_schema(db, catalog).values():
+        db.execute(
+            f"DELETE FROM {view} WHERE table_schema = ? AND table_name = ?",
+            (schema, table),
+        )
+
+
+def drop_table(fqn: str, path: Optional[str] = None) -> None:
+    """Drop a table and its information_schema entries."""
+    catalog, schema, table = fqn.split(".")
+    with sqlite3.connect(path or FAKE_WAREHOUSE_DB, isolation_level=None) as db:
+        db.execute(f'DROP TABLE IF EXISTS "{fqn}"')
+        _forget(db, catalog, schema, table)
+    db.close()
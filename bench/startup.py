@@ -0,0 +1,122 @@
+"""
+Startup benchmark: module import time and a headless first render of the pages
+that do not need a warehouse.
+
+    uv run python bench/startup.py --max-import-ms 1500 --max-render-ms 3000
+
+Imports are measured in fresh interpreters with `python -X importtime`. Pages
+are rendered with streamlit.testing.v1.AppTest. Exits non-zero when a budget is
+exceeded, so it can gate CI.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_DIR = os.path.join(ROOT, "app")
+
+MODULES = ["common", "editing", "metadata", "save_jobs"]
+# Packages that must stay lazy (imported on first query, not with the app modules)
+LAZY = ("databricks",)
+# Pages whose first run issues no queries
+PAGES = ["Home.py", "pages/02_SQL_Query.py", "pages/04_Performance.py"]
+
+
+def import_times(
+    module: str, top: int = 10
+) -> Tuple[float, List[Dict[str, Any]], List[str]]:
+    """Cumulative import time of `module` (ms), its slowest imports and eager LAZY ones."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=APP_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        rows.append(
+            {
+                "module": name.strip(),
+                "self_ms": int(self_us) / 1000,
+                "ms": int(cumulative_us) / 1000,
+            }
+        )
+    total = next((r["ms"] for r in rows if r["module"] == module), 0.0)
+    eager = [r["module"] for r in rows if r["module"].split(".")[0] in LAZY]
+    rows.sort(key=lambda r: r["ms"], reverse=True)
+    return total, rows[:top], eager
+
+
+def render_times(pages: List[str]) -> Dict[str, Dict[str, float]]:
+    """First (cold) and second (rerun) render of each page, in ms."""
+    from streamlit.testing.v1 import AppTest
+
+    # Measure the render itself, not a warehouse wake-up started by the pages
+    os.environ.setdefault("SQL_WARMUP", "0")
+    sys.path.insert(0, APP_DIR)
+    out = {}
+    for page in pages:
+        app = AppTest.from_file(os.path.join(APP_DIR, page), default_timeout=60)
+        started = time.perf_counter()
+        app.run()
+        cold = time.perf_counter() - started
+        if app.exception:
+            raise RuntimeError(f"{page} raised: {app.exception[0].message}")
+        started = time.perf_counter()
+        app.run()
+        out[page] = {
+            "first_ms": cold * 1000,
+            "rerun_ms": (time.perf_counter() - started) * 1000,
+        }
+    return out
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--max-import-ms", type=float, default=None)
+    parser.add_argument("--max-render-ms", type=float, default=None)
+    parser.add_argument("--no-render", action="store_true", help="only measure imports")
+    parser.add_argument("--json", help="write the report to this file")
+    args = parser.parse_args()
+
+    report: Dict[str, Any] = {"imports": {}, "renders": {}}
+    failures = []
+    for module in MODULES:
+        total, slowest, eager = import_times(module)
+        report["imports"][module] = {"ms": total, "slowest": slowest, "eager": eager}
+        print(f"import {module:<12} {total:8.1f} ms")
+        if eager:
+            failures.append(f"import {module} loads {', '.join(eager[:3])} eagerly")
+        if args.max_import_ms is not None and total > args.max_import_ms:
+            failures.append(
+                f"import {module}: {total:.0f} ms > {args.max_import_ms:.0f} ms"
+            )
+    if not args.no_render:
+        report["renders"] = render_times(PAGES)
+        for page, t in report["renders"].items():
+            print(
+                f"render {page:<26} {t['first_ms']:8.1f} ms (rerun {t['rerun_ms']:.1f} ms)"
+            )
+            if args.max_render_ms is not None and t["first_ms"] > args.max_render_ms:
+                failures.append(
+                    f"render {page}: {t['first_ms']:.0f} ms > {args.max_render_ms:.0f} ms"
+                )
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    for failure in failures:
+        print(f"OVER BUDGET: {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,636 @@
+"""
+Benchmark suite run against the local fake warehouse (bench/fake_warehouse.py).
+
+    uv run python bench/suite.py --json report.json --query-ms 50
+    uv run python bench/suite.py --baseline last-release.json --max-regression 20
+
+Scenarios:
+- taxi_fares: the page's first render (empty caches) and a rerun, via AppTest
+- sql_query: streaming and fetching a large result
+- edit_data: load, diff (editor deltas vs full diff) and save, at 1k-100k rows
+- params: one statement per row vs executemany vs multi-row VALUES
+- sessions: concurrent simulated sessions rendering Taxi Fares via AppTest
+- viz: reducing a large result to what a chart sends to the browser
+- page_memory: process RSS and Arrow memory while each page renders via AppTest
+
+The report holds one flat dict of metrics per scenario. Metrics ending in _ms
+or _mb are lower-is-better and those ending in _per_s higher-is-better, so two
+reports (e.g. two releases) are compared metric by metric with --baseline.
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_DIR = os.path.join(ROOT, "app")
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+
+TRIPS = "samples.nyctaxi.trips"
+EDIT_SCHEMA = ("bench", "edit")
+EDIT_SIZES = [1_000, 10_000, 100_000]
+# Rows per Edit Data page in page_memory (the page's maximum)
+EDIT_PAGE_ROWS = 10_000
+
+
+# ---------- Helpers ----------
+def _ms(seconds: float) -> float:
+    return round(seconds * 1000, 3)
+
+
+def _timed(fn: Callable[[], Any]) -> Tuple[Any, float]:
+    started = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - started
+
+
+def _peak_mb(fn: Callable[[], Any]) -> float:
+    """Peak traced allocation of one call in MB (tracing slows it; time it apart)."""
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return round(peak / (1024 * 1024), 3)
+
+
+def _rss_bytes() -> int:
+    """Resident set size of this process (Linux); 0 where /proc is unavailable."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return 0
+
+
+class MemorySampler:
+    """
+    Peak and retained process RSS and Arrow pool bytes over a block, sampled
+    from a background thread. tracemalloc (_peak_mb) only sees Python
+    allocations; Arrow buffers and pandas/NumPy blocks show up here.
+    """
+
+    def __init__(self, interval: float = 0.002) -> None:
+        self.interval = interval
+        self._stop = threading.Event()
+        self.metrics: Dict[str, float] = {}
+
+    def _sample(self) -> Tuple[int, int]:
+        return _rss_bytes(), pa.total_allocated_bytes()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            rss, arrow = self._sample()
+            self._peak = (max(self._peak[0], rss), max(self._peak[1], arrow))
+
+    def __enter__(self) -> "MemorySampler":
+        gc.collect()
+        self._start = self._peak = self._sample()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self._stop.set()
+        self._thread.join()
+        gc.collect()
+        end = self._sample()
+        peak = (max(self._peak[0], end[0]), max(self._peak[1], end[1]))
+
+        def mb(now: int, start: int) -> float:
+            # Memory of earlier work released inside the block is not credited
+            return round(max(0, now - start) / (1024 * 1024), 3)
+
+        self.metrics = {
+            "rss_peak_mb": mb(peak[0], self._start[0]),
+            "rss_retained_mb": mb(end[0], self._start[0]),
+            "arrow_peak_mb": mb(peak[1], self._start[1]),
+            "arrow_retained_mb": mb(end[1], self._start[1]),
+        }
+
+
+def _percentiles(samples: List[float], prefix: str) -> Dict[str, float]:
+    ordered = sorted(samples)
+    p95 = ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))]
+    return {
+        f"{prefix}_p50_ms": _ms(statistics.median(ordered)),
+        f"{prefix}_p95_ms": _ms(p95),
+        f"{prefix}_max_ms": _ms(ordered[-1]),
+    }
+
+
+def _reset_caches() -> None:
+    """Empty the result cache and the Streamlit data cache between measurements."""
+    from common import ResultCache, set_result_cache
+
+    set_result_cache(ResultCache())
+    try:
+        import streamlit as st
+
+        st.cache_data.clear()
+    except ImportError:
+        pass
+
+
+# ---------- Data ----------
+def trips_table(rows: int, seed: int = 0) -> pa.Table:
+    rng = np.random.default_rng(seed)
+    distance = np.round(rng.gamma(2.0, 1.5, rows), 2)
+    fare = np.round(2.5 + distance * 2.5 + rng.normal(0, 2, rows).clip(-2), 2)
+    start = np.datetime64("2016-01-01T00:00:00") + rng.integers(0, 60 * 86400, rows)
+    pickup = rng.integers(10001, 10100, rows)
+    dropoff = rng.integers(10001, 11300, rows)
+    return pa.table(
+        {
+            "tpep_pickup_datetime": start.astype(str),
+            "tpep_dropoff_datetime": (start + (distance * 240).astype(int)).astype(str),
+            "trip_distance": distance,
+            "fare_amount": fare,
+            "pickup_zip": pickup,
+            "dropoff_zip": dropoff,
+        }
+    )
+
+
+def edit_table(rows: int, seed: int = 0) -> pa.Table:
+    rng = np.random.default_rng(seed)
+    return pa.table(
+        {
+            "id": np.arange(rows, dtype=np.int64),
+            "name": [f"item-{i}" for i in range(rows)],
+            "qty": rng.integers(0, 1000, rows),
+            "price": np.round(rng.uniform(1, 500, rows), 2),
+        }
+    )
+
+
+# ---------- Scenarios ----------
+def _app_test(page: str):
+    from streamlit.testing.v1 import AppTest
+
+    return AppTest.from_file(os.path.join(APP_DIR, page), default_timeout=600)
+
+
+def bench_taxi_fares(repeat: int) -> Dict[str, Any]:
+    cold, warm = [], []
+    for _ in range(repeat):
+        _reset_caches()
+        app = _app_test("pages/01_Taxi_Fares.py")
+        _, seconds = _timed(app.run)
+        if app.exception:
+            raise RuntimeError(app.exception[0].message)
+        cold.append(seconds)
+        warm.append(_timed(app.run)[1])
+    return {**_percentiles(cold, "first_render"), **_percentiles(warm, "rerun")}
+
+
+def bench_sql_query(repeat: int) -> Dict[str, Any]:
+    from common import STREAM_MAX_ROWS, run_sql_arrow, run_sql_stream
+
+    query = f"select * from {TRIPS}"
+    first, total, fetch = [], [], []
+    rows = mb = 0.0
+    for _ in range(repeat):
+        stream = run_sql_stream(query, max_rows=STREAM_MAX_ROWS)
+        started = time.perf_counter()
+        for i, _batch in enumerate(stream):
+            if i == 0:
+                first.append(time.perf_counter() - started)
+        total.append(time.perf_counter() - started)
+        rows, mb = stream.rows, stream.bytes / (1024 * 1024)
+        fetch.append(_timed(lambda: run_sql_arrow(query))[1])
+    return {
+        "rows": int(rows),
+        "result_mb": round(mb, 3),
+        **_percentiles(first, "stream_first_batch"),
+        **_percentiles(total, "stream_total"),
+        **_percentiles(fetch, "fetch_all"),
+        "stream_rows_per_s": round(rows / statistics.median(total), 1),
+    }
+
+
+def _editor_session(
+    base: pd.DataFrame, edit_share: float, seed: int = 0
+) -> Tuple[Dict[str, Any], pd.DataFrame]:
+    """
+    data_editor state and returned frame after editing, deleting and adding
+    `edit_share` of the rows each.
+    """
+    rng = np.random.default_rng(seed)
+    n = len(base)
+    k = max(1, int(n * edit_share))
+    picked = rng.choice(n, size=3 * k, replace=False)
+    edited_pos, deleted_pos, added = picked[:k], sorted(picked[k : 2 * k]), k
+    edited = base.copy()
+    qty = edited.columns.get_loc("qty")
+    state: Dict[str, Any] = {"edited_rows": {}, "deleted_rows": [], "added_rows": []}
+    for pos in edited_pos:
+        value = int(edited.iat[pos, qty]) + 1
+        edited.iat[pos, qty] = value
+        state["edited_rows"][int(pos)] = {"qty": value}
+    state["deleted_rows"] = [int(p) for p in deleted_pos]
+    edited = edited.drop(edited.index[deleted_pos])
+    new_rows = [
+        {"id": n + i, "name": f"new-{i}", "qty": i, "price": 1.0} for i in range(added)
+    ]
+    state["added_rows"] = new_rows
+    # The editor gives added rows no fingerprint; any label unknown to base will do
+    index = pd.Index([f"new-{i}" for i in range(added)], name=base.index.name)
+    new = pd.DataFrame(new_rows, index=index).astype(base.dtypes.to_dict())
+    return state, pd.concat([edited, new])
+
+
+def bench_edit_data(sizes: List[int], edit_share: float) -> Dict[str, Any]:
+    from common import arrow_to_pandas, run_sql_arrow
+    from editing import (
+        DeltaChanges,
+        _sql_fqn,
+        apply_changes_batched,
+        compute_changes_by_index,
+    )
+    from row_identity import RowIndex, row_fingerprints
+
+    import fake_warehouse
+
+    out: Dict[str, Any] = {"edit_share": edit_share}
+    for n in sizes:
+        catalog, schema = EDIT_SCHEMA
+        table = f"rows_{n}"
+        fake_warehouse.create_table(
+            f"{catalog}.{schema}.{table}", edit_table(n), index=["id"]
+        )
+        _reset_caches()
+        fqn = _sql_fqn(catalog, schema, table)
+        columns = ["id", "name", "qty", "price"]
+
+        def load():
+            # Same shape as the Edit Data page for a table with a key
+            arrow = run_sql_arrow(f"select t.* from {fqn} t order by t.`id` limit {n}")
+            fingerprints, _ = row_fingerprints(arrow, columns)
+            df = arrow_to_pandas(arrow, self_destruct=False)
+            df.index = fingerprints
+            df.index.name = "_row_hash"
+            return df
+
+        base, load_s = _timed(load)
+        with MemorySampler() as load_memory:
+            load()
+        state, edited = _editor_session(base, edit_share)
+        full, full_s = _timed(lambda: compute_changes_by_index(base, edited))
+        full_mb = _peak_mb(lambda: compute_changes_by_index(base, edited))
+
+        def from_deltas():
+            tracker = DeltaChanges(base)
+            tracker.apply(state, edited)
+            return tracker.changes()
+
+        delta, delta_s = _timed(from_deltas)
+        delta_mb = _peak_mb(from_deltas)
+        inserts, updates, deletes = RowIndex(base).rekey(edited, *delta, ["id"])
+        report, save_s = _timed(
+            lambda: apply_changes_batched(
+                catalog, schema, table, columns, inserts, updates, deletes, ["id"]
+            )
+        )
+        changed = len(inserts) + len(updates) + len(deletes)
+        out[f"rows_{n}"] = {
+            "load_ms": _ms(load_s),
+            "load_rows_per_s": round(n / load_s, 1),
+            "load_arrow_peak_mb": load_memory.metrics["arrow_peak_mb"],
+            "full_diff_ms": _ms(full_s),
+            "full_diff_peak_mb": full_mb,
+            "delta_diff_ms": _ms(delta_s),
+            "delta_diff_peak_mb": delta_mb,
+            "changes": changed,
+            "changes_match": all(len(a) == len(b) for a, b in zip(full, delta)),
+            "save_ms": _ms(save_s),
+            "save_statements": len(report),
+            "save_rows_per_s": round(changed / save_s, 1),
+        }
+    return out
+
+
+def bench_params(rows: int) -> Dict[str, Any]:
+    from common import run_sql, run_sql_many
+    from editing import _sql_fqn, build_insert_statements
+
+    import fake_warehouse
+
+    catalog, schema = EDIT_SCHEMA
+    columns = ["id", "name", "qty", "price"]
+    data = edit_table(rows).to_pylist()
+    fqn = _sql_fqn(catalog, schema, "params")
+    insert = (
+        f"insert into {fqn} (id, name, qty, price) values (:id, :name, :qty, :price)"
+    )
+
+    def reset() -> None:
+        fake_warehouse.create_table(f"{catalog}.{schema}.params", edit_table(0))
+
+    def per_row() -> None:
+        for row in data:
+            run_sql(insert, parameters=row)
+
+    def many() -> None:
+        run_sql_many(insert, data)
+
+    def values() -> None:
+        for _, statement, params, _n in build_insert_statements(fqn, columns, data):
+            run_sql(statement, parameters=params)
+
+    out: Dict[str, Any] = {"rows": rows}
+    variants = [
+        ("statement_per_row", per_row),
+        ("executemany", many),
+        ("multi_row_values", values),
+    ]
+    for name, fn in variants:
+        reset()
+        seconds = _timed(fn)[1]
+        out[f"{name}_ms"] = _ms(seconds)
+        out[f"{name}_rows_per_s"] = round(rows / seconds, 1)
+    return out
+
+
+def bench_viz(rows: int, repeat: int) -> Dict[str, Any]:
+    from viz import VIZ_MAX_POINTS, density_bins, downsample_line
+
+    trips = trips_table(rows).to_pandas()
+    trips["tpep_pickup_datetime"] = pd.to_datetime(trips["tpep_pickup_datetime"])
+    density, line = [], []
+    points = {}
+    for _ in range(repeat):
+        (binned, _), seconds = _timed(
+            lambda: density_bins(trips, "trip_distance", "fare_amount")
+        )
+        density.append(seconds)
+        sampled, seconds = _timed(
+            lambda: downsample_line(trips, "tpep_pickup_datetime", ["fare_amount"])
+        )
+        line.append(seconds)
+        points = {"density_points": len(binned), "line_points": len(sampled)}
+    return {
+        "rows": rows,
+        "max_points": VIZ_MAX_POINTS,
+        **points,
+        **_percentiles(density, "density_bins"),
+        **_percentiles(line, "lttb"),
+    }
+
+
+def bench_page_memory(edit_rows: int = EDIT_PAGE_ROWS) -> Dict[str, Any]:
+    """
+    Memory of one render per page, empty caches first. Edit Data renders one
+    page of edit_rows rows of a table with a primary key (read as Arrow and
+    converted without self_destruct) and of one without (hashed and sorted by
+    the warehouse).
+    """
+    import fake_warehouse
+
+    catalog, schema = EDIT_SCHEMA
+    os.environ.update({"CATALOG_NAME": catalog, "SCHEMA_NAME": schema})
+    for table, key in (("memory_pk", ["id"]), ("memory_keyless", [])):
+        fake_warehouse.create_table(
+            f"{catalog}.{schema}.{table}",
+            edit_table(edit_rows),
+            index=key,
+            primary_key=key,
+        )
+
+    def sql_query(app) -> None:
+        app.run()
+        app.text_area[0].input(f"select * from {TRIPS}")
+        app.radio[0].set_value("as_written")
+        app.button[0].click()
+
+    def edit_data(table: str) -> Callable[[Any], None]:
+        def render(app) -> None:
+            app.run()
+            app.selectbox[0].set_value(f"{schema}.{table}").run()
+            size_key = f"edit_page_size:{catalog}.{schema}.{table}"
+            app.number_input(key=size_key).set_value(edit_rows)
+
+        return render
+
+    pages = {
+        "taxi_fares": ("pages/01_Taxi_Fares.py", lambda app: app.run()),
+        "sql_query": ("pages/02_SQL_Query.py", sql_query),
+        "edit_data_pk": ("pages/03_Edit_Data.py", edit_data("memory_pk")),
+        "edit_data_keyless": ("pages/03_Edit_Data.py", edit_data("memory_keyless")),
+        "performance": ("pages/04_Performance.py", lambda app: app.run()),
+    }
+    out: Dict[str, Any] = {}
+    for name, (page, render) in pages.items():
+        _reset_caches()
+        app = _app_test(page)
+        with MemorySampler() as memory:
+            render(app)
+            app.run()
+        if app.exception:
+            raise RuntimeError(app.exception[0].message)
+        out[name] = memory.metrics
+        # Release the session (and the results it holds) before the next page
+        del app
+        gc.collect()
+    return out
+
+
+def bench_sessions(
+    sessions: int, page: str = "pages/01_Taxi_Fares.py"
+) -> Dict[str, Any]:
+    from common import pool_stats, scheduler_stats, single_flight_stats
+
+    _reset_caches()
+    times: List[float] = []
+    errors: List[str] = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(sessions)
+
+    def session(app) -> None:
+        barrier.wait()
+        _, seconds = _timed(app.run)
+        with lock:
+            times.append(seconds)
+            if app.exception:
+                errors.append(app.exception[0].message)
+
+    apps = [_app_test(page) for _ in range(sessions)]
+    threads = [threading.Thread(target=session, args=(app,)) for app in apps]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - started
+    return {
+        "sessions": sessions,
+        "page": page,
+        **_percentiles(times, "session_render"),
+        "wall_ms": _ms(wall),
+        "sessions_per_s": round(sessions / wall, 2),
+        "errors": len(errors),
+        "single_flight": single_flight_stats(),
+        "pool": pool_stats(),
+        "scheduler": scheduler_stats(),
+    }
+
+
+# ---------- Report ----------
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _flatten(data: Dict[str, Any], prefix: str = "") -> Dict[str, float]:
+    out: Dict[str, float] = {}
+    for key, value in data.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            out.update(_flatten(value, name + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            out[name] = value
+    return out
+
+
+def compare(
+    report: Dict[str, Any], baseline: Dict[str, Any], max_regression: Optional[float]
+) -> List[str]:
+    """Print changes against a baseline report; return regressions over budget."""
+    now = _flatten(report["scenarios"])
+    before = _flatten(baseline.get("scenarios", {}))
+    failures = []
+    for name in sorted(now.keys() & before.keys()):
+        lower_better = name.endswith(("_ms", "_mb"))
+        if not (lower_better or name.endswith("_per_s")) or not before[name]:
+            continue
+        change = (now[name] - before[name]) / before[name] * 100
+        worse = change if lower_better else -change
+        print(
+            f"{name:<55} {before[name]:>12.1f} -> {now[name]:>12.1f} ({change:+.1f}%)"
+        )
+        if max_regression is not None and worse > max_regression:
+            failures.append(f"{name}: {worse:.1f}% worse than baseline")
+    return failures
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--scenarios",
+        default="taxi_fares,sql_query,edit_data,params,sessions,viz,page_memory",
+    )
+    parser.add_argument("--trip-rows", type=int, default=200_000)
+    parser.add_argument("--edit-sizes", default=",".join(map(str, EDIT_SIZES)))
+    parser.add_argument(
+        "--edit-share",
+        type=float,
+        default=0.01,
+        help="share of rows edited, and again deleted and added",
+    )
+    parser.add_argument("--param-rows", type=int, default=500)
+    parser.add_argument("--sessions", type=int, default=8)
+    parser.add_argument("--viz-rows", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--connect-ms", type=float, default=0.0)
+    parser.add_argument("--query-ms", type=float, default=0.0)
+    parser.add_argument("--row-us", type=float, default=0.0)
+    parser.add_argument(
+        "--slots", type=int, default=0, help="concurrent statements (0: unlimited)"
+    )
+    parser.add_argument("--json", help="write the report to this file")
+    parser.add_argument("--baseline", help="report to compare against")
+    parser.add_argument("--max-regression", type=float, default=None, help="percent")
+    args = parser.parse_args()
+
+    # Read by fake_warehouse and common at import time
+    workdir = tempfile.mkdtemp(prefix="bench-")
+    os.environ.update(
+        {
+            "SQL_CONNECTOR": "fake_warehouse",
+            "FAKE_WAREHOUSE_DB": os.path.join(workdir, "warehouse.db"),
+            "FAKE_WAREHOUSE_CONNECT_MS": str(args.connect_ms),
+            "FAKE_WAREHOUSE_QUERY_MS": str(args.query_ms),
+            "FAKE_WAREHOUSE_ROW_US": str(args.row_us),
+            "FAKE_WAREHOUSE_SLOTS": str(args.slots),
+            "DATABRICKS_WAREHOUSE_ID": os.getenv("DATABRICKS_WAREHOUSE_ID", "fake"),
+            "SQL_RESULT_CACHE_DIR": os.path.join(workdir, "cache"),
+            "SAVE_JOBS_DIR": os.path.join(workdir, "save_jobs"),
+            "SQL_WARMUP": "0",
+        }
+    )
+    sys.path[:0] = [APP_DIR, BENCH_DIR]
+
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    edit_sizes = [int(s) for s in args.edit_sizes.split(",") if s.strip()]
+    import fake_warehouse
+
+    fake_warehouse.create_table(TRIPS, trips_table(args.trip_rows))
+    runs: Dict[str, Callable[[], Dict[str, Any]]] = {
+        "taxi_fares": lambda: bench_taxi_fares(args.repeat),
+        "sql_query": lambda: bench_sql_query(args.repeat),
+        "edit_data": lambda: bench_edit_data(edit_sizes, args.edit_share),
+        "params": lambda: bench_params(args.param_rows),
+        "sessions": lambda: bench_sessions(args.sessions),
+        "viz": lambda: bench_viz(args.viz_rows, args.repeat),
+        "page_memory": bench_page_memory,
+    }
+    report: Dict[str, Any] = {
+        "meta": {
+            "commit": _git_commit(),
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "settings": {
+                k: v for k, v in vars(args).items() if k not in ("json", "baseline")
+            },
+        },
+        "scenarios": {},
+    }
+    for name in scenarios:
+        print(f"running {name}...", file=sys.stderr)
+        try:
+            report["scenarios"][name] = runs[name]()
+        except ImportError as e:
+            # AppTest and viz scenarios need streamlit
+            report["scenarios"][name] = {"skipped": str(e)}
+            print(f"{name} skipped: {e}", file=sys.stderr)
+        for metric, value in _flatten(report["scenarios"][name]).items():
+            print(f"{name}.{metric:<50} {value:>14,.1f}")
+
+    failures: List[str] = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            failures = compare(report, json.load(f), args.max_regression)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2, default=str)
+    for failure in failures:
+        print(f"REGRESSION: {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
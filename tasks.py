@@ -11,3 +11,25 @@ def requirements(c):
     c.run(
         "uv export --frozen --no-dev --no-hashes --no-annotate -o app/requirements.txt"
     )
+
+
+@task
+def bench_startup(c, max_import_ms=None, max_render_ms=None):
+    """Import-time and headless first-render benchmark (bench/startup.py)."""
+    args = ""
+    if max_import_ms:
+        args += f" --max-import-ms {max_import_ms}"
+    if max_render_ms:
+        args += f" --max-render-ms {max_render_ms}"
+    c.run(f"python bench/startup.py{args}")
+
+
+@task
+def bench(c, json="bench-report.json", baseline=None, max_regression=None, query_ms=0):
+    """Benchmark suite against the local fake warehouse (bench/suite.py)."""
+    args = f" --json {json} --query-ms {query_ms}"
+    if baseline:
+        args += f" --baseline {baseline}"
+    if max_regression:
+        args += f" --max-regression {max_regression}"
+    c.run(f"python bench/suite.py{args}")
@@ -0,0 +1,10 @@
+import pytest
+
+import fake_sql
+
+
+@pytest.fixture(autouse=True)
+def _reset_fake_sql():
+    fake_sql.connections.clear()
+    yield
+    fake_sql.connections.clear()
@@ -0,0 +1,99 @@
+"""
+Minimal stand-in for the `databricks.sql` module: connect(), connections and
+cursors that record what they were asked to do, and the connector's exception
+hierarchy (DB-API names) so errors can be raised the way the connector would.
+"""
+
+import itertools
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import pyarrow as pa
+
+
+class Error(Exception):
+    pass
+
+
+class DatabaseError(Error):
+    pass
+
+
+class OperationalError(DatabaseError):
+    pass
+
+
+class RequestError(OperationalError):
+    pass
+
+
+class ServerOperationError(DatabaseError):
+    pass
+
+
+_ids = itertools.count(1)
+
+
+class Cursor:
+    def __init__(self, connection: "Connection") -> None:
+        self.connection = connection
+        self.cancelled = False
+
+    def __enter__(self) -> "Cursor":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        pass
+
+    def execute(self, query: str, parameters: Optional[Dict[str, Any]] = None) -> None:
+        if not self.connection.open:
+            raise RequestError("session closed")
+        self.connection.executed.append(query)
+        hold = self.connection.hold
+        # A held statement runs until the event is set or the cursor is cancelled
+        while hold is not None and not hold.is_set() and not self.cancelled:
+            time.sleep(0.001)
+        if self.cancelled:
+            raise ServerOperationError("Statement was cancelled")
+        if self.connection.fail_with is not None:
+            raise self.connection.fail_with
+
+    def fetchall(self) -> List[tuple]:
+        return [(1,)]
+
+    def fetchall_arrow(self) -> pa.Table:
+        return pa.table({"x": [1]})
+
+    def cancel(self) -> None:
+        self.cancelled = True
+
+
+class Connection:
+    def __init__(self, **kwargs: Any) -> None:
+        self.id = next(_ids)
+        self.kwargs = kwargs
+        self.open = True
+        self.executed: List[str] = []
+        self.fail_with: Optional[BaseException] = None
+        self.hold: Optional[threading.Event] = None
+
+    def cursor(self) -> Cursor:
+        return Cursor(self)
+
+    def close(self) -> None:
+        self.open = False
+
+
+connections: List[Connection] = []
+
+
+def connect(**kwargs: Any) -> Connection:
+    connection = Connection(**kwargs)
+    connections.append(connection)
+    return connection
+
+
+def connector(**kwargs: Any) -> Callable[[], Connection]:
+    """A connect callable for ConnectionPool."""
+    return lambda: connect(**kwargs)
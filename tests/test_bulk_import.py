@@ -0,0 +1,105 @@
+import io
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from bulk_import import LocalStage, load_statement, stage_file
+
+COLUMNS = pd.DataFrame(
+    {
+        "column_name": ["id", "name", "amount", "day"],
+        "data_type": ["bigint", "string", "decimal(10,2)", "date"],
+        "is_nullable": ["NO", "YES", "YES", "YES"],
+    }
+)
+
+
+def _csv(lines):
+    return io.BytesIO(("\n".join(lines) + "\n").encode())
+
+
+def _stage_dirs(root):
+    return [p for p in root.iterdir() if p.is_dir()]
+
+
+@pytest.fixture
+def stage(tmp_path):
+    return LocalStage(str(tmp_path))
+
+
+def test_csv_is_staged_as_parquet_parts(tmp_path, stage):
+    rows = [f"{i},n{i},{i}.50,2024-01-{i % 28 + 1:02d}" for i in range(25)]
+    progress = []
+    staged = stage_file(
+        _csv(["ID,Name,amount,day"] + rows),
+        "csv",
+        COLUMNS,
+        stage,
+        chunk_rows=10,
+        part_rows=20,
+        on_progress=lambda n, _: progress.append(n),
+    )
+    assert staged.ok and staged.rows == 25
+    assert progress == [10, 20, 25]
+    assert staged.files == ["part-00000.parquet", "part-00001.parquet"]
+    table = pq.read_table(staged.directory)
+    assert table.schema.names == ["id", "name", "amount", "day"]
+    assert table.schema.field("amount").type == pa.decimal128(10, 2)
+    assert table.column("id").to_pylist() == list(range(25))
+    # Local parts are moved to the stage, not left behind
+    assert _stage_dirs(tmp_path) == [tmp_path / staged.directory.split("/")[-1]]
+
+
+def test_missing_nullable_columns_are_staged_as_nulls(stage):
+    staged = stage_file(_csv(["id", "1", "2"]), "csv", COLUMNS, stage)
+    table = pq.read_table(staged.directory)
+    assert table.column("name").null_count == 2
+
+
+def test_parquet_source(stage):
+    source = io.BytesIO()
+    pq.write_table(pa.table({"id": [1, 2], "amount": [1.5, 2.25]}), source)
+    source.seek(0)
+    staged = stage_file(source, "parquet", COLUMNS, stage)
+    assert staged.ok
+    amounts = pq.read_table(staged.directory).column("amount").to_pylist()
+    assert [float(a) for a in amounts] == [1.5, 2.25]
+
+
+def test_invalid_rows_are_reported_and_nothing_stays_staged(tmp_path, stage):
+    staged = stage_file(
+        _csv(["id,amount,day", "1,1.0,2024-01-01", "x,2.0,01/02/2024", ",3,"]),
+        "csv",
+        COLUMNS,
+        stage,
+        chunk_rows=2,
+    )
+    assert not staged.ok and staged.directory is None
+    assert {(e["row"], e["column"]) for e in staged.errors} == {
+        (2, "id"),
+        (2, "day"),
+        (3, "id"),
+    }
+    assert _stage_dirs(tmp_path) == []
+
+
+def test_column_errors_stop_before_staging(tmp_path, stage):
+    staged = stage_file(_csv(["name,color", "a,red"]), "csv", COLUMNS, stage)
+    reasons = [e["reason"] for e in staged.errors]
+    assert reasons == [
+        "Column 'color' is not in the table",
+        "Column 'id' is NOT NULL but missing from the file",
+    ]
+    assert _stage_dirs(tmp_path) == []
+
+
+def test_load_statements(tmp_path):
+    kind, statement = load_statement("`c`.`s`.`t`", ["id", "name"], "/stage/d")
+    assert kind == "copy" and statement.startswith("COPY INTO `c`.`s`.`t`")
+    kind, statement = load_statement("t", ["id", "name"], "/stage/d", ["id"])
+    assert kind == "merge"
+    assert "UPDATE SET t.`name` = s.`name`" in statement
+    with pytest.raises(ValueError):
+        load_statement("t", ["id"], "/stage/it's")
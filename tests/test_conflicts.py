@@ -0,0 +1,171 @@
+import pandas as pd
+import pytest
+
+import conflicts
+from conflicts import _resolve_by_key, check_conflicts
+from editing import ROW_HASH_COL
+
+KEY = ["id"]
+COLUMNS = ["id", "name", "qty"]
+# Rows as this session loaded them
+ORIGINALS = {
+    (1,): {"id": 1, "name": "a", "qty": 10},
+    (2,): {"id": 2, "name": "b", "qty": 20},
+}
+
+
+def feed(*changes):
+    """Change data feed rows: (id, name, qty, _change_type, _commit_version)."""
+    return pd.DataFrame(changes, columns=COLUMNS + ["_change_type", "_commit_version"])
+
+
+def resolve(changes, inserts=(), updates=(), deletes=()):
+    return _resolve_by_key(
+        changes, 5, 7, list(inserts), list(updates), list(deletes), KEY, ORIGINALS
+    )
+
+
+def test_no_changes_to_our_rows_is_clean():
+    report = resolve(feed(), updates=[{"id": 1, "qty": 11}], deletes=[{"id": 2}])
+    assert (report.status, report.ok, report.merged) == ("clean", True, 0)
+
+
+def test_update_of_a_row_deleted_since_load_conflicts():
+    report = resolve(feed((1, "a", 10, "delete", 6)), updates=[{"id": 1, "qty": 11}])
+    assert report.status == "conflict" and not report.ok
+    assert report.conflicts == [
+        {"id": 1, "reason": "deleted by another session", "commit_version": 6}
+    ]
+
+
+def test_same_column_conflicts_other_column_merges():
+    theirs = feed((1, "a", 12, "update_postimage", 6))
+    report = resolve(theirs, updates=[{"id": 1, "qty": 11}])
+    assert report.status == "conflict"
+    assert report.conflicts[0]["reason"] == "also changed by another session: qty"
+
+    report = resolve(theirs, updates=[{"id": 1, "name": "z"}])
+    assert (report.status, report.merged, report.conflicts) == ("merged", 1, [])
+
+
+def test_delete_of_an_already_deleted_row_is_merged():
+    report = resolve(feed((2, "b", 20, "delete", 6)), deletes=[{"id": 2}])
+    assert (report.status, report.merged) == ("merged", 1)
+    assert report.already_deleted == [{"id": 2}]
+
+
+def test_delete_of_a_row_changed_since_load_conflicts():
+    report = resolve(feed((2, "b", 21, "update_postimage", 6)), deletes=[{"id": 2}])
+    assert report.status == "conflict"
+    assert report.conflicts[0]["reason"] == "changed by another session"
+
+
+def test_insert_of_a_key_that_now_exists_conflicts():
+    report = resolve(feed((3, "c", 1, "insert", 6)), inserts=[{"id": 3, "qty": 1}])
+    assert report.conflicts[0]["reason"] == "key inserted by another session"
+    # A key inserted and deleted again since load is free
+    gone = feed((3, "c", 1, "insert", 6), (3, "c", 1, "delete", 7))
+    assert resolve(gone, inserts=[{"id": 3, "qty": 1}]).status == "clean"
+
+
+def test_changes_in_one_commit_replay_in_change_order():
+    # Deleted and re-inserted with the original values in the same commit: the
+    # insert is the final state whatever order the feed returns the rows in
+    reinserted = feed((1, "a", 10, "insert", 6), (1, "a", 10, "delete", 6))
+    assert resolve(reinserted, updates=[{"id": 1, "qty": 11}]).status == "clean"
+    # ... while a later commit still wins over an earlier one
+    deleted = feed((1, "a", 10, "delete", 7), (1, "a", 10, "insert", 6))
+    assert resolve(deleted, updates=[{"id": 1, "qty": 11}]).status == "conflict"
+
+
+class FakeWarehouse:
+    """Answers the statements check_conflicts runs."""
+
+    def __init__(self, latest=7, changes=None, error=None):
+        self.latest = latest
+        self.changes = changes if changes is not None else pd.DataFrame()
+        self.error = error
+        self.statements = []
+
+    def __call__(self, query, parameters=None):
+        self.statements.append((query, parameters))
+        if query.startswith("DESCRIBE HISTORY"):
+            return pd.DataFrame({"version": [self.latest]})
+        if self.error is not None:
+            raise self.error
+        return self.changes
+
+
+@pytest.fixture
+def warehouse(monkeypatch):
+    fake = FakeWarehouse()
+    monkeypatch.setattr(conflicts, "sqlQuery", fake)
+    return fake
+
+
+def _check(updates=(), deletes=(), key_cols=None, version=5):
+    return check_conflicts(
+        "main",
+        "sales",
+        "orders",
+        COLUMNS,
+        version,
+        [],
+        list(updates),
+        list(deletes),
+        key_cols=key_cols,
+        originals=ORIGINALS,
+    )
+
+
+def test_unchanged_table_is_clean_without_reading_changes(warehouse):
+    warehouse.latest = 5
+    assert _check(updates=[{"id": 1, "qty": 11}], key_cols=KEY).status == "clean"
+    assert len(warehouse.statements) == 1
+
+
+def test_keyed_check_reads_changes_of_touched_keys_since_version(warehouse):
+    warehouse.changes = feed((1, "a", 12, "update_postimage", 6))
+    report = _check(updates=[{"id": 1, "qty": 11}], key_cols=KEY)
+    assert report.status == "conflict"
+    query, params = warehouse.statements[-1]
+    assert "table_changes(:table, :start)" in query
+    assert params["table"] == "main.sales.orders" and params["start"] == 6
+
+
+def test_keyless_check_matches_row_hashes(warehouse):
+    warehouse.changes = pd.DataFrame(
+        {ROW_HASH_COL: ["h1"], "_change_type": ["delete"], "_commit_version": [6]}
+    )
+    report = _check(
+        updates=[{ROW_HASH_COL: "h1", "qty": 11}], deletes=[{ROW_HASH_COL: "h2"}]
+    )
+    assert report.status == "conflict"
+    assert report.conflicts == [
+        {ROW_HASH_COL: "h1", "reason": "row changed or deleted since load"}
+    ]
+    query, params = warehouse.statements[-1]
+    assert "'delete', 'update_preimage'" in query
+    assert sorted(v for k, v in params.items() if k not in ("table", "start")) == [
+        "h1",
+        "h2",
+    ]
+
+    warehouse.changes = warehouse.changes.iloc[0:0]
+    assert _check(deletes=[{ROW_HASH_COL: "h2"}]).status == "clean"
+
+
+def test_unreadable_change_feed_is_a_conflict(warehouse):
+    warehouse.error = RuntimeError("change data feed is not enabled")
+    report = _check(updates=[{"id": 1, "qty": 11}], key_cols=KEY)
+    assert (report.status, report.version, report.latest_version) == (
+        "conflict",
+        5,
+        7,
+    )
+    assert "change data feed is not enabled" in report.conflicts[0]["reason"]
+
+
+def test_table_without_history_is_never_checked(warehouse):
+    assert _check(updates=[{"id": 1}], key_cols=KEY, version=None).status == "clean"
+    assert warehouse.statements == []
@@ -0,0 +1,494 @@
+import re
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from editing import (
+    MAX_BATCH_ROWS,
+    MAX_STATEMENT_PARAMS,
+    ROW_HASH_COL,
+    DeltaChanges,
+    _chunks,
+    build_change_statements,
+    build_delete_statements,
+    build_update_statements,
+    changes_equal,
+    compute_changes,
+    compute_changes_by_index,
+)
+
+Changes = Tuple[List[Dict[str, Any]], List[Dict[str, Any]], List[Dict[str, Any]]]
+
+
+# ---------- Reference: the row-by-row diff the vectorized one replaced ----------
+def _changed(o_val: Any, e_val: Any) -> bool:
+    if pd.isna(o_val) and pd.isna(e_val):
+        return False
+    if pd.isna(o_val) or pd.isna(e_val):
+        return True
+    return bool(o_val != e_val)
+
+
+def reference_changes(
+    original: pd.DataFrame, edited: pd.DataFrame, key_cols: List[str]
+) -> Changes:
+    orig_idxed = original.set_index(key_cols, drop=False)
+    edit_idxed = edited.set_index(key_cols, drop=False)
+    orig_keys = set(orig_idxed.index.tolist())
+    edit_keys = set(edit_idxed.index.tolist())
+    inserts = [edit_idxed.loc[k].to_dict() for k in sorted(edit_keys - orig_keys)]
+    deletes = [
+        {c: orig_idxed.loc[k][c] for c in key_cols}
+        for k in sorted(orig_keys - edit_keys)
+    ]
+    updates = []
+    non_key_cols = [c for c in original.columns if c not in key_cols]
+    for key in sorted(orig_keys & edit_keys):
+        o_row = orig_idxed.loc[key]
+        e_row = edit_idxed.loc[key]
+        changes = {c: e_row[c] for c in non_key_cols if _changed(o_row[c], e_row[c])}
+        if changes:
+            changes.update({k: e_row[k] for k in key_cols})
+            updates.append(changes)
+    return inserts, updates, deletes
+
+
+def reference_changes_by_index(original: pd.DataFrame, edited: pd.DataFrame) -> Changes:
+    edited = edited[~edited.index.duplicated(keep="first")]
+    orig_keys = set(original.index.tolist())
+    edit_keys = set(edited.index.tolist())
+    inserts = [edited.loc[k].to_dict() for k in sorted(edit_keys - orig_keys)]
+    deletes = [{ROW_HASH_COL: k} for k in sorted(orig_keys - edit_keys)]
+    updates = []
+    for key in sorted(orig_keys & edit_keys):
+        o_row = original.loc[key]
+        e_row = edited.loc[key]
+        changes = {
+            c: e_row[c] for c in original.columns if _changed(o_row[c], e_row[c])
+        }
+        if changes:
+            changes[ROW_HASH_COL] = key
+            updates.append(changes)
+    return inserts, updates, deletes
+
+
+def _normalized(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    # Missing values compare equal whatever their spelling (None, NaN, NaT, NA)
+    def value(v: Any) -> Any:
+        if isinstance(v, np.generic):
+            v = v.item()
+        return None if v is None or (np.ndim(v) == 0 and pd.isna(v)) else v
+
+    return [{k: value(v) for k, v in row.items()} for row in rows]
+
+
+def assert_same_changes(actual: Changes, expected: Changes) -> None:
+    for name, a, e in zip(("inserts", "updates", "deletes"), actual, expected):
+        assert _normalized(a) == _normalized(e), name
+
+
+# ---------- Fixtures ----------
+def make_frame(rows: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    amount = rng.normal(100, 20, rows).round(2)
+    amount[rng.random(rows) < 0.05] = np.nan
+    name = pd.Series([f"name-{i % 97}" for i in range(rows)], dtype=object)
+    name[rng.random(rows) < 0.05] = None
+    return pd.DataFrame(
+        {
+            "id": np.arange(rows, dtype=np.int64),
+            "region": rng.choice(["north", "south", "east", "west"], rows),
+            "name": name,
+            "amount": amount,
+            "count": rng.integers(0, 1000, rows),
+            "active": rng.random(rows) < 0.5,
+            "updated_at": pd.Timestamp("2024-01-01")
+            + pd.to_timedelta(rng.integers(0, 10**6, rows), unit="s"),
+        }
+    )
+
+
+def make_edits(
+    original: pd.DataFrame, share: float = 0.01, seed: int = 1
+) -> pd.DataFrame:
+    """Edit, blank, delete and add about `share` of the rows each."""
+    rng = np.random.default_rng(seed)
+    rows = len(original)
+    n = max(1, int(rows * share))
+    edited = original.copy()
+    edited.loc[edited.index[rng.choice(rows, n, replace=False)], "amount"] += 1.5
+    edited.loc[edited.index[rng.choice(rows, n, replace=False)], "name"] = "renamed"
+    edited.loc[edited.index[rng.choice(rows, n, replace=False)], "name"] = np.nan
+    edited.loc[edited.index[rng.choice(rows, n, replace=False)], "active"] = False
+    edited = edited.drop(edited.index[rng.choice(rows, n, replace=False)])
+    added = make_frame(n, seed=seed + 1)
+    added["id"] = np.arange(rows, rows + n)
+    added.index = pd.RangeIndex(rows, rows + n)
+    return pd.concat([edited, added])
+
+
+def hashed(frame: pd.DataFrame) -> pd.DataFrame:
+    """Index rows by a synthetic key, like the page does for tables without one."""
+    out = frame.copy()
+    out.index = pd.Index([f"h{i:08d}" for i in frame["id"]], name="_row_hash")
+    return out
+
+
+# ---------- Equivalence ----------
+@pytest.mark.parametrize("rows", [1, 50, 1_000])
+def test_keyed_matches_reference(rows):
+    original = make_frame(rows)
+    edited = make_edits(original, share=0.05)
+    assert_same_changes(
+        compute_changes(original, edited, ["id"]),
+        reference_changes(original, edited, ["id"]),
+    )
+
+
+@pytest.mark.parametrize("rows", [1, 50, 1_000])
+def test_by_index_matches_reference(rows):
+    original = hashed(make_frame(rows))
+    edited = hashed(make_edits(make_frame(rows), share=0.05))
+    assert_same_changes(
+        compute_changes_by_index(original, edited),
+        reference_changes_by_index(original, edited),
+    )
+
+
+def test_composite_key_matches_reference():
+    original = make_frame(200)
+    original["part"] = original["id"] % 3
+    original["id"] = original["id"] // 3
+    edited = original.copy()
+    edited.loc[[5, 17], "amount"] = [1.0, 2.0]
+    edited = edited.drop(index=[40, 41])
+    keys = ["id", "part"]
+    assert_same_changes(
+        compute_changes(original, edited, keys),
+        reference_changes(original, edited, keys),
+    )
+
+
+def test_nan_and_none_are_the_same_missing_value():
+    original = pd.DataFrame(
+        {
+            "id": [1, 2, 3, 4],
+            "name": ["a", None, np.nan, "d"],
+            "x": [1.0, np.nan, 3.0, 4.0],
+        }
+    )
+    edited = original.copy()
+    edited["name"] = [np.nan, np.nan, None, "d"]
+    edited["x"] = [1.0, None, np.nan, 4.0]
+    inserts, updates, deletes = compute_changes(original, edited, ["id"])
+    assert inserts == [] and deletes == []
+    assert _normalized(updates) == [{"name": None, "id": 1}, {"x": None, "id": 3}]
+    assert_same_changes(
+        (inserts, updates, deletes), reference_changes(original, edited, ["id"])
+    )
+
+
+def test_dtype_changes():
+    original = pd.DataFrame(
+        {
+            "id": [1, 2, 3],
+            "count": np.array([1, 2, 3], dtype=np.int64),
+            "label": pd.Categorical(["a", "b", "a"]),
+            "when": pd.to_datetime(["2024-01-01", "2024-01-02", None]),
+        }
+    )
+    edited = original.copy()
+    # Editing upcasts or replaces column dtypes: int -> float with NaN,
+    # categoricals with new categories, datetimes to strings
+    edited["count"] = [1.0, np.nan, 3.0]
+    edited["label"] = pd.Categorical(["a", "c", "a"])
+    edited["when"] = pd.Series(["2024-01-01", "2024-01-02", None], dtype=object)
+    inserts, updates, deletes = compute_changes(original, edited, ["id"])
+    expected = reference_changes(original, edited, ["id"])
+    assert_same_changes((inserts, updates, deletes), expected)
+    assert [sorted(u) for u in updates] == [
+        ["id", "when"],
+        ["count", "id", "label", "when"],
+    ]
+
+
+def test_by_index_keeps_first_of_duplicate_new_rows():
+    original = hashed(make_frame(3))
+    edited = pd.concat([original, original.iloc[[0]].assign(id=99)])
+    edited.index = list(original.index) + ["new"]
+    extra = edited.iloc[[-1]].assign(id=100)
+    edited = pd.concat([edited, extra])
+    inserts, updates, deletes = compute_changes_by_index(original, edited)
+    assert [r["id"] for r in inserts] == [99]
+    assert updates == [] and deletes == []
+
+
+def test_keyed_rejects_duplicate_keys():
+    original = make_frame(5)
+    edited = pd.concat([original, original.iloc[[0]]])
+    with pytest.raises(ValueError, match="Edited data has duplicate key values"):
+        compute_changes(original, edited, ["id"])
+    with pytest.raises(ValueError, match="Key columns must be specified"):
+        compute_changes(original, original, [])
+
+
+def test_no_changes():
+    original = make_frame(100)
+    assert compute_changes(original, original.copy(), ["id"]) == ([], [], [])
+    assert compute_changes_by_index(hashed(original), hashed(original)) == ([], [], [])
+
+
+# ---------- Editor deltas ----------
+_new_rows = iter(range(10**9))
+
+
+def editor(frame, edits=None, deleted=(), added=()):
+    """data_editor state and output for edits to `frame`, the editor's input."""
+    edits = edits or {}
+    out = frame.copy()
+    for pos, cells in edits.items():
+        for col, value in cells.items():
+            out.iat[pos, out.columns.get_loc(col)] = value
+    out = out.drop(out.index[list(deleted)])
+    # The editor gives added rows no fingerprint; any unknown label will do
+    index = pd.Index([f"new-{next(_new_rows)}" for _ in added], name=frame.index.name)
+    new = pd.DataFrame(list(added), index=index, columns=frame.columns)
+    out = pd.concat([out, new.astype(frame.dtypes.to_dict())])
+    state = {"edited_rows": edits, "deleted_rows": list(deleted), "added_rows": added}
+    return state, out
+
+
+@pytest.fixture
+def base():
+    frame = hashed(make_frame(20))
+    return frame[["id", "name", "amount", "count"]]
+
+
+def test_deltas_match_full_diff(base):
+    state, edited = editor(
+        base,
+        edits={1: {"amount": 1.25}, 5: {"name": "x", "count": 3}, 9: {"name": None}},
+        # Deleted rows before edited ones shift the edited rows' positions
+        deleted=[0, 2, 7],
+        added=[{"id": 100, "name": "new", "amount": 2.0, "count": 1}],
+    )
+    tracker = DeltaChanges(base)
+    tracker.apply(state, edited)
+    delta = tracker.changes()
+    full = compute_changes_by_index(base, edited)
+    assert changes_equal(delta, full)
+    inserts, updates, deletes = delta
+    assert [r["id"] for r in inserts] == [100]
+    assert len(updates) == 3 and len(deletes) == 3
+
+
+def test_deltas_across_editor_generations(base):
+    tracker = DeltaChanges(base)
+    state, first = editor(
+        base,
+        edits={3: {"count": 999}, 4: {"amount": 9.5}},
+        deleted=[1],
+        added=[{"id": 100, "name": "a", "amount": 1.0, "count": 1}],
+    )
+    tracker.apply(state, first)
+    # The next editor starts from the previous output: positions have shifted,
+    # an edit is reverted, the added row is edited and another is deleted
+    last = len(first) - 1
+    count = int(base["count"].iloc[3])
+    state, second = editor(
+        first,
+        edits={2: {"count": count}, last: {"name": "b"}, 10: {"name": "y"}},
+        deleted=[0],
+        added=[{"id": 101, "name": "c", "amount": 3.0, "count": 2}],
+    )
+    tracker.apply(state, second)
+    delta = tracker.changes()
+    assert changes_equal(delta, compute_changes_by_index(base, second))
+    inserts, updates, deletes = delta
+    assert sorted(r["name"] for r in inserts) == ["b", "c"]
+    assert sorted(len(u) for u in updates) == [2, 2]
+
+
+def test_deleting_added_rows_leaves_no_insert(base):
+    tracker = DeltaChanges(base)
+    state, first = editor(
+        base, added=[{"id": 100, "name": "a", "amount": 1.0, "count": 1}]
+    )
+    tracker.apply(state, first)
+    state, second = editor(first, deleted=[len(first) - 1])
+    tracker.apply(state, second)
+    assert tracker.changes() == ([], [], [])
+
+
+# ---------- Statements ----------
+FQN = "`main`.`sales`.`orders`"
+COLUMNS = ["id", "name", "amount", "count", "day"]
+
+
+def _markers(statement):
+    return re.findall(r":p\d+\b", statement)
+
+
+def assert_within_limits(statements):
+    for kind, statement, params, rows in statements:
+        assert 0 < rows <= MAX_BATCH_ROWS
+        assert 0 < len(params) <= MAX_STATEMENT_PARAMS
+        # Every value is bound, once
+        assert sorted(_markers(statement)) == sorted(f":{k}" for k in params)
+
+
+def test_chunks_respect_both_limits():
+    rows = list(range(2_500))
+    # Narrow rows are capped by rows, wide ones by parameters
+    assert [len(c) for c in _chunks(rows, 1, 2_000, 1_000)] == [1_000, 1_000, 500]
+    assert [len(c) for c in _chunks(rows, 6, 2_000, 1_000)] == [333] * 7 + [169]
+    # A row wider than the parameter cap still goes, alone
+    assert [len(c) for c in _chunks(rows[:3], 5_000, 2_000, 1_000)] == [1, 1, 1]
+    assert list(_chunks([], 3, 2_000, 1_000)) == []
+
+
+def _change_set(n_inserts, n_updates, n_deletes):
+    inserts = [
+        {"id": 10_000 + i, "name": f"n{i}", "amount": 1.5, "count": i, "day": None}
+        for i in range(n_inserts)
+    ]
+    # Two changed-column sets, interleaved
+    updates = [
+        {"id": i, "amount": float(i)} if i % 2 else {"id": i, "name": "x", "count": 1}
+        for i in range(n_updates)
+    ]
+    deletes = [{"id": 5_000 + i} for i in range(n_deletes)]
+    return inserts, updates, deletes
+
+
+def test_keyed_change_set_across_both_limits():
+    inserts, updates, deletes = _change_set(1_500, 3_001, 2_500)
+    statements = build_change_statements(
+        FQN, COLUMNS, inserts, updates, deletes, key_cols=["id"], retry_safe=True
+    )
+    assert_within_limits(statements)
+    kinds = [k for k, *_ in statements]
+    # Deletes, then updates, then inserts
+    assert kinds == sorted(kinds, key=["delete", "update", "insert"].index)
+    rows = {k: [n for kind, _, _, n in statements if kind == k] for k in set(kinds)}
+    # Key-only deletes are capped by rows; 5-column inserts by parameters (400)
+    assert rows["delete"] == [1_000, 1_000, 500]
+    assert rows["insert"] == [400, 400, 400, 300]
+    # Updates: one group per changed-column set, in order of first appearance;
+    # 3 columns staged -> 666 rows per batch, 2 columns -> 1000 rows
+    assert rows["update"] == [666, 666, 169, 1_000, 500]
+    assert sum(rows["update"]) == len(updates)
+    for kind, statement, params, n in statements:
+        assert statement.startswith(f"MERGE INTO {FQN} t USING (SELECT * FROM VALUES")
+        assert "t.`id` <=> s.`id`" in statement
+    first_update = next(s for k, s, *_ in statements if k == "update")
+    assert first_update.endswith(
+        "UPDATE SET t.`name` = s.`name`, t.`count` = s.`count`"
+    )
+    assert "AS s(`id`, `name`, `count`)" in first_update
+
+
+def test_full_batches_of_a_shape_share_their_text():
+    _, updates, _ = _change_set(0, 3_000, 0)
+    statements = build_update_statements(FQN, COLUMNS, updates, key_cols=["id"])
+    texts = {(s, n) for _, s, _, n in statements}
+    # 1500 rows per column set: a full batch and a remainder each
+    assert len(statements) == 5 and len({s for s, n in texts if n == 1_000}) == 1
+
+
+def test_keyless_updates_match_on_row_hash():
+    updates = [{ROW_HASH_COL: f"h{i}", "amount": float(i)} for i in range(1_500)] + [
+        {ROW_HASH_COL: "hx"}
+    ]
+    statements = build_update_statements(FQN, COLUMNS, updates)
+    assert_within_limits(statements)
+    assert [n for *_, n in statements] == [1_000, 500]
+    statement = statements[0][1]
+    assert "ON sha2(to_json(named_struct('id', t.`id`," in statement
+    assert f"= s.{ROW_HASH_COL} WHEN MATCHED" in statement
+    assert f"AS s(`{ROW_HASH_COL}`, `amount`)" in statement
+
+
+def test_keyless_deletes_are_an_in_list_of_hashes():
+    deletes = [{ROW_HASH_COL: f"h{i}"} for i in range(2_001)]
+    statements = build_delete_statements(FQN, COLUMNS, deletes)
+    assert_within_limits(statements)
+    assert [n for *_, n in statements] == [1_000, 1_000, 1]
+    kind, statement, params, _ = statements[-1]
+    assert statement == (
+        f"DELETE FROM {FQN} t WHERE sha2(to_json(named_struct('id', t.`id`, "
+        "'name', t.`name`, 'amount', t.`amount`, 'count', t.`count`, 'day', "
+        "t.`day`)), 256) IN (:p0)"
+    )
+    assert params == {"p0": "h2000"}
+
+
+def test_inserts_without_retry_safety_are_plain_inserts():
+    inserts, _, _ = _change_set(10, 0, 0)
+    statements = build_change_statements(FQN, COLUMNS, inserts, [], [], key_cols=["id"])
+    assert len(statements) == 1
+    assert statements[0][1].startswith(
+        f"INSERT INTO {FQN} (`id`, `name`, `amount`, `count`, `day`) VALUES (:p0, "
+    )
+
+
+# ---------- Benchmarks ----------
+# pytest -m slow --benchmark-only; the 1k and 10k cases also run with the suite
+SIZES = [
+    1_000,
+    10_000,
+    pytest.param(100_000, marks=pytest.mark.slow),
+    pytest.param(1_000_000, marks=pytest.mark.slow),
+]
+
+
+@pytest.mark.parametrize("rows", SIZES)
+def test_bench_compute_changes(benchmark, rows):
+    original = make_frame(rows)
+    edited = make_edits(original)
+    inserts, updates, deletes = benchmark.pedantic(
+        compute_changes, args=(original, edited, ["id"]), rounds=3, iterations=1
+    )
+    n = max(1, int(rows * 0.01))
+    assert len(inserts) == n and len(deletes) == n and updates
+
+
+@pytest.mark.parametrize("rows", SIZES)
+def test_bench_compute_changes_by_index(benchmark, rows):
+    original = hashed(make_frame(rows))
+    edited = hashed(make_edits(make_frame(rows)))
+    inserts, _, deletes = benchmark.pedantic(
+        compute_changes_by_index, args=(original, edited), rounds=3, iterations=1
+    )
+    n = max(1, int(rows * 0.01))
+    assert len(inserts) == n and len(deletes) == n
+
+
+@pytest.mark.parametrize("rows, edits", [(500, 50), (10_000, 100), (10_000, 1_000)])
+def test_bench_deltas(benchmark, rows, edits):
+    base = hashed(make_frame(rows))
+    rng = np.random.default_rng(2)
+    positions = rng.choice(rows, edits, replace=False)
+    state, edited = editor(
+        base, edits={int(p): {"amount": float(p)} for p in positions}
+    )
+
+    def from_deltas():
+        tracker = DeltaChanges(base)
+        tracker.apply(state, edited)
+        return tracker.changes()
+
+    _, updates, _ = benchmark.pedantic(from_deltas, rounds=3, iterations=1)
+    assert len(updates) == edits
+
+
+@pytest.mark.parametrize("rows", [1_000, pytest.param(10_000, marks=pytest.mark.slow)])
+def test_bench_reference(benchmark, rows):
+    """The row-by-row diff, for comparison."""
+    original = make_frame(rows)
+    edited = make_edits(original)
+    benchmark.pedantic(
+        reference_changes, args=(original, edited, ["id"]), rounds=1, iterations=1
+    )
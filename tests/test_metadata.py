@@ -0,0 +1,146 @@
+import pyarrow as pa
+import pytest
+
+import fake_warehouse
+import metadata
+from metadata import CatalogSnapshot
+
+ORDERS = pa.schema([("id", pa.int64()), ("customer", pa.string())])
+ITEMS = pa.schema([("order_id", pa.int64()), ("line", pa.int32()), ("qty", pa.int32())])
+NOTES = pa.schema([("text", pa.string())])
+
+
+@pytest.fixture
+def warehouse(monkeypatch, tmp_path):
+    """information_schema in a local fake warehouse, answering metadata's queries."""
+    path = str(tmp_path / "warehouse.db")
+
+    class Warehouse:
+        def __init__(self):
+            self.statements = []
+
+        def describe(self, name, schema, primary_key=(), altered="2024-01-01 00:00"):
+            fake_warehouse.describe_table(
+                f"main.{name}", schema, primary_key, path, last_altered=altered
+            )
+
+        def drop(self, name):
+            fake_warehouse.drop_table(f"main.{name}", path)
+
+        def __call__(self, query, parameters=None):
+            self.statements.append((query, parameters))
+            with fake_warehouse.Connection(path) as connection:
+                with connection.cursor() as cursor:
+                    cursor.execute(query, parameters)
+                    return cursor.fetchall_arrow().to_pandas()
+
+    fake = Warehouse()
+    fake.describe("sales.orders", ORDERS, primary_key=["id"])
+    fake.describe("sales.items", ITEMS, primary_key=["order_id", "line"])
+    fake.describe("sales.notes", NOTES)
+    fake.describe("hr.people", NOTES)
+    monkeypatch.setattr(metadata, "sqlQuery", fake)
+    return fake
+
+
+def _tables(snapshot):
+    return sorted(snapshot.tables().apply(".".join, axis=1))
+
+
+def _reloaded(warehouse):
+    """Tables whose columns the last refresh read, from its bound parameters."""
+    params = [p for q, p in warehouse.statements if ".columns" in q][-1]
+    return sorted(v for k, v in params.items() if k.startswith("k"))
+
+
+def test_first_refresh_loads_everything(warehouse):
+    snapshot = CatalogSnapshot("main")
+    changed = snapshot.refresh()
+    assert changed == {"sales.orders", "sales.items", "sales.notes", "hr.people"}
+    assert _tables(snapshot) == sorted(changed)
+    assert snapshot.columns("sales", "items").to_dict("list") == {
+        "column_name": ["order_id", "line", "qty"],
+        "data_type": ["bigint", "int", "int"],
+        "is_nullable": ["NO", "NO", "YES"],
+    }
+    assert snapshot.primary_keys("sales", "items") == ["order_id", "line"]
+    assert snapshot.primary_keys("sales", "notes") == []
+    # Three queries: tables, columns and keys
+    assert len(warehouse.statements) == 3
+    assert snapshot.stats()["refreshes"] == 1
+
+
+def test_refresh_reloads_only_altered_and_dropped_tables(warehouse):
+    snapshot = CatalogSnapshot("main")
+    snapshot.refresh()
+    items_before = snapshot.columns("sales", "items")
+
+    warehouse.describe(
+        "sales.orders",
+        ORDERS.append(pa.field("total", pa.float64())),
+        primary_key=["id", "customer"],
+        altered="2024-02-01 00:00",
+    )
+    warehouse.drop("sales.notes")
+    warehouse.describe("sales.returns", NOTES, altered="2024-02-01 00:00")
+    warehouse.statements.clear()
+
+    changed = snapshot.refresh()
+    assert changed == {"sales.orders", "sales.notes", "sales.returns"}
+    assert _reloaded(warehouse) == ["sales.orders", "sales.returns"]
+    assert _tables(snapshot) == [
+        "hr.people",
+        "sales.items",
+        "sales.orders",
+        "sales.returns",
+    ]
+    assert list(snapshot.columns("sales", "orders")["column_name"]) == [
+        "id",
+        "customer",
+        "total",
+    ]
+    assert snapshot.primary_keys("sales", "orders") == ["id", "customer"]
+    # The dropped table is gone from every lookup
+    assert snapshot.columns("sales", "notes").empty
+    assert snapshot.primary_keys("sales", "notes") == []
+    # Unchanged tables keep what the first refresh loaded
+    assert snapshot.columns("sales", "items") is items_before
+    assert snapshot.primary_keys("sales", "items") == ["order_id", "line"]
+
+
+def test_refresh_without_changes_reads_only_the_table_list(warehouse):
+    snapshot = CatalogSnapshot("main")
+    snapshot.refresh()
+    warehouse.statements.clear()
+    assert snapshot.refresh() == set()
+    assert len(warehouse.statements) == 1
+    assert snapshot.stats()["refreshes"] == 2
+
+
+def test_dropping_a_primary_key_is_picked_up(warehouse):
+    snapshot = CatalogSnapshot("main")
+    snapshot.refresh()
+    warehouse.describe("sales.orders", ORDERS, altered="2024-03-01 00:00")
+    assert snapshot.refresh() == {"sales.orders"}
+    assert snapshot.primary_keys("sales", "orders") == []
+    assert snapshot.primary_keys("sales", "items") == ["order_id", "line"]
+
+
+def test_full_refresh_reports_every_table(warehouse):
+    snapshot = CatalogSnapshot("main")
+    snapshot.refresh()
+    warehouse.drop("hr.people")
+    assert snapshot.refresh(full=True) == {
+        "sales.orders",
+        "sales.items",
+        "sales.notes",
+    }
+    assert snapshot.columns("hr", "people").empty
+
+
+def test_schema_snapshot_ignores_other_schemas(warehouse):
+    snapshot = CatalogSnapshot("main", "hr")
+    assert snapshot.refresh() == {"hr.people"}
+    warehouse.describe("sales.orders", ORDERS, altered="2024-02-01 00:00")
+    assert snapshot.refresh() == set()
+    assert _tables(snapshot) == ["hr.people"]
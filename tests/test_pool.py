@@ -0,0 +1,196 @@
+import sys
+import time
+
+import pytest
+
+import common
+import fake_sql
+from common import ConnectionPool, PoolTimeout
+
+
+def make_pool(**kwargs) -> ConnectionPool:
+    options = {"max_size": 2, "acquire_timeout": 0.2, "ping_after": 60}
+    options.update(kwargs)
+    return ConnectionPool(fake_sql.connector(), **options)
+
+
+def test_reuses_released_connection():
+    pool = make_pool()
+    with pool.connection() as first:
+        pass
+    with pool.connection() as second:
+        pass
+    assert second is first
+    assert len(fake_sql.connections) == 1
+    stats = pool.stats()
+    assert stats["opened"] == 1 and stats["reused"] == 1 and stats["size"] == 1
+
+
+def test_times_out_when_exhausted():
+    pool = make_pool(max_size=1, acquire_timeout=0.05)
+    conn = pool.acquire()
+    with pytest.raises(PoolTimeout):
+        pool.acquire()
+    pool.release(conn)
+    assert pool.acquire() is conn
+
+
+def test_recycles_after_max_lifetime():
+    pool = make_pool(max_lifetime=0.05)
+    with pool.connection() as first:
+        pass
+    time.sleep(0.1)
+    with pool.connection() as second:
+        pass
+    assert second is not first
+    assert not first.open
+    assert pool.stats()["evicted_lifetime"] == 1
+
+
+def test_connection_past_lifetime_is_closed_on_release():
+    pool = make_pool(max_lifetime=0.05)
+    with pool.connection() as conn:
+        time.sleep(0.1)
+    assert not conn.open
+    assert pool.stats()["idle"] == 0
+
+
+def test_evicts_idle_connections():
+    pool = make_pool(idle_timeout=0.05)
+    with pool.connection() as first:
+        pass
+    time.sleep(0.1)
+    with pool.connection() as second:
+        pass
+    assert second is not first
+    assert pool.stats()["evicted_idle"] == 1
+
+
+def test_pings_connection_idle_past_ping_after():
+    pool = make_pool(ping_after=0.05)
+    with pool.connection() as first:
+        pass
+    with pool.connection():
+        pass
+    assert first.executed == []
+    time.sleep(0.1)
+    with pool.connection() as second:
+        pass
+    assert second is first
+    assert first.executed == ["select 1"]
+
+
+def test_replaces_connection_that_fails_health_check():
+    pool = make_pool(ping_after=0)
+    with pool.connection() as first:
+        pass
+    first.fail_with = fake_sql.RequestError("connection reset")
+    with pool.connection() as second:
+        pass
+    assert second is not first
+    assert not first.open
+    assert pool.stats()["failed_health_checks"] == 1
+
+
+def test_skips_closed_connection_without_ping():
+    pool = make_pool()
+    with pool.connection() as first:
+        pass
+    first.open = False
+    with pool.connection() as second:
+        pass
+    assert second is not first
+
+
+@pytest.mark.parametrize(
+    "error",
+    [
+        fake_sql.ServerOperationError("[TABLE_OR_VIEW_NOT_FOUND]"),
+        fake_sql.DatabaseError("division by zero"),
+        common.QueryCancelled("cancelled"),
+        GeneratorExit(),
+    ],
+)
+def test_keeps_connection_after_statement_error(error):
+    pool = make_pool()
+    with pytest.raises(type(error)):
+        with pool.connection() as first:
+            raise error
+    with pool.connection() as second:
+        pass
+    assert second is first and first.open
+    assert pool.stats()["discarded_on_error"] == 0
+
+
+@pytest.mark.parametrize(
+    "error",
+    [
+        fake_sql.OperationalError("session expired"),
+        fake_sql.RequestError("connection reset"),
+        ConnectionResetError(),
+    ],
+)
+def test_discards_connection_after_connection_error(error):
+    pool = make_pool()
+    with pytest.raises(type(error)):
+        with pool.connection() as first:
+            raise error
+    with pool.connection() as second:
+        pass
+    assert second is not first and not first.open
+    assert pool.stats()["discarded_on_error"] == 1
+
+
+def test_connector_errors_are_classified_by_name():
+    from databricks.sql import exc
+
+    assert common.is_connection_error(exc.RequestError("reset"))
+    assert common.is_connection_error(exc.SessionAlreadyClosedError("closed"))
+    assert not common.is_connection_error(exc.ServerOperationError("syntax"))
+    assert not common.is_connection_error(common.QueryTimeout("slow"))
+
+
+class FakeConfig:
+    created = 0
+
+    def __init__(self) -> None:
+        FakeConfig.created += 1
+        self.host = "example.cloud.databricks.com"
+        self.generation = FakeConfig.created
+
+    def authenticate(self):
+        return {"Authorization": f"Bearer token-{self.generation}"}
+
+
+@pytest.fixture
+def fake_connector(monkeypatch):
+    import databricks
+    import databricks.sdk.core
+
+    FakeConfig.created = 0
+    monkeypatch.setattr(databricks.sdk.core, "Config", FakeConfig)
+    monkeypatch.setattr(databricks, "sql", fake_sql, raising=False)
+    monkeypatch.setitem(sys.modules, "databricks.sql", fake_sql)
+    monkeypatch.setattr(common, "SQL_CONNECTOR", "databricks.sql")
+    monkeypatch.setattr(common, "_config", None)
+    monkeypatch.setenv("DATABRICKS_WAREHOUSE_ID", "abc123")
+
+
+def test_connect_passes_warehouse_and_credentials(fake_connector):
+    conn = common._connect()
+    assert conn.kwargs["server_hostname"] == "example.cloud.databricks.com"
+    assert conn.kwargs["http_path"] == "/sql/1.0/warehouses/abc123"
+    headers = conn.kwargs["credentials_provider"]()
+    assert headers() == {"Authorization": "Bearer token-1"}
+
+
+def test_credentials_refresh_after_ttl(fake_connector, monkeypatch):
+    monkeypatch.setattr(common, "CREDENTIALS_TTL", 0.05)
+    conn = common._connect()
+    headers = conn.kwargs["credentials_provider"]()
+    assert headers() == {"Authorization": "Bearer token-1"}
+    assert common.get_config() is common.get_config()
+    time.sleep(0.1)
+    # A pooled connection keeps its header factory, which resolves the new config
+    assert headers() == {"Authorization": "Bearer token-2"}
+    assert common.get_config(force_refresh=True).generation == 3
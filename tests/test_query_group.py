@@ -0,0 +1,196 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import common
+import fake_sql
+from common import (
+    ConnectionPool,
+    QueryCancelled,
+    QueryGroup,
+    QueryScheduler,
+    QueryTimeout,
+    submit,
+)
+
+
+def _until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("condition not reached")
+        time.sleep(0.001)
+
+
+@pytest.fixture
+def executor(monkeypatch):
+    """A private executor for submit(); `executor.resize(n)` swaps in one with n workers."""
+
+    class Executor:
+        def __init__(self):
+            self.resize(4)
+
+        def resize(self, workers):
+            self.pool = ThreadPoolExecutor(max_workers=workers)
+            monkeypatch.setattr(common, "_executor", self.pool)
+
+    fake = Executor()
+    yield fake
+    fake.pool.shutdown(wait=False, cancel_futures=True)
+
+
+@pytest.fixture
+def warehouse(monkeypatch, executor):
+    """common's scheduler and pool on fake connections; statements block until `hold` is set."""
+    hold = threading.Event()
+
+    def connect():
+        connection = fake_sql.connect()
+        connection.hold = hold
+        return connection
+
+    monkeypatch.setattr(common, "_scheduler", QueryScheduler(poll=0.01))
+    monkeypatch.setattr(common, "_pool", ConnectionPool(connect, max_size=4))
+    yield hold
+    hold.set()
+
+
+def _statement(query="select 1"):
+    """A member that runs one statement through the scheduler and pool."""
+    return common._fetch_arrow(query).num_rows
+
+
+def _executing(n):
+    _until(lambda: sum(len(c.executed) for c in fake_sql.connections) == n)
+
+
+def _fail(error):
+    raise error
+
+
+# ---------- submit ----------
+def test_handle_returns_the_result(executor):
+    handle = submit(lambda a, b=0: a + b, 40, b=2, label="add")
+    assert handle.result(5) == 42
+    assert handle.done() and handle.exception() is None
+    assert handle.label == "add"
+
+
+def test_handle_raises_the_error(executor):
+    handle = submit(_fail, ValueError("bad input"))
+    with pytest.raises(ValueError, match="bad input"):
+        handle.result(5)
+    assert isinstance(handle.exception(), ValueError)
+
+
+def test_handle_runs_with_the_submitters_priority(executor):
+    with common.query_priority("background"):
+        handle = submit(lambda: common._tls.priority)
+    assert handle.result(5) == "background"
+
+
+def test_cancel_stops_the_running_statement(warehouse):
+    handle = submit(_statement)
+    _executing(1)
+    handle.cancel()
+    with pytest.raises(QueryCancelled):
+        handle.result(5)
+    # A cancelled statement leaves the connection usable
+    assert fake_sql.connections[0].open
+
+
+def test_timeout_cancels_the_statement(warehouse):
+    handle = submit(_statement, timeout=0.05)
+    with pytest.raises(QueryTimeout, match="timed out"):
+        handle.result()
+    assert handle.cancelled
+    _until(handle.done)
+    assert isinstance(handle.exception(), QueryCancelled)
+
+
+# ---------- QueryGroup ----------
+def test_group_returns_results_in_submission_order(executor):
+    release = threading.Event()
+
+    def slow():
+        release.wait(5)
+        return "slow"
+
+    with QueryGroup(poll=0.01) as group:
+        group.submit(slow)
+        group.submit(lambda: "fast")
+        # The second member finishes first; results still follow submission order
+        _until(group.handles[1].done)
+        release.set()
+        assert group.wait() == ["slow", "fast"]
+
+
+def test_group_runs_members_concurrently(executor):
+    # Each member waits at the barrier until all three have started
+    barrier = threading.Barrier(3, timeout=5)
+    with QueryGroup(poll=0.01) as group:
+        for i in range(3):
+            group.submit(lambda i=i: (barrier.wait(), i)[1])
+        assert group.wait() == [0, 1, 2]
+
+
+def test_group_statements_run_on_the_warehouse_at_once(warehouse):
+    with QueryGroup(poll=0.01) as group:
+        for _ in range(3):
+            group.submit(_statement)
+        _executing(3)
+        assert common.get_scheduler().stats()["running"] == 3
+        warehouse.set()
+        assert group.wait() == [1, 1, 1]
+
+
+def test_first_failure_is_raised_and_the_rest_cancelled(warehouse):
+    with pytest.raises(ValueError, match="broken"):
+        with QueryGroup(poll=0.01) as group:
+            running = [group.submit(_statement) for _ in range(2)]
+            _executing(2)
+            group.submit(_fail, ValueError("broken"))
+            group.wait()
+    for handle in running:
+        with pytest.raises(QueryCancelled):
+            handle.result(5)
+    assert all(c.open for c in fake_sql.connections)
+    _until(lambda: common.get_scheduler().stats()["running"] == 0)
+
+
+def test_queued_members_never_start_once_cancelled(warehouse, executor):
+    executor.resize(1)
+    started = []
+    with QueryGroup(poll=0.01) as group:
+        first = group.submit(_statement)
+        _executing(1)
+        queued = group.submit(started.append, "queued")
+    assert queued.future.cancelled()
+    with pytest.raises(QueryCancelled):
+        first.result(5)
+    assert started == []
+
+
+def test_wait_calls_the_heartbeat_while_members_run(executor):
+    release = threading.Event()
+    beats = []
+
+    def heartbeat():
+        beats.append(1)
+        if len(beats) == 3:
+            release.set()
+
+    with QueryGroup(poll=0.01) as group:
+        group.submit(release.wait, 5)
+        assert group.wait(heartbeat) == [True]
+    assert len(beats) >= 3
+
+
+def test_wait_raises_a_member_timeout(warehouse):
+    with QueryGroup(timeout=0.05, poll=0.01) as group:
+        handle = group.submit(_statement)
+        with pytest.raises(QueryTimeout):
+            group.wait()
+    assert handle.cancelled
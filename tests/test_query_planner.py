@@ -0,0 +1,213 @@
+import pandas as pd
+import pytest
+
+import query_planner
+from query_planner import (
+    _mask,
+    estimate,
+    plan_query,
+    scanned_table,
+    statement_count,
+    top_level_limit,
+)
+
+PLAN = """== Parsed Logical Plan ==
+'Project [*]
++- 'UnresolvedRelation [samples, nyctaxi, trips]
+
+== Optimized Logical Plan ==
+Filter (fare_amount#1 > 10.0), Statistics(sizeInBytes={size}, rowCount={rows})
++- Relation samples.nyctaxi.trips, Statistics(sizeInBytes=1.5 GiB, rowCount=2.1E+7)
+
+== Physical Plan ==
+*(1) Filter (fare_amount#1 > 10.0)
+"""
+
+
+def _plan_text(size="3.2 MiB", rows="4.0E+4"):
+    return PLAN.format(size=size, rows=rows)
+
+
+@pytest.fixture
+def explain(monkeypatch):
+    """EXPLAIN COST answered with a fake plan; `explain.text = None` makes it fail."""
+
+    class Explain:
+        text = _plan_text()
+        queries = []
+
+        def __call__(self, query, ttl=None):
+            self.queries.append(query)
+            if self.text is None:
+                raise RuntimeError("EXPLAIN failed")
+            return pd.DataFrame({"plan": [self.text]})
+
+    fake = Explain()
+    monkeypatch.setattr(query_planner, "sqlQuery", fake)
+    return fake
+
+
+# ---------- Masking ----------
+def test_mask_keeps_offsets_and_blanks_comments_strings_and_subqueries():
+    query = "select 'a;b' /* limit 5; */ , (select 1) -- x; y\nfrom t"
+    masked = _mask(query)
+    assert len(masked) == len(query)
+    assert ";" not in masked and "limit" not in masked
+    assert masked.index("from t") == query.index("from t")
+    assert "(        )" in masked
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        "select 'a; b' from t",
+        'select "x;y" from t',
+        "select 1 -- trailing; comment",
+        "select /* one; two */ 1",
+        "select `weird;name` from t",
+        "select 1;",
+    ],
+)
+def test_semicolons_in_strings_and_comments_are_one_statement(query):
+    assert statement_count(query) == 1
+
+
+def test_multiple_statements_are_rejected():
+    assert statement_count("select 1; select 2") == 2
+    with pytest.raises(ValueError, match="one statement"):
+        plan_query("select 1; drop table t", estimate_cost=False)
+
+
+# ---------- LIMIT ----------
+@pytest.mark.parametrize(
+    "query, limit",
+    [
+        ("select * from t limit 10", 10),
+        ("select * from t LIMIT 10 OFFSET 20;", 10),
+        ("select * from (select * from t limit 5) s", None),
+        ("select * from t where x in (select y from u limit 3)", None),
+        ("select * from t where note = 'limit 10'", None),
+        ("select * from t -- limit 10", None),
+        ("select * from (select * from t limit 5) s limit 7", 7),
+    ],
+)
+def test_top_level_limit(query, limit):
+    assert top_level_limit(query) == limit
+
+
+def test_small_explicit_limit_runs_as_written(explain):
+    plan = plan_query("select * from t limit 50", preview_rows=100)
+    assert (plan.mode, plan.limit, plan.rewritten) == ("as_written", 50, False)
+
+
+def test_preview_wraps_in_a_limit(explain):
+    query = "select * from t where note = 'limit 1' -- limit 1"
+    plan = plan_query(query, preview_rows=100)
+    assert plan.mode == "preview" and plan.limit == 100
+    # The trailing comment cannot swallow the closing parenthesis
+    assert plan.statement == f"select * from (\n{query}\n) limit 100"
+
+
+def test_subquery_limit_does_not_stop_the_preview(explain):
+    plan = plan_query("select * from (select * from t limit 5) s", preview_rows=100)
+    assert plan.mode == "preview" and plan.statement.endswith(") limit 100")
+
+
+def test_small_estimate_runs_as_written(explain):
+    explain.text = _plan_text(rows="42")
+    plan = plan_query("select * from t", preview_rows=100)
+    assert (plan.mode, plan.est_rows, plan.rewritten) == ("as_written", 42, False)
+
+
+def test_writes_and_metadata_statements_are_not_rewritten(explain):
+    assert plan_query("delete from t where id = 1").mode == "as_written"
+    assert plan_query("describe table t").statement == "describe table t"
+    assert explain.queries == []
+
+
+# ---------- TABLESAMPLE ----------
+@pytest.mark.parametrize(
+    "query, table",
+    [
+        ("select * from samples.nyctaxi.trips", "samples.nyctaxi.trips"),
+        ("select a, b from `my cat`.s.t where a > 1", "`my cat`.s.t"),
+        ("select * from t as x where x.a = 1 order by 1", "t"),
+        ("select * from t where id in (select id from u join v using (id))", "t"),
+    ],
+)
+def test_plain_scans_are_found(query, table):
+    span = scanned_table(query)
+    assert span is not None and query[span[0] : span[1]] == table
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        "select * from a join b on a.id = b.id",
+        "select * from a, b where a.id = b.id",
+        "select * from a x, b y",
+        "select count(*) from t",
+        "select a, sum(b) from t group by a",
+        "select distinct a from t",
+        "select * from a union all select * from b",
+        "select * from t tablesample (10 percent)",
+        "with s as (select * from t) select * from s",
+    ],
+)
+def test_joins_and_aggregates_are_not_plain_scans(query):
+    assert scanned_table(query) is None
+
+
+def test_sample_inserts_tablesample_after_the_table(explain):
+    explain.text = _plan_text(rows="1.0E+6")
+    plan = plan_query(
+        "select * from samples.nyctaxi.trips where fare > 10",
+        mode="sample",
+        preview_rows=1000,
+    )
+    assert (plan.mode, plan.sample_percent) == ("sample", 0.15)
+    assert plan.statement == (
+        "select * from (\nselect * from samples.nyctaxi.trips TABLESAMPLE "
+        "(0.15 PERCENT) where fare > 10\n) limit 1000"
+    )
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        "select * from a join b on a.id = b.id",
+        "select * from a, b",
+        "select count(*) from t",
+    ],
+)
+def test_sample_falls_back_to_a_preview(explain, query):
+    plan = plan_query(query, mode="sample", preview_rows=100)
+    assert (plan.mode, plan.sample_percent) == ("preview", None)
+    assert "TABLESAMPLE" not in plan.statement
+    assert "single-table" in plan.notes[0]
+
+
+def test_sample_without_estimate_falls_back_to_a_preview(explain):
+    explain.text = None
+    plan = plan_query("select * from t", mode="sample", preview_rows=100)
+    assert plan.mode == "preview" and "No row estimate" in plan.notes[0]
+
+
+# ---------- EXPLAIN COST ----------
+def test_estimate_reads_the_optimized_plan_root(explain):
+    assert estimate("select * from t") == (40_000, int(3.2 * 1024**2))
+    assert explain.queries == ["EXPLAIN COST select * from t"]
+
+
+def test_estimate_without_row_count_or_with_unknown_size(explain):
+    explain.text = "== Optimized Logical Plan ==\nStatistics(sizeInBytes=512.0 B)"
+    assert estimate("q") == (None, 512)
+    explain.text = _plan_text(size="8.0 EiB", rows="12")
+    assert estimate("q") == (12, None)
+
+
+def test_estimate_is_unknown_when_explain_fails_or_has_no_statistics(explain):
+    explain.text = "== Physical Plan ==\nno statistics here"
+    assert estimate("q") == (None, None)
+    explain.text = None
+    assert estimate("q") == (None, None)
@@ -0,0 +1,108 @@
+import time
+
+import pyarrow as pa
+import pytest
+
+from result_cache import (
+    DiskResultCache,
+    cache_key,
+    is_read_query,
+    normalize_sql,
+    referenced_tables,
+)
+
+
+def table(n: int = 3) -> pa.Table:
+    return pa.table({"id": list(range(n)), "name": [f"r{i}" for i in range(n)]})
+
+
+@pytest.fixture
+def replicas(tmp_path):
+    """Two caches sharing one directory, like replicas on a shared volume."""
+    return DiskResultCache(str(tmp_path)), DiskResultCache(str(tmp_path))
+
+
+def test_round_trip(tmp_path):
+    cache = DiskResultCache(str(tmp_path))
+    cache.put("k", table(), ttl=60, tables=["main.sales.orders"])
+    got, stale = cache.lookup("k")
+    assert got.equals(table()) and not stale
+    assert got.schema.metadata is None
+    assert cache.stats()["hits"] == 1
+
+
+def test_miss_and_expiry(tmp_path):
+    cache = DiskResultCache(str(tmp_path))
+    assert cache.lookup("missing") == (None, False)
+    cache.put("k", table(), ttl=0.05, tables=[])
+    time.sleep(0.1)
+    got, stale = cache.lookup("k", max_stale=60)
+    assert got is not None and stale
+    assert cache.lookup("k") == (None, False)
+    assert cache.stats()["expired"] == 1
+    assert cache.lookup("k", max_stale=60) == (None, False)
+
+
+def test_serves_entries_written_by_another_replica(replicas):
+    a, b = replicas
+    a.put("k", table(), ttl=60, tables=["main.sales.orders"])
+    got, _ = b.lookup("k")
+    assert got is not None and got.equals(table())
+    assert b.stats()["entries"] == 1
+
+
+def test_invalidation_reaches_other_replicas(replicas):
+    a, b = replicas
+    b.put("orders", table(), ttl=60, tables=["sales.orders"])
+    b.put("other", table(), ttl=60, tables=["main.sales.customers"])
+    assert b.lookup("orders")[0] is not None
+    # a never saw these entries in its own index
+    a.invalidate_table("`main`.`sales`.`orders`")
+    assert b.lookup("orders") == (None, False)
+    assert b.lookup("other")[0] is not None
+    assert a.lookup("orders") == (None, False)
+
+
+def test_entries_written_after_invalidation_are_served(replicas):
+    a, b = replicas
+    b.put("k", table(), ttl=60, tables=["main.sales.orders"])
+    a.invalidate_table("main.sales.orders")
+    time.sleep(0.01)
+    b.put("k", table(5), ttl=60, tables=["main.sales.orders"])
+    got, _ = a.lookup("k")
+    assert got is not None and got.num_rows == 5
+
+
+def test_lru_eviction_by_bytes(tmp_path):
+    probe = DiskResultCache(str(tmp_path / "probe"))
+    probe.put("x", table(100), ttl=60, tables=[])
+    size = probe.stats()["bytes"]
+    cache = DiskResultCache(str(tmp_path / "cache"), max_bytes=int(size * 2.5))
+    for key in ("a", "b"):
+        cache.put(key, table(100), ttl=60, tables=[])
+    assert cache.lookup("a")[0] is not None
+    cache.put("c", table(100), ttl=60, tables=[])
+    assert cache.lookup("b") == (None, False)
+    assert cache.lookup("a")[0] is not None and cache.lookup("c")[0] is not None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_rescan_counts_other_replicas_entries(tmp_path):
+    a = DiskResultCache(str(tmp_path), scan_interval=0)
+    b = DiskResultCache(str(tmp_path), scan_interval=0)
+    a.put("a", table(), ttl=60, tables=[])
+    b.put("b", table(), ttl=60, tables=[])
+    assert b.stats()["entries"] == 2
+
+
+def test_keys_and_sql_helpers():
+    q = "SELECT *\n  FROM   `main`.sales.orders o JOIN customers c ON o.id = c.id;"
+    assert normalize_sql(q) == (
+        "SELECT * FROM `main`.sales.orders o JOIN customers c ON o.id = c.id"
+    )
+    assert referenced_tables(q) == {"main.sales.orders", "customers"}
+    assert is_read_query(" with x as (select 1) select * from x")
+    assert not is_read_query("DELETE FROM t")
+    assert cache_key(q, "wh") == cache_key(q.replace("\n", " "), "wh")
+    assert cache_key(q, "wh", {"p": 1}) != cache_key(q, "wh", {"p": 2})
+    assert cache_key(q, "wh") != cache_key(q, "other")
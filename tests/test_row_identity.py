@@ -0,0 +1,127 @@
+import datetime
+import hashlib
+from decimal import Decimal
+
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+from row_identity import RowIndex, row_fingerprints
+
+
+def sha(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+# What sha2(to_json(named_struct(...)), 256) returns on a warehouse. to_json
+# drops NULL fields, prints doubles like Java's Double.toString, keeps decimal
+# scale and escapes only quotes, backslashes and control characters.
+def test_known_server_hashes():
+    table = pa.table({"id": [1, 2, None], "name": ["a", None, None]})
+    hashes, compatible = row_fingerprints(table)
+    assert compatible
+    assert hashes == [
+        "7f0fc1050a42a0cb28309f997dc4e3885be66f7a0436945c98f778edc24e01f4",
+        "9e7e65453739bbc64ba155eed18a37bd5fb1196c7f29ded1da660b94414d7ad8",
+        "44136fa355b3678a1146ad16f7e8649e94fb4fc21fe77e8310c060f61caaff8a",
+    ]
+
+
+@pytest.mark.parametrize(
+    "column, expected",
+    [
+        (pa.array([1, -5, None], pa.int64()), ["1", "-5", None]),
+        (pa.array([True, False], pa.bool_()), ["true", "false"]),
+        (
+            pa.array([0.1, 100.0, 1e7, 1.5e-4, -0.0, 123456.789], pa.float64()),
+            ["0.1", "100.0", "1.0E7", "1.5E-4", "-0.0", "123456.789"],
+        ),
+        (pa.array([0.1, 3.0], pa.float32()), ["0.1", "3.0"]),
+        (
+            pa.array([Decimal("1.50"), Decimal("-0.05")], pa.decimal128(10, 2)),
+            ["1.50", "-0.05"],
+        ),
+        (pa.array([datetime.date(2024, 1, 31)], pa.date32()), ['"2024-01-31"']),
+        (
+            pa.array(['a"b', "back\\slash", "tab\tnew\nline", "é\x01"]),
+            ['"a\\"b"', '"back\\\\slash"', '"tab\\tnew\\nline"', '"é\\u0001"'],
+        ),
+        (pa.array(["x", "y", "x"]).dictionary_encode(), ['"x"', '"y"', '"x"']),
+    ],
+)
+def test_values_render_like_to_json(column, expected):
+    hashes, compatible = row_fingerprints(pa.table({"v": column}))
+    assert compatible
+    assert hashes == [sha("{}" if e is None else f'{{"v":{e}}}') for e in expected]
+
+
+def test_column_order_and_selection():
+    table = pa.table({"a": [1], "b": ["x"], "c": [2.5]})
+    hashes, _ = row_fingerprints(table, ["c", "a"])
+    assert hashes == [sha('{"c":2.5,"a":1}')]
+    assert row_fingerprints(table.select([]))[0] == [sha("{}")]
+
+
+def test_duplicate_rows_share_a_fingerprint():
+    table = pa.table({"id": [7, 7, 8], "name": ["same", "same", "same"]})
+    hashes, _ = row_fingerprints(table)
+    assert hashes[0] == hashes[1] != hashes[2]
+
+
+# Documented differences: fingerprints stay stable but are flagged incompatible
+def test_timestamps_are_not_compatible():
+    ts = datetime.datetime(2024, 1, 31, 12, 0)
+    table = pa.table({"ts": pa.array([ts], pa.timestamp("us", tz="UTC"))})
+    hashes, compatible = row_fingerprints(table)
+    assert not compatible
+    # The server renders the session time zone's format
+    assert hashes[0] != sha('{"ts":"2024-01-31T12:00:00.000Z"}')
+    assert hashes == row_fingerprints(table)[0]
+
+
+@pytest.mark.parametrize("value", [float("nan"), float("inf")])
+def test_non_finite_doubles_are_not_compatible(value):
+    _, compatible = row_fingerprints(pa.table({"x": [1.0, value]}))
+    assert not compatible
+
+
+@pytest.fixture
+def page():
+    original = pd.DataFrame(
+        {"id": [1, 2, 3], "name": ["a", "b", "c"], "qty": [10, 20, 30]},
+        index=pd.Index(["h1", "h2", "h3"], name="_row_hash"),
+    )
+    edited = original.copy()
+    edited.loc["h1", "qty"] = 11
+    edited.loc["h2", "id"] = 20
+    edited = edited.drop(index="h3")
+    return original, edited
+
+
+def test_rekey_matches_by_primary_key(page):
+    original, edited = page
+    inserts = [{"id": 4, "name": "d", "qty": 40}]
+    updates = [
+        {"qty": 11, "__row_hash": "h1"},
+        {"id": 20, "__row_hash": "h2"},
+    ]
+    deletes = [{"__row_hash": "h3"}]
+    new_inserts, new_updates, new_deletes = RowIndex(original).rekey(
+        edited, inserts, updates, deletes, ["id"]
+    )
+    # A changed key column becomes a delete of the old key and an insert
+    assert new_inserts == [
+        {"id": 4, "name": "d", "qty": 40},
+        {"id": 20, "name": "b", "qty": 20},
+    ]
+    assert new_updates == [{"qty": 11, "id": 1}]
+    assert new_deletes == [{"id": 3}, {"id": 2}]
+
+
+def test_rekey_with_composite_key(page):
+    original, edited = page
+    _, updates, deletes = RowIndex(original).rekey(
+        edited, [], [{"qty": 11, "__row_hash": "h1"}], [], ["id", "name"]
+    )
+    assert updates == [{"qty": 11, "id": 1, "name": "a"}]
+    assert deletes == []
@@ -0,0 +1,85 @@
+import datetime
+import decimal
+import json
+
+import pytest
+
+from save_jobs import SaveJob, SaveJobQueue
+
+
+def _job(parameters):
+    return SaveJob.from_statements(
+        "main",
+        "sales",
+        "orders",
+        [("update", "UPDATE t SET a = :p1 WHERE id = :p0", parameters, 1)],
+        retry_safe=True,
+    )
+
+
+PARAMETERS = {
+    "p0": 7,
+    "p1": datetime.datetime(2024, 1, 31, 12, 30, 15, 250000),
+    "p2": decimal.Decimal("1234.50"),
+    "p3": datetime.date(2024, 2, 29),
+    "p4": datetime.datetime(2024, 1, 31, 12, 0, tzinfo=datetime.timezone.utc),
+    "p5": datetime.time(8, 15),
+    "p6": datetime.timedelta(days=1, microseconds=5),
+    "p7": b"\x00\xffraw",
+    "p8": ["a", decimal.Decimal("0.1")],
+    "p9": {"k": datetime.date(2024, 1, 1)},
+    "p10": None,
+    "p11": True,
+    "p12": 2.5,
+    "p13": "text",
+}
+
+
+def test_parameters_keep_their_types_through_json():
+    job = _job(PARAMETERS)
+    restored = SaveJob.from_dict(json.loads(json.dumps(job.to_dict())))
+    params = restored.batches[0]["parameters"]
+    assert params == PARAMETERS
+    assert {k: type(v) for k, v in params.items()} == {
+        k: type(v) for k, v in PARAMETERS.items()
+    }
+    # The live job is not changed by serializing it
+    assert job.batches[0]["parameters"] is not params
+    assert job.batches[0]["parameters"]["p1"] == PARAMETERS["p1"]
+
+
+def test_interrupted_job_resumes_with_typed_parameters(tmp_path):
+    queue = SaveJobQueue(str(tmp_path))
+    job = _job(PARAMETERS)
+    job.status = "running"
+    job.batches[0]["status"] = "done"
+    queue._persist(job)
+
+    reloaded = SaveJobQueue(str(tmp_path)).get(job.id)
+    assert reloaded.status == "interrupted"
+    assert reloaded.batches[0]["status"] == "done"
+    assert reloaded.batches[0]["parameters"] == PARAMETERS
+    assert reloaded.submit_key == job.submit_key
+
+
+def test_unsupported_parameter_types_are_not_stored_as_strings(tmp_path):
+    job = _job({"p0": object()})
+    with pytest.raises(TypeError):
+        job.to_dict()
+    # Persisting logs and skips instead of writing a stringified value
+    SaveJobQueue(str(tmp_path))._persist(job)
+    assert not (tmp_path / f"{job.id}.json").exists()
+
+
+def test_finished_job_records_the_table_version(tmp_path, monkeypatch):
+    import save_jobs
+
+    ran = []
+    monkeypatch.setattr(save_jobs, "sqlQuery", lambda s, parameters: ran.append(s))
+    monkeypatch.setattr(save_jobs, "table_version", lambda c, s, t: 42)
+    monkeypatch.setattr(save_jobs, "invalidate_table", lambda c, s, t: None)
+    queue = SaveJobQueue(str(tmp_path))
+    job = _job({"p0": 1, "p1": 2})
+    queue._run(job)
+    assert (job.status, job.version, len(ran)) == ("done", 42, 1)
+    assert SaveJobQueue(str(tmp_path)).get(job.id).version == 42
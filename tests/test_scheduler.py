@@ -0,0 +1,240 @@
+import threading
+import time
+
+import pytest
+from streamlit.runtime import Runtime
+
+import common
+import fake_sql
+from common import ConnectionPool, QueryCancelled, QueryScheduler, QueueTimeout
+
+
+def _until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("condition not reached")
+        time.sleep(0.001)
+
+
+def _queued(scheduler, n):
+    _until(lambda: scheduler.stats()["queued_now"] == n)
+
+
+class Waiter:
+    """acquire() on a thread; records the admission in `order` and releases."""
+
+    def __init__(self, scheduler, name, order, hold=False, **kwargs):
+        self.name = name
+        self.error = None
+        self.ticket = None
+        self.release = threading.Event()
+        if not hold:
+            self.release.set()
+
+        def run():
+            try:
+                self.ticket = scheduler.acquire(**kwargs)
+            except BaseException as e:
+                self.error = e
+                return
+            order.append(name)
+            self.release.wait(5)
+            scheduler.release(self.ticket)
+
+        self.thread = threading.Thread(target=run, daemon=True)
+        self.thread.start()
+
+    def join(self):
+        self.thread.join(5)
+        assert not self.thread.is_alive()
+
+
+def _queue_up(scheduler, order, specs):
+    """Start waiters one by one, so their arrival order is fixed."""
+    waiters = []
+    for name, kwargs in specs:
+        waiters.append(Waiter(scheduler, name, order, **kwargs))
+        _queued(scheduler, len(waiters))
+    return waiters
+
+
+def test_global_cap():
+    scheduler = QueryScheduler(max_concurrent=2, max_per_user=2, poll=0.01)
+    order = []
+    held = [Waiter(scheduler, u, order, hold=True, user=u) for u in ("a", "b")]
+    _until(lambda: len(order) == 2)
+    third = Waiter(scheduler, "c", order, user="c")
+    _queued(scheduler, 1)
+    assert scheduler.stats()["running"] == 2 and sorted(order) == ["a", "b"]
+    held[0].release.set()
+    third.join()
+    assert order[-1] == "c"
+    held[1].release.set()
+    for w in held:
+        w.join()
+    stats = scheduler.stats()
+    assert (stats["admitted"], stats["queued"], stats["running"]) == (3, 1, 0)
+
+
+def test_per_user_cap_lets_other_users_through():
+    scheduler = QueryScheduler(max_concurrent=3, max_per_user=1, poll=0.01)
+    order = []
+    first = Waiter(scheduler, "a1", order, hold=True, user="a")
+    _until(lambda: order == ["a1"])
+    second = Waiter(scheduler, "a2", order, user="a")
+    _queued(scheduler, 1)
+    other = Waiter(scheduler, "b1", order, user="b")
+    other.join()
+    # b got a slot while a's second statement still waits for a's first
+    assert order == ["a1", "b1"]
+    assert scheduler.stats()["queued_now"] == 1
+    first.release.set()
+    second.join()
+    assert order == ["a1", "b1", "a2"]
+
+
+def test_interactive_runs_before_background():
+    scheduler = QueryScheduler(max_concurrent=1, max_per_user=5, poll=0.01)
+    order = []
+    holder = Waiter(scheduler, "holder", order, hold=True, user="x")
+    _until(lambda: order == ["holder"])
+    waiters = _queue_up(
+        scheduler,
+        order,
+        [
+            ("background", {"user": "a", "priority": "background"}),
+            ("default", {"user": "b", "priority": "default"}),
+            ("adhoc", {"user": "c", "priority": "adhoc"}),
+            ("interactive", {"user": "d", "priority": "interactive"}),
+        ],
+    )
+    assert scheduler.stats()["queued_by_priority"] == {
+        "interactive": 1,
+        "default": 1,
+        "adhoc": 1,
+        "background": 1,
+    }
+    holder.release.set()
+    for w in waiters:
+        w.join()
+    assert order == ["holder", "interactive", "default", "adhoc", "background"]
+
+
+def test_round_robin_across_users():
+    scheduler = QueryScheduler(max_concurrent=1, max_per_user=5, poll=0.01)
+    order = []
+    holder = Waiter(scheduler, "holder", order, hold=True, user="x")
+    _until(lambda: order == ["holder"])
+    # a queues three statements before b queues two; they alternate anyway
+    waiters = _queue_up(
+        scheduler,
+        order,
+        [("a1", {"user": "a"}), ("a2", {"user": "a"}), ("a3", {"user": "a"})]
+        + [("b1", {"user": "b"}), ("b2", {"user": "b"})],
+    )
+    holder.release.set()
+    for w in waiters:
+        w.join()
+    assert order == ["holder", "a1", "b1", "a2", "b2", "a3"]
+
+
+def test_queue_timeout():
+    scheduler = QueryScheduler(max_concurrent=1, queue_timeout=0.05, poll=0.01)
+    order = []
+    holder = Waiter(scheduler, "holder", order, hold=True, user="a")
+    _until(lambda: order == ["holder"])
+    started = time.monotonic()
+    with pytest.raises(QueueTimeout, match="1 running, 1 queued"):
+        scheduler.acquire("b")
+    assert time.monotonic() - started >= 0.05
+    stats = scheduler.stats()
+    assert (stats["timeouts"], stats["queued_now"]) == (1, 0)
+    holder.release.set()
+    holder.join()
+
+
+def test_cancel_session_while_queued():
+    scheduler = QueryScheduler(max_concurrent=1, poll=0.01)
+    order = []
+    holder = Waiter(scheduler, "holder", order, hold=True, user="a")
+    _until(lambda: order == ["holder"])
+    waiter = Waiter(scheduler, "queued", order, user="b", session="s1")
+    _queued(scheduler, 1)
+    assert scheduler.session_status("s1")["position"] == 1
+    assert scheduler.cancel_session("s1") == 1
+    waiter.join()
+    assert isinstance(waiter.error, QueryCancelled)
+    stats = scheduler.stats()
+    assert (stats["cancelled"], stats["queued_now"]) == (1, 0)
+    assert scheduler.session_status("s1") is None
+    holder.release.set()
+    holder.join()
+
+
+@pytest.fixture
+def warehouse(monkeypatch):
+    """common's scheduler and pool, on fake connections whose statements block."""
+    hold = threading.Event()
+
+    def connect():
+        connection = fake_sql.connect()
+        connection.hold = hold
+        return connection
+
+    scheduler = QueryScheduler(max_concurrent=2, poll=0.01, session_grace=0.01)
+    monkeypatch.setattr(common, "_scheduler", scheduler)
+    monkeypatch.setattr(common, "_pool", ConnectionPool(connect, max_size=2))
+    yield scheduler
+    hold.set()
+
+
+def _run_in_session(session, results):
+    def run():
+        common._tls.session = session
+        try:
+            results.append(common._fetch_arrow("select 1"))
+        except BaseException as e:
+            results.append(e)
+        finally:
+            common._tls.session = None
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+
+def _executing(n):
+    _until(lambda: sum(len(c.executed) for c in fake_sql.connections) == n)
+
+
+def test_cancel_session_cancels_running_statements(warehouse):
+    results = []
+    mine = _run_in_session("s1", results)
+    other = _run_in_session("s2", [])
+    _executing(2)
+    assert warehouse.cancel_session("s1") == 1
+    mine.join(5)
+    assert isinstance(results[0], QueryCancelled)
+    # Only the cancelled session's cursor was cancelled; the slot is free again
+    stats = warehouse.stats()
+    assert (stats["cancelled_running"], stats["running"]) == (1, 1)
+    assert other.is_alive()
+    # A cancelled statement is not a broken connection: it goes back to the pool
+    assert all(c.open for c in fake_sql.connections)
+
+
+def test_reaper_cancels_disconnected_sessions(warehouse, monkeypatch):
+    class FakeRuntime:
+        def is_active_session(self, session_id):
+            return session_id != "gone"
+
+    monkeypatch.setattr(Runtime, "exists", classmethod(lambda cls: True))
+    monkeypatch.setattr(Runtime, "instance", classmethod(lambda cls: FakeRuntime()))
+    gone, alive = [], []
+    threads = [_run_in_session("gone", gone), _run_in_session("alive", alive)]
+    _executing(2)
+    threads[0].join(5)
+    assert isinstance(gone[0], QueryCancelled)
+    assert threads[1].is_alive() and not alive
+    assert warehouse.stats()["cancelled_running"] == 1
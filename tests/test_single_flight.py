@@ -0,0 +1,149 @@
+import threading
+import time
+
+import pytest
+
+import common
+import fake_sql
+from common import QueryCancelled, QueryHandle, _single_flight
+
+
+def _follow(key, results, fn=lambda: "follower ran"):
+    thread = threading.Thread(
+        target=lambda: results.append(_single_flight(key, fn)), daemon=True
+    )
+    thread.start()
+    return thread
+
+
+def _wait_for_followers(key, n=1):
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        with common._flights_lock:
+            flight = common._flights.get(key)
+            if flight is not None and flight.followers >= n:
+                return
+        time.sleep(0.001)
+    raise AssertionError("follower did not join")
+
+
+def test_followers_share_the_leaders_result():
+    results = []
+    threads = []
+
+    def lead():
+        threads.append(_follow("k1", results))
+        _wait_for_followers("k1")
+        return object()
+
+    result, shared = _single_flight("k1", lead)
+    threads[0].join(5)
+    assert shared
+    assert results == [(result, True)]
+
+
+class _HookedLock:
+    """The flights lock, running a hook before the leader takes it after fn."""
+
+    def __init__(self, lock, hook):
+        self._lock = lock
+        self.hook = hook
+
+    def __enter__(self):
+        hook, self.hook = self.hook, None
+        if hook is not None:
+            hook()
+        return self._lock.__enter__()
+
+    def __exit__(self, *exc):
+        return self._lock.__exit__(*exc)
+
+
+def test_late_joiner_never_shares_an_unshared_result(monkeypatch):
+    results = []
+    threads = []
+
+    def late_follower():
+        # Leader's fn has returned; a caller arrives before the key is removed
+        threads.append(_follow("k2", results))
+        time.sleep(0.05)
+
+    hooked = _HookedLock(common._flights_lock, None)
+    monkeypatch.setattr(common, "_flights_lock", hooked)
+
+    def lead():
+        hooked.hook = late_follower
+        return object()
+
+    result, shared = _single_flight("k2", lead)
+    threads[0].join(5)
+    (follower_result, follower_shared) = results[0]
+    # Either both see the result as shared, or the late caller ran its own query;
+    # never an unshared table (converted with self_destruct) held by two callers
+    if follower_result is result:
+        assert shared and follower_shared
+    else:
+        assert follower_result == "follower ran" and not follower_shared
+
+
+def test_followers_get_the_leaders_error():
+    results = []
+    errors = []
+
+    def follow():
+        try:
+            _single_flight("k3", lambda: "unused")
+        except ValueError as e:
+            errors.append(e)
+
+    def lead():
+        thread = threading.Thread(target=follow, daemon=True)
+        thread.start()
+        results.append(thread)
+        _wait_for_followers("k3")
+        raise ValueError("bad query")
+
+    with pytest.raises(ValueError):
+        _single_flight("k3", lead)
+    results[0].join(5)
+    assert [str(e) for e in errors] == ["bad query"]
+
+
+def test_follower_takes_over_from_a_cancelled_leader():
+    results = []
+    threads = []
+    calls = []
+
+    def follower_fn():
+        calls.append("follower")
+        return "fresh"
+
+    def lead():
+        threads.append(_follow("k4", results, follower_fn))
+        _wait_for_followers("k4")
+        raise QueryCancelled("leader's session disconnected")
+
+    with pytest.raises(QueryCancelled):
+        _single_flight("k4", lead)
+    threads[0].join(5)
+    assert calls == ["follower"]
+    assert results == [("fresh", False)]
+
+
+def test_cancelled_cursor_errors_are_reported_as_cancellations():
+    handle = QueryHandle("page")
+    cursor = fake_sql.Connection().cursor()
+    common._tls.handle = handle
+    try:
+        with pytest.raises(QueryCancelled) as info:
+            with common._tracked(cursor):
+                handle.cancel()
+                raise fake_sql.DatabaseError("Query execution was canceled")
+        assert isinstance(info.value.__cause__, fake_sql.DatabaseError)
+        # Errors of statements nobody cancelled pass through unchanged
+        common._tls.handle = QueryHandle("page")
+        with pytest.raises(fake_sql.ServerOperationError):
+            with common._tracked(cursor):
+                raise fake_sql.ServerOperationError("syntax error")
+    finally:
+        common._tls.handle = None
@@ -0,0 +1,106 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from viz import density_bins, downsample_line, lttb
+
+
+# ---------- LTTB ----------
+@pytest.mark.parametrize(
+    "n, threshold", [(10, 3), (100, 7), (1_000, 100), (5_003, 999)]
+)
+def test_lttb_keeps_ends_and_returns_threshold_increasing_indices(n, threshold):
+    rng = np.random.default_rng(n)
+    x = np.sort(rng.uniform(0, 100, n))
+    y = rng.normal(size=n).cumsum()
+    idx = lttb(x, y, threshold)
+    assert len(idx) == threshold
+    assert idx[0] == 0 and idx[-1] == n - 1
+    assert np.all(np.diff(idx) > 0)
+
+
+@pytest.mark.parametrize("threshold", [50, 51, 1_000])
+def test_lttb_passes_short_lines_through(threshold):
+    x = np.arange(50)
+    assert np.array_equal(lttb(x, np.sin(x), threshold), np.arange(50))
+
+
+def test_lttb_keeps_spikes():
+    x = np.arange(1_000, dtype=float)
+    y = np.zeros(1_000)
+    y[[137, 600]] = [50.0, -80.0]
+    idx = lttb(x, y, 20)
+    assert {137, 600} <= set(idx.tolist())
+
+
+def test_downsample_line_caps_points_across_series():
+    n = 20_000
+    rng = np.random.default_rng(1)
+    df = pd.DataFrame(
+        {
+            "t": pd.date_range("2024-01-01", periods=n, freq="min"),
+            "a": rng.normal(size=n).cumsum(),
+            "b": rng.normal(size=n),
+        }
+    ).sample(frac=1.0, random_state=1)
+    df.loc[df.index[:100], "b"] = np.nan
+    out = downsample_line(df, "t", ["a", "b"], max_points=500)
+    assert len(out) <= 500
+    assert out["t"].is_monotonic_increasing
+    assert out["t"].iloc[0] == df["t"].min() and out["t"].iloc[-1] == df["t"].max()
+    small = df.head(100)
+    assert len(downsample_line(small, "t", ["a"], max_points=500)) == 100
+
+
+# ---------- Density ----------
+def _points(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame(
+        {"x": rng.normal(size=n), "y": rng.lognormal(size=n), "w": rng.uniform(size=n)}
+    )
+
+
+@pytest.mark.parametrize("max_points", [10, 100, 2_500, 5_000])
+def test_density_bins_cap_and_account_for_every_row(max_points):
+    df = _points(50_000)
+    out, left_out = density_bins(df, "x", "y", max_points=max_points)
+    assert 0 < len(out) <= max_points
+    assert out["count"].sum() + left_out == len(df)
+    # Only the tails beyond the range quantile are left out
+    assert 0 < left_out < 0.01 * len(df)
+
+
+def test_density_bins_weighted():
+    df = _points(20_000, seed=1)
+    out, left_out = density_bins(df, "x", "y", weight="w", max_points=400)
+    assert len(out) <= 400 and list(out.columns) == ["x", "y", "w"]
+    assert out["w"].sum() + left_out == pytest.approx(df["w"].sum())
+
+
+def test_density_bins_drop_nan_and_inf_rows():
+    df = _points(10_000, seed=2)
+    df.loc[:99, "x"] = np.nan
+    df.loc[100:149, "y"] = np.inf
+    df.loc[150:159, "x"] = -np.inf
+    # Text in a numeric column is coerced to NaN
+    df["y"] = df["y"].astype(object)
+    df.loc[160:169, "y"] = "n/a"
+    out, left_out = density_bins(df, "x", "y", max_points=100)
+    assert len(out) <= 100 and np.isfinite(out[["x", "y"]].to_numpy()).all()
+    assert out["count"].sum() + left_out == len(df)
+    assert left_out >= 170
+
+
+def test_density_bins_without_finite_points_or_spread():
+    nothing = pd.DataFrame({"x": [np.nan] * 20, "y": np.arange(20.0)})
+    out, left_out = density_bins(nothing, "x", "y", max_points=4)
+    assert out.empty and left_out == 20
+    same = pd.DataFrame({"x": [1.0] * 20, "y": [2.0] * 20})
+    out, left_out = density_bins(same, "x", "y", max_points=4)
+    assert (len(out), out["count"].sum(), left_out) == (1, 20, 0)
+
+
+def test_density_bins_pass_small_frames_through():
+    df = _points(50)
+    out, left_out = density_bins(df, "x", "y", max_points=100)
+    assert len(out) == 50 and (out["count"] == 1).all() and left_out == 0
@@ -0,0 +1,141 @@
+import threading
+import time
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo
+
+import pytest
+
+import common
+import fake_sql
+import warmup
+from common import ConnectionPool, QueryScheduler
+from warmup import Warmer
+
+# 2024-06-07 is a Friday, 2024-06-08 a Saturday
+FRIDAY = datetime(2024, 6, 7)
+
+
+def _at(hhmm, day=FRIDAY):
+    h, m = map(int, hhmm.split(":"))
+    return day.replace(hour=h, minute=m)
+
+
+# ---------- Business hours ----------
+@pytest.mark.parametrize(
+    "hhmm, inside",
+    [
+        ("07:59", False),
+        ("08:00", True),
+        ("12:30", True),
+        ("17:59", True),
+        ("18:00", False),
+        ("23:59", False),
+        ("00:00", False),
+    ],
+)
+def test_business_hours_edges(hhmm, inside):
+    warmer = Warmer(hours="08:00-18:00", days="mon,tue,wed,thu,fri")
+    assert warmer.in_business_hours(_at(hhmm)) is inside
+
+
+def test_weekends_are_outside_business_hours():
+    warmer = Warmer(hours="00:00-24:00", days="Monday, Tue,wed,thu,fri")
+    assert warmer.in_business_hours(_at("12:00"))
+    assert not warmer.in_business_hours(_at("12:00", datetime(2024, 6, 8)))
+    assert not warmer.in_business_hours(_at("12:00", datetime(2024, 6, 9)))
+    weekend = Warmer(hours="10:00-14:00", days="sat,sun")
+    assert weekend.in_business_hours(_at("10:00", datetime(2024, 6, 8)))
+    assert not weekend.in_business_hours(_at("10:00"))
+
+
+def test_aware_times_are_read_in_the_warmer_timezone():
+    warmer = Warmer(hours="08:00-18:00", days="mon,tue,wed,thu,fri", tz="Europe/Berlin")
+    # 06:30 UTC is 08:30 in Berlin (summer time); 16:30 UTC is 18:30
+    assert warmer.in_business_hours(_at("06:30").replace(tzinfo=timezone.utc))
+    assert not warmer.in_business_hours(_at("16:30").replace(tzinfo=timezone.utc))
+    # Friday 23:30 in New York is already Saturday in Berlin
+    new_york = _at("23:30").replace(tzinfo=ZoneInfo("America/New_York"))
+    assert not Warmer(hours="00:00-24:00", tz="Europe/Berlin").in_business_hours(
+        new_york
+    )
+    # Naive times are taken as the warmer's own local time
+    assert warmer.in_business_hours(_at("08:30"))
+    assert not warmer.in_business_hours(_at("06:30"))
+
+
+# ---------- Warehouse state ----------
+@pytest.mark.parametrize(
+    "warehouse_state, probe_age, state",
+    [
+        ("STARTING", None, "warming"),
+        ("STOPPING", 1, "warming"),
+        ("RUNNING", None, "warm"),
+        ("RUNNING", 10_000, "warm"),
+        ("STOPPED", 1, "cold"),
+        ("DELETED", None, "cold"),
+        # Without the API, a recent probe is all there is to go on
+        (None, 1, "warm"),
+        (None, 10_000, "cold"),
+        (None, None, "cold"),
+    ],
+)
+def test_status_maps_warehouse_state(monkeypatch, warehouse_state, probe_age, state):
+    monkeypatch.setattr(warmup, "WAREHOUSE_AUTO_STOP", 600)
+    warmer = Warmer()
+    warmer.warehouse_state = warehouse_state
+    if probe_age is not None:
+        warmer.last_probe_at = time.time() - probe_age
+    assert warmer.status()["state"] == state
+
+
+def test_status_is_warming_while_warming_up():
+    warmer = Warmer()
+    warmer.warehouse_state = "RUNNING"
+    warmer.warming = True
+    assert warmer.status()["state"] == "warming"
+
+
+# ---------- Warm-up ----------
+@pytest.fixture
+def warehouse(monkeypatch):
+    """common's scheduler and pool on fake connections; connects record the slots in use."""
+    scheduler = QueryScheduler(max_concurrent=2, max_per_user=2, poll=0.01)
+    connects = []
+
+    def connect():
+        connects.append(
+            (scheduler.stats()["running"], getattr(common._tls, "priority", None))
+        )
+        return fake_sql.connect()
+
+    monkeypatch.setattr(common, "_scheduler", scheduler)
+    monkeypatch.setattr(common, "_pool", ConnectionPool(connect, max_size=2))
+    monkeypatch.setattr(warmup, "sqlQuery", lambda query: None)
+    monkeypatch.delenv("CATALOG_NAME", raising=False)
+    scheduler.connects = connects
+    return scheduler
+
+
+def test_warm_up_takes_scheduler_slots(warehouse):
+    warmer = Warmer(connections=2)
+    warmer.warm_up()
+    # Each connection opened while holding its own background slot
+    assert warehouse.connects == [(1, "background"), (2, "background")]
+    stats = warehouse.stats()
+    assert (stats["admitted"], stats["running"]) == (2, 0)
+    assert (warmer.probes, warmer.warming) == (1, False)
+
+
+def test_warm_up_waits_for_a_free_slot(warehouse):
+    ticket = warehouse.acquire("someone")
+    warmer = Warmer(connections=2)
+    thread = threading.Thread(target=warmer.warm_up, daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 5
+    while warehouse.stats()["queued_by_priority"]["background"] != 1:
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+    assert warmer.status()["state"] == "warming"
+    warehouse.release(ticket)
+    thread.join(5)
+    assert not thread.is_alive() and warmer.probes == 1